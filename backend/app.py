@@ -1,93 +1,242 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_app_context
 from flask_cors import CORS
 import mysql.connector
-import bcrypt
 import os
-import random
-import sys
+import time
 import logging
-from monsters import get_monster
-from battle import simulate_battle
-from items import get_item
+from monsters import get_monster, pick_monster, registry as monster_registry
+from battle import cached_simulate_battle, battle_cache, LOG_DETAIL_LEVELS
+from items import get_item, CATALOG
+from stat_bonuses import apply_bonus_delta
+from inventory import grant_items, sell_items
+from regen import regen_hp, CURRENT_HP_SQL, HP_ELAPSED_SQL
+from battle_queue import queue_from_env, BattleWorkerPool, QueueFullError
+from passwords import hash_password, verify_password, needs_rehash, PasswordQueueFullError
+from history import record_battle, record_battles, list_battles, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from sessions import issue_token, read_token, refresh_token, session_claims, session_from_claims, InvalidTokenError
+from logging_setup import configure_logging
+from db import pool_from_env
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from sql_trace import QueryTrace, tracing_enabled, TRACE_MODE, TRACE_HEADER
+from cache import CachedValue
+from grind import fight_series, GRIND_MAX_BATTLES
+from catalog import (ITEMS_DOCUMENT, SHOP_DOCUMENT, SHOP_LIST_DOCUMENT, SHOP_PRICES, CATALOG_MAX_AGE,
+                     IMMUTABLE_MAX_AGE, monsters_document)
 
 app = Flask(__name__)
 CORS(app)
 
-# Configure logging to stderr
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[logging.StreamHandler(sys.stderr)]
-)
-logger = logging.getLogger(__name__)
+# Queue-based JSON logging to stderr (levels from LOG_LEVEL / LOG_LEVELS)
+configure_logging()
+access_logger = logging.getLogger('access')
+battle_logger = logging.getLogger('battle')
+sql_logger = logging.getLogger('sql')
+PROBE_PATHS = ('/healthz', '/livez', '/metrics')
+
+# Shared MySQL connection pool (sized by DB_POOL_SIZE)
+db_pool = pool_from_env()
+
+# Metrics served at /metrics
+http_requests = REGISTRY.counter(
+    'knightclub_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+http_latency = REGISTRY.histogram(
+    'knightclub_http_request_duration_seconds', 'HTTP request latency by route', ('route', 'method'))
+db_queries = REGISTRY.counter('knightclub_db_queries_total', 'SQL statements executed')
+db_query_latency = REGISTRY.histogram('knightclub_db_query_duration_seconds', 'SQL statement latency')
+db_queries_per_request = REGISTRY.histogram(
+    'knightclub_db_queries_per_request', 'SQL statements per request (or battle job) by route', ('route',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34))
+db_time_per_request = REGISTRY.histogram(
+    'knightclub_db_time_per_request_seconds', 'Time spent in SQL per request (or battle job) by route', ('route',))
+battles_total = REGISTRY.counter(
+    'knightclub_battles_total', 'Battles fought by difficulty, monster and result', ('difficulty', 'monster', 'result'))
+battle_latency = REGISTRY.histogram(
+    'knightclub_battle_duration_seconds', 'Battle job run time (simulation and DB writes) by difficulty', ('difficulty',))
+loot_gold = REGISTRY.counter('knightclub_loot_gold_total', 'Gold awarded by battles')
+loot_items_total = REGISTRY.counter('knightclub_loot_items_total', 'Items awarded by battles, by tier', ('tier',))
+
+def record_query(statement, duration, rows):
+    """Pool query listener: global SQL metrics plus per-request totals in g."""
+    db_queries.inc()
+    db_query_latency.observe(duration)
+    if has_app_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + duration
+
+db_pool.query_listeners.append(record_query)
+
+def trace_query(statement, duration, rows):
+    """Pool query listener: add the statement to the current request's SQL trace, if any."""
+    if has_app_context():
+        trace = g.get('sql_trace')
+        if trace is not None:
+            trace.record(statement, duration, rows)
+
+def report_sql_trace(label):
+    """Log the current request's or job's SQL trace; returns its summary (or None if untraced)."""
+    trace = g.get('sql_trace')
+    if trace is None:
+        return None
+    summary = trace.summary()
+    level = logging.WARNING if summary['repeated'] else logging.INFO
+    sql_logger.log(level, '%s: %d queries%s', label, summary['queries'],
+                   ' (repeated statements, possible N+1)' if summary['repeated'] else '',
+                   extra={'fields': trace.log_fields(summary)})
+    return summary
+
+# Opt-in SQL tracing (SQL_TRACE=header|all); no listener at all when off
+if TRACE_MODE != 'off':
+    db_pool.query_listeners.append(trace_query)
+
+def observe_db_usage(route):
+    """Record the SQL count and time accumulated by the current request or job."""
+    db_queries_per_request.observe(g.get('db_queries', 0), route)
+    db_time_per_request.observe(g.get('db_time', 0.0), route)
+
+@REGISTRY.collector
+def collect_runtime_stats():
+    """Pool, battle queue and battle cache state, read at scrape time."""
+    for key, value in db_pool.stats().items():
+        if key in ('size', 'open', 'in_use', 'idle', 'waiting', 'peak_in_use'):
+            yield f'knightclub_db_pool_{key}', 'gauge', f'Connection pool {key.replace("_", " ")}', value
+        else:
+            yield f'knightclub_db_pool_{key}_total', 'counter', f'Connection pool {key.replace("_", " ")}', value
+    yield 'knightclub_battle_queue_depth', 'gauge', 'Battles waiting for a worker', battle_jobs.depth()
+    cache = battle_cache.stats()
+    yield 'knightclub_battle_cache_entries', 'gauge', 'Cached battle outcomes', cache['size']
+    yield 'knightclub_battle_cache_hits_total', 'counter', 'Battle cache hits', cache['hits']
+    yield 'knightclub_battle_cache_misses_total', 'counter', 'Battle cache misses', cache['misses']
 
 def get_db_connection():
-    return mysql.connector.connect(
-        host=os.getenv('DB_HOST', 'mysql'),
-        port=int(os.getenv('DB_PORT', '3306')),
-        database=os.getenv('DB_NAME', 'knightclub'),
-        user=os.getenv('DB_USER', 'app'),
-        password=os.getenv('DB_PASSWORD', 'password')
-    )
+    """Check out a pooled connection for the current request."""
+    conn = db_pool.get_connection()
+    g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Return any connection a handler or battle job forgot to close (e.g. early returns)."""
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+def bearer_token():
+    """The session token from the Authorization header, or None."""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip() or None
+    return None
+
+@app.before_request
+def load_session():
+    """Verify the request's session token, if it sent one; a bad or expired token is a 401."""
+    g.request_started = time.perf_counter()
+    g.session = None
+    if tracing_enabled(request.headers.get(TRACE_HEADER)):
+        g.sql_trace = QueryTrace()
+    token = bearer_token()
+    if token:
+        try:
+            g.session = read_token(token)
+        except InvalidTokenError as e:
+            return jsonify({'error': str(e)}), 401
 
-def verify_knight_ownership(cursor, knight_id, user_id):
-    """Verify that a knight belongs to a specific user."""
+@app.after_request
+def finish_request(response):
+    """Request metrics, and one access line with its timing (probes only at DEBUG)."""
+    started = g.get('request_started')
+    duration = time.perf_counter() - started if started else 0.0
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.inc(route, request.method, response.status_code)
+    http_latency.observe(duration, route, request.method)
+    observe_db_usage(route)
+    
+    summary = report_sql_trace(f'{request.method} {route}')
+    if summary is not None:
+        response.headers[TRACE_HEADER] = g.sql_trace.header_value(summary)
+    
+    session = g.get('session')
+    level = logging.DEBUG if request.path in PROBE_PATHS else logging.INFO
+    access_logger.log(level, '%s %s %s', request.method, request.path, response.status_code, extra={'fields': {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'db_queries': g.get('db_queries', 0),
+        'db_ms': round(g.get('db_time', 0.0) * 1000, 2),
+        'user_id': session.user_id if session else None,
+    }})
+    return response
+
+def verify_knight_ownership(cursor, knight_id, user_id, session=None):
+    """
+    Verify that a knight belongs to a specific user.
+    With a session token this is answered from its claims; the knights table is
+    only queried without one, or for a knight the token doesn't list yet.
+    """
+    if session is not None:
+        if session.user_id != user_id:
+            return False
+        if knight_id in session.knight_ids:
+            return True
     cursor.execute("SELECT user_id FROM knights WHERE id = %s", (knight_id,))
     knight = cursor.fetchone()
     if not knight:
         return False
     return knight['user_id'] == user_id
 
-def add_item_to_inventory(cursor, knight_id, item_id, quantity=1):
-    """Add item to knight's inventory. Stacks if stackable, creates new row if not."""
-    item_def = get_item(item_id)
-    if not item_def:
-        return False
-    
-    if item_def['stackable']:
-        # Try to add to existing stack (not equipped)
-        cursor.execute("""
-            SELECT id, quantity FROM inventory 
-            WHERE knight_id = %s AND item_id = %s AND is_equipped = FALSE
-            LIMIT 1
-        """, (knight_id, item_id))
-        
-        existing = cursor.fetchone()
-        if existing:
-            # Update existing stack
-            cursor.execute("""
-                UPDATE inventory SET quantity = quantity + %s 
-                WHERE id = %s
-            """, (quantity, existing['id']))
-        else:
-            # Create new stack
-            cursor.execute("""
-                INSERT INTO inventory (knight_id, item_id, quantity) 
-                VALUES (%s, %s, %s)
-            """, (knight_id, item_id, quantity))
-    else:
-        # Non-stackable: create separate rows
-        for _ in range(quantity):
-            cursor.execute("""
-                INSERT INTO inventory (knight_id, item_id, quantity) 
-                VALUES (%s, %s, 1)
-            """, (knight_id, item_id))
+def living_knight_ids(cursor, user_id):
+    """Ids of a user's living knights (the ownership claims of a session token)."""
+    cursor.execute("SELECT id FROM knights WHERE user_id = %s AND is_alive = TRUE", (user_id,))
+    return [row['id'] for row in cursor.fetchall()]
+
+def load_knight_snapshot(cursor, knight_id):
+    """
+    Load a knight and its whole inventory in a single query.
+    Returns (knight, inventory_rows), or (None, []) if the knight doesn't exist.
+    """
+    cursor.execute(f"""
+        SELECT k.id, k.user_id, k.name, k.class, k.level, k.exp, {CURRENT_HP_SQL} AS current_hp, k.max_hp, k.is_alive, k.created_at,
+               i.id AS inventory_id, i.item_id, i.quantity, i.is_equipped
+        FROM knights k
+        LEFT JOIN inventory i ON i.knight_id = k.id
+        WHERE k.id = %s
+        ORDER BY i.id
+    """, (knight_id,))
+    rows = cursor.fetchall()
+    if not rows:
+        return None, []
     
-    return True
+    first = rows[0]
+    knight = {
+        'id': first['id'],
+        'user_id': first['user_id'],
+        'name': first['name'],
+        'class': first['class'],
+        'level': first['level'],
+        'exp': first['exp'],
+        'current_hp': first['current_hp'],
+        'max_hp': first['max_hp'],
+        'is_alive': first['is_alive'],
+        'created_at': first['created_at']
+    }
+    items = [
+        {'id': row['inventory_id'], 'item_id': row['item_id'],
+         'quantity': row['quantity'], 'is_equipped': row['is_equipped']}
+        for row in rows if row['inventory_id'] is not None
+    ]
+    return knight, items
 
-def generate_loot(monster):
-    """Generate loot drops from monster."""
-    loot = {
-        'gold': random.randint(monster.gold_drop[0], monster.gold_drop[1]),
-        'items': []
+def knight_snapshot_response(knight, items):
+    """Knight detail payload, with the equipment list derived from the inventory rows."""
+    return {
+        **knight,
+        'equipment': CATALOG.equipment_list([item for item in items if item['is_equipped']]),
+        'inventory': CATALOG.inventory_list(items)
     }
-    
-    # Roll for each item in loot table
-    for item_id, drop_chance in monster.loot_table:
-        if random.random() < drop_chance:
-            loot['items'].append(item_id)
-    
-    return loot
+
+def generate_loot(monster):
+    """Generate loot drops from monster (one independent roll per loot table entry)."""
+    return monster.loot.roll()
 
 @app.route('/healthz')
 def healthz():
@@ -97,27 +246,59 @@ def healthz():
 def livez():
     return 'OK', 200
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the backend's metrics."""
+    return REGISTRY.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    """Connection pool usage and saturation counters."""
+    return jsonify(db_pool.stats()), 200
+
+# Leaderboard size and how long a computed leaderboard is served
+LEADERBOARD_SIZE = 10
+LEADERBOARD_TTL = float(os.getenv('LEADERBOARD_TTL', '5'))
+
+def load_leaderboard():
+    """Top living knights by level and exp (served by idx_knights_leaderboard)."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    cursor.execute("""
+        SELECT k.name, k.class, k.level, k.exp, u.username
+        FROM knights k
+        JOIN users u ON k.user_id = u.id
+        WHERE k.is_alive = TRUE
+        ORDER BY k.level DESC, k.exp DESC
+        LIMIT %s
+    """, (LEADERBOARD_SIZE,))
+    
+    knights = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return knights
+
+leaderboard_cache = CachedValue(load_leaderboard, ttl=LEADERBOARD_TTL)
+
+def invalidate_leaderboard(level, exp):
+    """
+    Drop the cached leaderboard if a knight at (level, exp) is, or could now be, on it.
+    Call with the knight's old standing when it dies and its new one when it gains XP.
+    """
+    board = leaderboard_cache.peek()
+    if board is None or len(board) < LEADERBOARD_SIZE:
+        leaderboard_cache.invalidate()
+        return
+    lowest = board[-1]
+    if (level, exp) >= (lowest['level'], lowest['exp']):
+        leaderboard_cache.invalidate()
+
 @app.route('/api/leaderboard', methods=['GET'])
 def leaderboard():
     """Get top 10 living knights by level and exp"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT k.name, k.class, k.level, k.exp, u.username
-            FROM knights k
-            JOIN users u ON k.user_id = u.id
-            WHERE k.is_alive = TRUE
-            ORDER BY k.level DESC, k.exp DESC
-            LIMIT 10
-        """)
-        
-        knights = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return jsonify(knights), 200
+        return jsonify(leaderboard_cache.get()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -130,7 +311,10 @@ def signup():
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
     
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    try:
+        password_hash = hash_password(password)
+    except PasswordQueueFullError:
+        return jsonify({'error': 'Server busy, please try again'}), 503
     
     try:
         conn = get_db_connection()
@@ -169,10 +353,50 @@ def login():
         cursor.close()
         conn.close()
         
-        if result and bcrypt.checkpw(password.encode('utf-8'), bytes(result[1])):
-            return jsonify({'message': 'Login successful', 'user_id': result[0]}), 200
-        else:
+        if not result or not verify_password(password, result[1]):
             return jsonify({'error': 'Invalid username or password'}), 401
+        
+        # Upgrade the stored hash if the bcrypt work factor has changed (best effort)
+        new_hash = None
+        if needs_rehash(result[1]):
+            try:
+                new_hash = hash_password(password)
+            except PasswordQueueFullError:
+                pass
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        if new_hash:
+            cursor.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (new_hash, result[0])
+            )
+            conn.commit()
+        
+        # The session token carries the user's living knights for ownership checks
+        token = issue_token(result[0], living_knight_ids(cursor, result[0]))
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Login successful', 'user_id': result[0], 'token': token}), 200
+    except PasswordQueueFullError:
+        return jsonify({'error': 'Server busy, please try again'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/session/refresh', methods=['POST'])
+def refresh_session():
+    """Reissue the caller's session token with their current living knights."""
+    if g.session is None:
+        return jsonify({'error': 'Session token required'}), 401
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        knight_ids = living_knight_ids(cursor, g.session.user_id)
+        cursor.close()
+        conn.close()
+        return jsonify({'token': issue_token(g.session.user_id, knight_ids)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -187,7 +411,7 @@ def get_knights():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         cursor.execute(
-            "SELECT id, name, class, level, exp, current_hp, max_hp, is_alive, created_at FROM knights WHERE user_id = %s ORDER BY is_alive DESC, created_at DESC",
+            f"SELECT k.id, k.name, k.class, k.level, k.exp, {CURRENT_HP_SQL} AS current_hp, k.max_hp, k.is_alive, k.created_at FROM knights k WHERE k.user_id = %s ORDER BY k.is_alive DESC, k.created_at DESC",
             (user_id,)
         )
         knights = cursor.fetchall()
@@ -202,71 +426,61 @@ def get_knight(knight_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id, user_id, name, class, level, exp, current_hp, max_hp, is_alive, created_at FROM knights WHERE id = %s",
-            (knight_id,)
-        )
-        knight = cursor.fetchone()
+        knight, items = load_knight_snapshot(cursor, knight_id)
+        cursor.close()
+        conn.close()
         
         if not knight:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Knight not found'}), 404
         
-        # Get equipped items
-        cursor.execute("""
-            SELECT i.id, i.item_id, i.quantity
-            FROM inventory i
-            WHERE i.knight_id = %s AND i.is_equipped = TRUE
-        """, (knight_id,))
+        return jsonify({'knight': knight_snapshot_response(knight, items)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/knights/<int:knight_id>/battles', methods=['GET'])
+def get_knight_battles(knight_id):
+    """
+    A knight's battle history, newest first.
+    Query params: limit (max 100), cursor (next_cursor from the previous page),
+    log_detail (none / events / summary / full; default none).
+    """
+    log_detail = request.args.get('log_detail', 'none')
+    cursor_value = request.args.get('cursor')
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    if log_detail not in LOG_DETAIL_LEVELS:
+        return jsonify({'error': f'log_detail must be one of {", ".join(LOG_DETAIL_LEVELS)}'}), 400
+    
+    try:
+        after = decode_cursor(cursor_value) if cursor_value else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         
-        equipped_items = cursor.fetchall()
+        cursor.execute("SELECT name FROM knights WHERE id = %s", (knight_id,))
+        knight = cursor.fetchone()
         
-        # Get ALL inventory items
-        cursor.execute("""
-            SELECT i.id, i.item_id, i.quantity, i.is_equipped
-            FROM inventory i
-            WHERE i.knight_id = %s
-        """, (knight_id,))
+        if not knight:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Knight not found'}), 404
         
-        all_items = cursor.fetchall()
+        battles, next_cursor = list_battles(
+            cursor, knight_id, knight['name'], limit=limit, after=after, log_detail=log_detail)
         cursor.close()
         conn.close()
         
-        # Enrich equipped items with definitions
-        equipment = []
-        for item in equipped_items:
-            item_def = get_item(item['item_id'])
-            if item_def:
-                equipment.append({
-                    'inventory_id': item['id'],
-                    'item_id': item['item_id'],
-                    'name': item_def['name'],
-                    'slot': item_def.get('slot'),
-                    'stats': item_def.get('stats', {}),
-                    'type': item_def['type']
-                })
-        
-        # Enrich all inventory items
-        inventory = []
-        for item in all_items:
-            item_def = get_item(item['item_id'])
-            if item_def:
-                inventory.append({
-                    'inventory_id': item['id'],
-                    'item_id': item['item_id'],
-                    'name': item_def['name'],
-                    'slot': item_def.get('slot'),
-                    'stats': item_def.get('stats', {}),
-                    'type': item_def['type'],
-                    'quantity': item['quantity'],
-                    'is_equipped': item['is_equipped']
-                })
-        
-        knight['equipment'] = equipment
-        knight['inventory'] = inventory
-        
-        return jsonify({'knight': knight}), 200
+        return jsonify({'battles': battles, 'next_cursor': next_cursor}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -283,13 +497,19 @@ def create_knight():
     if knight_class not in ['knight', 'paladin', 'lancer', 'templar']:
         return jsonify({'error': 'Invalid class'}), 400
     
+    # The reply carries a token for this user, so the caller must already hold one
+    if g.session is None:
+        return jsonify({'error': 'Session token required'}), 401
+    if g.session.user_id != user_id:
+        return jsonify({'error': 'Unauthorized: cannot create knights for another user'}), 403
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Check if all existing LIVING knights are level 10
         cursor.execute(
-            "SELECT level FROM knights WHERE user_id = %s AND is_alive = TRUE",
+            "SELECT id, level FROM knights WHERE user_id = %s AND is_alive = TRUE",
             (user_id,)
         )
         living_knights = cursor.fetchall()
@@ -308,7 +528,11 @@ def create_knight():
         knight_id = cursor.lastrowid
         cursor.close()
         conn.close()
-        return jsonify({'message': 'Knight created', 'knight_id': knight_id}), 201
+        invalidate_leaderboard(1, 0)
+        
+        # New session token that includes the new knight
+        token = refresh_token(g.session, added=[knight_id])
+        return jsonify({'message': 'Knight created', 'knight_id': knight_id, 'token': token}), 201
     except mysql.connector.IntegrityError:
         return jsonify({'error': 'Knight name already exists for this user'}), 409
     except Exception as e:
@@ -328,20 +552,17 @@ def equip_item(knight_id):
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
+        # Load the knight and its inventory once; every check below works on it
+        knight, items = load_knight_snapshot(cursor, knight_id)
+        
         # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        if not knight or knight['user_id'] != user_id or (g.session and g.session.user_id != user_id):
             cursor.close()
             conn.close()
             return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
         
         # Get item from knight's inventory
-        cursor.execute("""
-            SELECT i.id, i.item_id, i.is_equipped
-            FROM inventory i
-            WHERE i.id = %s AND i.knight_id = %s
-        """, (inventory_id, knight_id))
-        
-        inventory_item = cursor.fetchone()
+        inventory_item = next((item for item in items if str(item['id']) == str(inventory_id)), None)
         
         if not inventory_item:
             cursor.close()
@@ -365,99 +586,42 @@ def equip_item(knight_id):
             conn.close()
             return jsonify({'error': 'Cannot equip stackable items'}), 400
         
-        # Check if slot already has an item equipped
+        # Unequip whatever currently occupies the same slot
+        unequipped_item_ids = []
         slot = item_def.get('slot')
         if slot:
-            # Get all equipped items for this knight to check their slots
-            cursor.execute("""
-                SELECT i.id, i.item_id
-                FROM inventory i
-                WHERE i.knight_id = %s AND i.is_equipped = TRUE
-            """, (knight_id,))
-            
-            equipped_items = cursor.fetchall()
-            
-            # Check if any equipped item uses the same slot
-            for equipped in equipped_items:
+            for equipped in items:
+                if not equipped['is_equipped']:
+                    continue
                 equipped_def = get_item(equipped['item_id'])
                 if equipped_def and equipped_def.get('slot') == slot:
-                    # Unequip the existing item in this slot
                     cursor.execute("""
                         UPDATE inventory
                         SET is_equipped = FALSE
-                        WHERE id = %s
+                        WHERE id = %s AND is_equipped = TRUE
                     """, (equipped['id'],))
+                    if cursor.rowcount:
+                        unequipped_item_ids.append(equipped['item_id'])
+                    equipped['is_equipped'] = 0
         
         # Equip the new item
         cursor.execute("""
             UPDATE inventory
             SET is_equipped = TRUE
-            WHERE id = %s
-        """, (inventory_id,))
+            WHERE id = %s AND is_equipped = FALSE
+        """, (inventory_item['id'],))
+        equipped_item_ids = [inventory_item['item_id']] if cursor.rowcount else []
+        inventory_item['is_equipped'] = 1
         
-        conn.commit()
+        # Keep the knight's stored stat bonuses in step (same transaction)
+        apply_bonus_delta(cursor, knight_id, added=equipped_item_ids, removed=unequipped_item_ids)
         
-        # Return updated knight data
-        cursor.execute(
-            "SELECT id, user_id, name, class, level, exp, current_hp, max_hp, is_alive, created_at FROM knights WHERE id = %s",
-            (knight_id,)
-        )
-        knight = cursor.fetchone()
-        
-        # Get equipped items
-        cursor.execute("""
-            SELECT i.id, i.item_id, i.quantity
-            FROM inventory i
-            WHERE i.knight_id = %s AND i.is_equipped = TRUE
-        """, (knight_id,))
-        
-        equipped_items = cursor.fetchall()
-        
-        # Get ALL inventory items
-        cursor.execute("""
-            SELECT i.id, i.item_id, i.quantity, i.is_equipped
-            FROM inventory i
-            WHERE i.knight_id = %s
-        """, (knight_id,))
-        
-        all_items = cursor.fetchall()
+        conn.commit()
         cursor.close()
         conn.close()
         
-        # Enrich equipped items with definitions
-        equipment = []
-        for item in equipped_items:
-            item_def = get_item(item['item_id'])
-            if item_def:
-                equipment.append({
-                    'inventory_id': item['id'],
-                    'item_id': item['item_id'],
-                    'name': item_def['name'],
-                    'slot': item_def.get('slot'),
-                    'stats': item_def.get('stats', {}),
-                    'type': item_def['type']
-                })
-        
-        # Enrich all inventory items
-        inventory = []
-        for item in all_items:
-            item_def = get_item(item['item_id'])
-            if item_def:
-                inventory.append({
-                    'inventory_id': item['id'],
-                    'item_id': item['item_id'],
-                    'name': item_def['name'],
-                    'slot': item_def.get('slot'),
-                    'stats': item_def.get('stats', {}),
-                    'type': item_def['type'],
-                    'quantity': item['quantity'],
-                    'is_equipped': item['is_equipped']
-                })
-        
-        knight['equipment'] = equipment
-        knight['inventory'] = inventory
-        
-        return jsonify({'knight': knight}), 200
+        # Return updated knight data, derived from the snapshot we already hold
+        return jsonify({'knight': knight_snapshot_response(knight, items)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -477,14 +641,14 @@ def unequip_item(knight_id):
         cursor = conn.cursor(dictionary=True)
         
         # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        if not verify_knight_ownership(cursor, knight_id, user_id, g.session):
             cursor.close()
             conn.close()
             return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
         
         # Verify item is equipped to this knight
         cursor.execute("""
-            SELECT id FROM inventory
+            SELECT id, item_id FROM inventory
             WHERE id = %s AND knight_id = %s AND is_equipped = TRUE
         """, (inventory_id, knight_id))
         
@@ -499,9 +663,13 @@ def unequip_item(knight_id):
         cursor.execute("""
             UPDATE inventory
             SET is_equipped = FALSE
-            WHERE id = %s
+            WHERE id = %s AND is_equipped = TRUE
         """, (inventory_id,))
         
+        # Keep the knight's stored stat bonuses in step (same transaction)
+        if cursor.rowcount:
+            apply_bonus_delta(cursor, knight_id, removed=[item['item_id']])
+        
         conn.commit()
         cursor.close()
         conn.close()
@@ -513,75 +681,46 @@ def unequip_item(knight_id):
 
 @app.route('/api/knights/<int:knight_id>/sell-duplicates', methods=['POST'])
 def sell_duplicate_equipment(knight_id):
-    """Sell all unequipped equipment items for gold."""
+    """
+    Sell unequipped equipment items for gold.
+    Optional filters: tier (e.g. 'wooden'), slot (e.g. 'helm') and inventory_ids.
+    """
     data = request.json
     user_id = data.get('user_id')
+    tier = data.get('tier')
+    slot = data.get('slot')
+    inventory_ids = data.get('inventory_ids')
     
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     
+    if tier is not None and tier not in CATALOG.by_tier:
+        return jsonify({'error': 'Invalid tier'}), 400
+    
+    if slot is not None and slot not in CATALOG.by_slot:
+        return jsonify({'error': 'Invalid slot'}), 400
+    
+    if inventory_ids is not None and (
+            not isinstance(inventory_ids, list)
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in inventory_ids)):
+        return jsonify({'error': 'inventory_ids must be a list of integers'}), 400
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        if not verify_knight_ownership(cursor, knight_id, user_id, g.session):
             cursor.close()
             conn.close()
             return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
         
-        # Verify knight exists and get user_id
-        cursor.execute("SELECT user_id FROM knights WHERE id = %s", (knight_id,))
-        knight = cursor.fetchone()
-        
-        if not knight:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Knight not found'}), 404
-        
-        user_id = knight['user_id']
-        
-        # Get all unequipped equipment items
-        cursor.execute("""
-            SELECT id, item_id, quantity
-            FROM inventory
-            WHERE knight_id = %s AND is_equipped = FALSE
-        """, (knight_id,))
-        
-        items = cursor.fetchall()
-        
-        total_gold = 0
-        items_sold = 0
-        
-        for item in items:
-            item_def = get_item(item['item_id'])
-            
-            # Only sell equipment (not materials)
-            if item_def and not item_def.get('stackable', False):
-                # Calculate sell price based on item tier
-                item_id = item['item_id']
-                if 200 <= item_id < 300:  # Wooden
-                    sell_price = 10
-                elif 300 <= item_id < 400:  # Stone
-                    sell_price = 40
-                elif 400 <= item_id < 500:  # Iron
-                    sell_price = 100
-                else:
-                    sell_price = 5  # Default
-                
-                total_gold += sell_price
-                items_sold += 1
-                
-                # Delete the item from inventory
-                cursor.execute("DELETE FROM inventory WHERE id = %s", (item['id'],))
-        
-        # Add gold to user
-        if total_gold > 0:
-            cursor.execute("""
-                UPDATE users
-                SET gold = gold + %s
-                WHERE id = %s
-            """, (total_gold, user_id))
+        # Only equipment sells (not materials or consumables)
+        items_sold, total_gold = sell_items(
+            cursor, knight_id,
+            CATALOG.sellable_ids(tier=tier, slot=slot),
+            inventory_ids=inventory_ids
+        )
         
         conn.commit()
         cursor.close()
@@ -611,7 +750,7 @@ def use_potion(knight_id):
         cursor = conn.cursor(dictionary=True)
         
         # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        if not verify_knight_ownership(cursor, knight_id, user_id, g.session):
             cursor.close()
             conn.close()
             return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
@@ -637,11 +776,12 @@ def use_potion(knight_id):
             conn.close()
             return jsonify({'error': 'Item is not a consumable'}), 400
         
-        # Get knight data
-        cursor.execute("""
-            SELECT current_hp, max_hp, is_alive
-            FROM knights
-            WHERE id = %s
+        # Get knight data, locked like a battle's read since the new HP is written absolutely
+        cursor.execute(f"""
+            SELECT k.current_hp, k.max_hp, k.is_alive, {HP_ELAPSED_SQL} AS hp_elapsed
+            FROM knights k
+            WHERE k.id = %s
+            FOR UPDATE
         """, (knight_id,))
         
         knight = cursor.fetchone()
@@ -651,6 +791,10 @@ def use_potion(knight_id):
             conn.close()
             return jsonify({'error': 'Knight not found'}), 404
         
+        # Apply regeneration accrued since the HP was last written
+        knight['current_hp'], regen_carry = regen_hp(
+            knight['current_hp'], knight['max_hp'], knight['hp_elapsed'], knight['is_alive'])
+        
         if not knight['is_alive']:
             cursor.close()
             conn.close()
@@ -666,11 +810,12 @@ def use_potion(knight_id):
         new_hp = min(knight['current_hp'] + heal_amount, knight['max_hp'])
         actual_healing = new_hp - knight['current_hp']
         
+        # Keep partial progress toward the next regen point unless now at full HP
         cursor.execute("""
             UPDATE knights
-            SET current_hp = %s
+            SET current_hp = %s, hp_updated_at = NOW() - INTERVAL %s SECOND
             WHERE id = %s
-        """, (new_hp, knight_id))
+        """, (new_hp, regen_carry if new_hp < knight['max_hp'] else 0, knight_id))
         
         # Remove one potion from inventory
         if inventory_item['quantity'] > 1:
@@ -697,8 +842,13 @@ def use_potion(knight_id):
 
 @app.route('/api/inventory', methods=['GET'])
 def get_inventory():
-    """Get knight's inventory."""
+    """
+    Get knight's inventory.
+    With compact=1 the rows aren't enriched with item fields; clients look
+    them up in /api/catalog/items (version in 'catalog_version').
+    """
     knight_id = request.args.get('knight_id')
+    compact = request.args.get('compact') in ('1', 'true')
     
     if not knight_id:
         return jsonify({'error': 'knight_id required'}), 400
@@ -729,21 +879,15 @@ def get_inventory():
         cursor.close()
         conn.close()
         
-        # Enrich with item definitions
-        enriched_items = []
-        for item in items:
-            item_def = get_item(item['item_id'])
-            if item_def:
-                enriched_items.append({
-                    **item,
-                    'name': item_def['name'],
-                    'type': item_def['type'],
-                    'stackable': item_def['stackable'],
-                    'stats': item_def.get('stats', {}),
-                    'slot': item_def.get('slot'),
-                    'rarity': item_def.get('rarity', 'common'),
-                    'description': item_def.get('description', '')
-                })
+        if compact:
+            return jsonify({
+                'gold': user['gold'] if user else 0,
+                'items': items,
+                'catalog_version': ITEMS_DOCUMENT.version
+            }), 200
+        
+        # Enrich with prebuilt catalog fragments
+        enriched_items = CATALOG.inventory_detail_list(items)
         
         return jsonify({
             'gold': user['gold'] if user else 0,
@@ -753,19 +897,53 @@ def get_inventory():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def catalog_response(document):
+    """
+    A catalog document with its ETag: 304 when the client's If-None-Match
+    matches, cacheable forever when requested by its current version (?v=).
+    """
+    response = app.response_class(document.body, mimetype='application/json')
+    response.set_etag(document.version)
+    response.cache_control.public = True
+    if request.args.get('v') == document.version:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = CATALOG_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/api/catalog', methods=['GET'])
+def get_catalog_versions():
+    """Current version of each catalog; fetch /api/catalog/<name>?v=<version> to cache it for good."""
+    versions = {
+        'items': ITEMS_DOCUMENT.version,
+        'shop': SHOP_DOCUMENT.version,
+        'monsters': monsters_document(monster_registry.roster).version,
+    }
+    response = jsonify(versions)
+    response.set_etag('-'.join(versions.values()))
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/catalog/items', methods=['GET'])
+def get_item_catalog():
+    """Every item definition, keyed by item id."""
+    return catalog_response(ITEMS_DOCUMENT)
+
+@app.route('/api/catalog/shop', methods=['GET'])
+def get_shop_catalog():
+    """Items for sale with their prices."""
+    return catalog_response(SHOP_DOCUMENT)
+
+@app.route('/api/catalog/monsters', methods=['GET'])
+def get_monster_catalog():
+    """Monster tiers with stats and loot tables (changes when the monster data is reloaded)."""
+    return catalog_response(monsters_document(monster_registry.roster))
+
 @app.route('/api/shop/items', methods=['GET'])
 def get_shop_items():
     """Get all items available in the shop."""
-    shop_items = [
-        {
-            'id': 501,
-            'name': 'HP Potion',
-            'description': 'Restores 25 HP when consumed',
-            'price': 100,
-            'type': 'consumable'
-        }
-    ]
-    return jsonify(shop_items), 200
+    return catalog_response(SHOP_LIST_DOCUMENT)
 
 @app.route('/api/shop/buy', methods=['POST'])
 def buy_shop_item():
@@ -787,7 +965,7 @@ def buy_shop_item():
         cursor = conn.cursor(dictionary=True)
         
         # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        if not verify_knight_ownership(cursor, knight_id, user_id, g.session):
             cursor.close()
             conn.close()
             return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
@@ -799,17 +977,13 @@ def buy_shop_item():
             conn.close()
             return jsonify({'error': 'Item not found'}), 404
         
-        # Check if item is available in shop (hardcoded for now)
-        shop_prices = {
-            501: 100  # HP Potion
-        }
-        
-        if item_id not in shop_prices:
+        # Check if item is available in shop
+        if item_id not in SHOP_PRICES:
             cursor.close()
             conn.close()
             return jsonify({'error': 'Item not available in shop'}), 400
         
-        price = shop_prices[item_id]
+        price = SHOP_PRICES[item_id]
         total_cost = price * quantity
         
         # Get user's gold
@@ -834,7 +1008,7 @@ def buy_shop_item():
         """, (total_cost, user_id))
         
         # Add item to knight's inventory
-        add_item_to_inventory(cursor, knight_id, item_id, quantity)
+        grant_items(cursor, knight_id, [(item_id, quantity)])
         
         conn.commit()
         cursor.close()
@@ -858,11 +1032,7 @@ def battle_preview():
         return jsonify({'error': 'Invalid difficulty'}), 400
     
     # Get a random monster for this difficulty and return its index
-    import random
-    from monsters import MONSTERS
-    monsters_in_tier = MONSTERS.get(difficulty, MONSTERS['easy'])
-    monster_index = random.randint(0, len(monsters_in_tier) - 1)
-    monster = monsters_in_tier[monster_index]
+    monster_index, monster = pick_monster(difficulty)
     
     return jsonify({
         'monster': {
@@ -876,43 +1046,56 @@ def battle_preview():
         'difficulty': difficulty
     }), 200
 
-@app.route('/api/battle', methods=['POST'])
-def start_battle():
-    logger.error("=" * 80)
-    logger.error("[BATTLE] BATTLE ENDPOINT CALLED - START")
-    sys.stderr.flush()
+@app.route('/api/battle/cache/stats', methods=['GET'])
+def battle_cache_stats():
+    """Battle outcome cache hit/miss counters."""
+    return jsonify(battle_cache.stats()), 200
+
+def validate_battle_request(data):
+    """Error message for an invalid battle request, or None."""
+    if not data.get('knight_id') or not data.get('user_id'):
+        return 'knight_id and user_id required'
     
-    data = request.json
+    if data.get('difficulty', 'easy') not in ['easy', 'medium', 'hard']:
+        return 'Invalid difficulty'
+    
+    if data.get('log_detail', 'full') not in LOG_DETAIL_LEVELS:
+        return f'log_detail must be one of {", ".join(LOG_DETAIL_LEVELS)}'
+    
+    return None
+
+def run_battle(data):
+    """
+    Fight one battle and apply its effects (HP, XP, loot) to the database.
+    Runs on a battle worker; returns (response_dict, status_code).
+    """
+    started = time.perf_counter()
     knight_id = data.get('knight_id')
     user_id = data.get('user_id')
     difficulty = data.get('difficulty', 'easy')
     monster_index = data.get('monster_index')  # Use specific monster from preview
+    log_detail = data.get('log_detail', 'full')  # none / summary / full
     
-    logger.error(f"[BATTLE] Received: knight_id={knight_id}, user_id={user_id}, difficulty={difficulty}")
-    sys.stderr.flush()
-    
-    if not knight_id or not user_id:
-        return jsonify({'error': 'knight_id and user_id required'}), 400
-    
-    if difficulty not in ['easy', 'medium', 'hard']:
-        return jsonify({'error': 'Invalid difficulty'}), 400
-    
-    logger.error("[BATTLE] Validation passed, entering try block")
-    sys.stderr.flush()
+    error = validate_battle_request(data)
+    if error:
+        return {'error': error}, 400
     
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Verify knight ownership
-        if not verify_knight_ownership(cursor, knight_id, user_id):
+        # Verify knight ownership (against the token claims when the request had one)
+        session = session_from_claims(data['session']) if data.get('session') else None
+        if not verify_knight_ownership(cursor, knight_id, user_id, session):
             cursor.close()
             conn.close()
-            return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
+            return {'error': 'Unauthorized: Knight does not belong to this user'}, 403
         
-        # Get knight data
+        # Get knight data (equipment bonuses are stored on the knight row), locked
+        # until commit: the update below writes absolute HP/XP, so a concurrent
+        # battle or grind on this knight must wait rather than be overwritten
         cursor.execute(
-            "SELECT id, user_id, name, class, level, exp, current_hp, max_hp FROM knights WHERE id = %s",
+            f"SELECT k.id, k.user_id, k.name, k.class, k.level, k.exp, k.current_hp, k.max_hp, k.is_alive, {HP_ELAPSED_SQL} AS hp_elapsed, k.attack_bonus, k.defense_bonus, k.agility_bonus FROM knights k WHERE k.id = %s FOR UPDATE",
             (knight_id,)
         )
         knight = cursor.fetchone()
@@ -920,68 +1103,38 @@ def start_battle():
         if not knight:
             cursor.close()
             conn.close()
-            return jsonify({'error': 'Knight not found'}), 404
+            return {'error': 'Knight not found'}, 404
+        
+        # Apply regeneration accrued since the HP was last written
+        knight['current_hp'], regen_carry = regen_hp(
+            knight['current_hp'], knight['max_hp'], knight['hp_elapsed'], knight['is_alive'])
         
         # Check if knight has enough HP to battle
         if knight['current_hp'] <= 0:
             cursor.close()
             conn.close()
-            return jsonify({'error': 'Knight has no HP remaining'}), 400
-        
-        # Get equipped items and calculate stat bonuses
-        cursor.execute("""
-            SELECT i.item_id
-            FROM inventory i
-            WHERE i.knight_id = %s AND i.is_equipped = TRUE
-        """, (knight_id,))
-        
-        equipped_items = cursor.fetchall()
-        
-        # Calculate total stat bonuses from equipment
-        attack_bonus = 0
-        defense_bonus = 0
-        agility_bonus = 0
-        
-        for item in equipped_items:
-            item_def = get_item(item['item_id'])
-            if item_def and 'stats' in item_def:
-                attack_bonus += item_def['stats'].get('attack', 0)
-                defense_bonus += item_def['stats'].get('defense', 0)
-                agility_bonus += item_def['stats'].get('agility', 0)
-        
-        # Add bonuses to knight data
-        knight['attack_bonus'] = attack_bonus
-        knight['defense_bonus'] = defense_bonus
-        knight['agility_bonus'] = agility_bonus
+            return {'error': 'Knight has no HP remaining'}, 400
         
         # Get monster (use specific index if provided from preview, otherwise random)
         if monster_index is not None:
             monster = get_monster(difficulty, index=monster_index)
-            logger.info(f"[BATTLE] Using monster from preview: {monster.name} (index {monster_index})")
         else:
             monster = get_monster(difficulty)
-            logger.info(f"[BATTLE] Random monster: {monster.name}, Difficulty: {difficulty}")
         
         # Simulate battle
-        battle_result = simulate_battle(knight, monster)
-        logger.info(f"[BATTLE] Battle result: {battle_result.get('result')}")
-        logger.info(f"[BATTLE] Battle result keys: {list(battle_result.keys())}")
+        battle_result = cached_simulate_battle(knight, monster, log_detail=log_detail)
         
         # Initialize exp and level for response
         new_exp = knight['exp']
         new_level = knight['level']
-        logger.info(f"[BATTLE] Initial exp: {new_exp}, level: {new_level}")
         
         # Update knight HP, alive status, and XP if victorious
         if battle_result['result'] == 'victory':
-            logger.info("[BATTLE] Victory path")
             new_exp = knight['exp'] + battle_result['xp_gained']
             new_level = (new_exp // 100) + 1  # Level up every 100 XP
-            logger.info(f"[BATTLE] New exp: {new_exp}, new level: {new_level}")
             
             # Generate loot
             loot = generate_loot(monster)
-            logger.info(f"[BATTLE] Loot generated: gold={loot['gold']}, items={loot['items']}")
             
             # Award gold
             cursor.execute(
@@ -990,57 +1143,53 @@ def start_battle():
             )
             
             # Award items to this knight's inventory
-            for item_id in loot['items']:
-                logger.info(f"[BATTLE] Adding item {item_id} to inventory")
-                add_item_to_inventory(cursor, knight_id, item_id, 1)
+            grant_items(cursor, knight_id, [(item_id, 1) for item_id in loot['items']])
             
             # Update knight stats
             cursor.execute(
-                "UPDATE knights SET current_hp = %s, is_alive = %s, exp = %s, level = %s WHERE id = %s",
-                (battle_result['knight_hp'], battle_result['knight_alive'], new_exp, new_level, knight_id)
+                "UPDATE knights SET current_hp = %s, hp_updated_at = NOW() - INTERVAL %s SECOND, is_alive = %s, exp = %s, level = %s WHERE id = %s",
+                (battle_result['knight_hp'], regen_carry, battle_result['knight_alive'], new_exp, new_level, knight_id)
             )
             
             battle_result['exp'] = new_exp
             battle_result['level'] = new_level
             
-            # Build loot items list, skipping any invalid items
-            loot_items = []
-            for item_id in loot['items']:
-                logger.info(f"[BATTLE] Looking up item {item_id}")
-                item_def = get_item(item_id)
-                if item_def:
-                    loot_items.append({'id': item_id, 'name': item_def['name']})
-                    logger.info(f"[BATTLE] Added item: {item_def['name']}")
-                else:
-                    logger.warning(f"[BATTLE] WARNING: Item {item_id} not found!")
-            
+            # Loot items list from the monster's prebuilt fragments (invalid items skipped)
             battle_result['loot'] = {
                 'gold': loot['gold'],
-                'items': loot_items
+                'items': monster.loot.describe(loot['items'])
             }
-            logger.info(f"[BATTLE] Final loot: {battle_result['loot']}")
+            
+            record_battle(cursor, knight, monster, difficulty, battle_result, gold_gained=loot['gold'])
         else:
-            logger.info("[BATTLE] Defeat path")
             cursor.execute(
-                "UPDATE knights SET current_hp = %s, is_alive = %s WHERE id = %s",
-                (battle_result['knight_hp'], battle_result['knight_alive'], knight_id)
+                "UPDATE knights SET current_hp = %s, hp_updated_at = NOW() - INTERVAL %s SECOND, is_alive = %s WHERE id = %s",
+                (battle_result['knight_hp'], regen_carry, battle_result['knight_alive'], knight_id)
             )
             
             battle_result['exp'] = knight['exp']
             battle_result['level'] = knight['level']
+            
+            record_battle(cursor, knight, monster, difficulty, battle_result)
         
-        logger.info(f"[BATTLE] About to commit. new_exp={new_exp}, new_level={new_level}")
         conn.commit()
         cursor.close()
         conn.close()
         
-        logger.info(f"[BATTLE] Returning response")
-        return jsonify({
+        # Refresh the leaderboard if this knight's standing there changed
+        if battle_result['result'] == 'victory':
+            invalidate_leaderboard(new_level, new_exp)
+        elif not battle_result['knight_alive']:
+            invalidate_leaderboard(knight['level'], knight['exp'])
+        
+        response = {
             'result': battle_result['result'],
             'knight_hp': battle_result['knight_hp'],
             'knight_max_hp': knight['max_hp'],
             'knight_alive': battle_result['knight_alive'],
             'log': battle_result['log'],
+            'events': battle_result['events'],
+            'turns': battle_result['turns'],
             'xp_gained': battle_result['xp_gained'],
             'exp': new_exp,
             'level': new_level,
@@ -1052,66 +1201,234 @@ def start_battle():
                 'defense': monster.defense,
                 'agility': monster.agility
             }
-        }), 200
+        }
+        
+        # A fallen knight leaves the session's claims
+        if session is not None and not battle_result['knight_alive']:
+            response['token'] = refresh_token(session, removed=[knight_id])
         
-    except TypeError as e:
-        import traceback
-        error_msg = f"TypeError in battle: {str(e)}"
-        logger.error("!" * 80)
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
-        logger.error("!" * 80)
-        sys.stderr.flush()
-        return jsonify({'error': error_msg}), 500
-    except KeyError as e:
-        import traceback
-        error_msg = f"KeyError in battle: {str(e)}"
-        logger.error("!" * 80)
-        logger.error(error_msg)
-        logger.error(traceback.format_exc())
-        logger.error("!" * 80)
-        sys.stderr.flush()
-        return jsonify({'error': error_msg}), 500
+        duration = time.perf_counter() - started
+        battles_total.inc(difficulty, monster.name, battle_result['result'])
+        battle_latency.observe(duration, difficulty)
+        if battle_result['result'] == 'victory':
+            loot_gold.inc(amount=loot['gold'])
+            for item_id in loot['items']:
+                record = CATALOG.get(item_id)
+                loot_items_total.inc(record.tier if record else 'unknown')
+        
+        battle_logger.info('Battle %s: knight %s vs %s', battle_result['result'], knight_id, monster.name, extra={'fields': {
+            'knight_id': knight_id,
+            'difficulty': difficulty,
+            'monster': monster.name,
+            'result': battle_result['result'],
+            'turns': battle_result['turns'],
+            'knight_alive': battle_result['knight_alive'],
+            'gold': response['loot']['gold'],
+            'items': len(response['loot']['items']),
+            'duration_ms': round(duration * 1000, 2),
+        }})
+        return response, 200
+        
+    except (TypeError, KeyError) as e:
+        battle_logger.exception('Battle failed for knight %s', knight_id)
+        return {'error': f"{type(e).__name__} in battle: {str(e)}"}, 500
     except Exception as e:
-        import traceback
-        error_msg = str(e) if str(e) else 'Unknown error occurred'
-        logger.error("!" * 80)
-        logger.error(f"Battle error: {error_msg}")
-        logger.error(f"Error type: {type(e)}")
-        logger.error(traceback.format_exc())
-        logger.error("!" * 80)
-        sys.stderr.flush()
-        return jsonify({'error': error_msg}), 500
+        battle_logger.exception('Battle failed for knight %s', knight_id)
+        return {'error': str(e) if str(e) else 'Unknown error occurred'}, 500
+
+def battle_job(payload):
+    """Battle worker entry point: run_battle() inside an app context."""
+    with app.app_context():
+        if tracing_enabled('1' if payload.get('sql_trace') else None):
+            g.sql_trace = QueryTrace()
+        result = run_battle(payload)
+        observe_db_usage('battle_job')
+        report_sql_trace('battle_job')
+        return result
+
+# Battle job queue and the workers that drain it (BATTLE_WORKERS threads)
+battle_jobs = queue_from_env()
+battle_workers = BattleWorkerPool(battle_jobs, battle_job, workers=int(os.getenv('BATTLE_WORKERS', '4')))
+# Started now rather than on the first POST, so jobs a persistent queue kept across a restart run
+battle_workers.start()
+
+# Pick up monster rebalancing (monsters.json / the monster-data ConfigMap) without a restart
+monster_registry.start()
+
+@app.route('/api/battle', methods=['POST'])
+def start_battle():
+    """Queue a battle. Poll GET /api/battle/<battle_id> for the result."""
+    data = request.json
+    
+    error = validate_battle_request(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    # The worker checks ownership against the claims of the token verified for
+    # this request (never the token itself, which a persistent queue would store);
+    # 'session' is always overwritten, so claims in the body gain nothing
+    payload = dict(data, session=session_claims(g.session) if g.session else None,
+                   sql_trace=tracing_enabled(request.headers.get(TRACE_HEADER)))
+    
+    try:
+        battle_id = battle_jobs.submit(payload)
+    except QueueFullError:
+        return jsonify({'error': 'Too many battles in progress, try again shortly'}), 503
+    
+    return jsonify({
+        'battle_id': battle_id,
+        'status': 'queued',
+        'status_url': f'/api/battle/{battle_id}'
+    }), 202
 
-@app.route('/api/regen', methods=['POST'])
-def regen_hp():
+@app.route('/api/battle/<battle_id>', methods=['GET'])
+def get_battle(battle_id):
     """
-    Regenerate HP for all knights (1 HP per 15 minutes).
-    Called by K8s CronJob.
+    Status of a queued battle: queued, running, done or failed.
+    Once done, 'result' holds the battle outcome; a failed battle carries 'error'.
     """
+    job = battle_jobs.get(battle_id)
+    if not job:
+        return jsonify({'error': 'Battle not found'}), 404
+    
+    response = {'battle_id': job['id'], 'status': job['status']}
+    if job['status'] == 'done':
+        response['result'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = (job['result'] or {}).get('error', 'Battle failed')
+        response['status_code'] = job['status_code']
+    return jsonify(response), 200
+
+@app.route('/api/battle/grind', methods=['POST'])
+def grind_battles():
+    """
+    Fight up to `count` battles in a row against one tier, stopping early if
+    the knight dies or its HP falls to `hp_floor`. The series runs in memory
+    and its combined effect (HP, XP, gold, loot, history) is written in one
+    transaction. Returns an aggregated summary.
+    """
+    data = request.json
+    
+    error = validate_battle_request(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    knight_id = data.get('knight_id')
+    user_id = data.get('user_id')
+    difficulty = data.get('difficulty', 'easy')
+    count = data.get('count', 10)
+    hp_floor = data.get('hp_floor', 0)
+    
+    if not isinstance(count, int) or not 1 <= count <= GRIND_MAX_BATTLES:
+        return jsonify({'error': f'count must be between 1 and {GRIND_MAX_BATTLES}'}), 400
+    
+    if not isinstance(hp_floor, int) or hp_floor < 0:
+        return jsonify({'error': 'hp_floor must be a non-negative integer'}), 400
+    
     try:
+        started = time.perf_counter()
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        # Heal all LIVING knights by 1 HP, up to their max_hp
-        cursor.execute("""
-            UPDATE knights 
-            SET current_hp = LEAST(current_hp + 1, max_hp)
-            WHERE current_hp < max_hp AND is_alive = TRUE
-        """)
+        if not verify_knight_ownership(cursor, knight_id, user_id, g.session):
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Unauthorized: Knight does not belong to this user'}), 403
+        
+        # Lock the knight for the whole series; battles and potions lock the same row, so they wait
+        cursor.execute(
+            f"SELECT k.id, k.user_id, k.name, k.class, k.level, k.exp, k.current_hp, k.max_hp, k.is_alive, {HP_ELAPSED_SQL} AS hp_elapsed, k.attack_bonus, k.defense_bonus, k.agility_bonus FROM knights k WHERE k.id = %s FOR UPDATE",
+            (knight_id,)
+        )
+        knight = cursor.fetchone()
+        
+        if not knight:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Knight not found'}), 404
+        
+        knight['current_hp'], regen_carry = regen_hp(
+            knight['current_hp'], knight['max_hp'], knight['hp_elapsed'], knight['is_alive'])
+        
+        if knight['current_hp'] <= 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Knight has no HP remaining'}), 400
+        
+        series = fight_series(knight, difficulty, count, hp_floor=hp_floor)
+        item_counts = series.item_counts()
+        
+        if series.battles:
+            cursor.execute(
+                "UPDATE knights SET current_hp = %s, hp_updated_at = NOW() - INTERVAL %s SECOND, is_alive = %s, exp = %s, level = %s WHERE id = %s",
+                (series.hp, regen_carry, series.alive, series.exp, series.level, knight_id)
+            )
+            if series.gold:
+                cursor.execute(
+                    "UPDATE users SET gold = gold + %s WHERE id = %s",
+                    (series.gold, knight['user_id'])
+                )
+            grant_items(cursor, knight_id, list(item_counts.items()))
+            record_battles(cursor, knight_id, difficulty, series.battles)
         
-        healed_count = cursor.rowcount
         conn.commit()
         cursor.close()
         conn.close()
         
-        return jsonify({
-            'message': f'Healed {healed_count} knights',
-            'healed_count': healed_count
-        }), 200
+        if series.xp_gained:
+            invalidate_leaderboard(series.level, series.exp)
+        if not series.alive:
+            invalidate_leaderboard(knight['level'], knight['exp'])
+        
+        victories = series.count('victory')
+        response = {
+            'battles': len(series.battles),
+            'victories': victories,
+            'defeats': series.count('defeat'),
+            'draws': series.count('draw'),
+            'stopped': series.stopped,
+            'knight_hp': series.hp,
+            'knight_max_hp': knight['max_hp'],
+            'knight_alive': series.alive,
+            'xp_gained': series.xp_gained,
+            'exp': series.exp,
+            'level': series.level,
+            'loot': {
+                'gold': series.gold,
+                'items': [
+                    {'id': item_id, 'name': CATALOG.get(item_id).name, 'count': item_count}
+                    for item_id, item_count in item_counts.items() if item_id in CATALOG
+                ]
+            },
+            'monsters': series.monster_counts()
+        }
+        
+        # A fallen knight leaves the session's claims
+        if g.session is not None and not series.alive:
+            response['token'] = refresh_token(g.session, removed=[knight_id])
+        
+        for battle in series.battles:
+            battles_total.inc(difficulty, battle.monster.name, battle.result)
+        loot_gold.inc(amount=series.gold)
+        for item_id, item_count in item_counts.items():
+            record = CATALOG.get(item_id)
+            loot_items_total.inc(record.tier if record else 'unknown', amount=item_count)
+        
+        battle_logger.info('Grind: knight %s fought %d battles', knight_id, len(series.battles), extra={'fields': {
+            'knight_id': knight_id,
+            'difficulty': difficulty,
+            'battles': len(series.battles),
+            'victories': victories,
+            'stopped': series.stopped,
+            'gold': series.gold,
+            'items': sum(item_counts.values()),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        }})
+        return jsonify(response), 200
         
     except Exception as e:
+        battle_logger.exception('Grind failed for knight %s', knight_id)
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '8080')))
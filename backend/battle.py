@@ -1,4 +1,20 @@
 # Battle system for Knight Club
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Safety limit on battle length
+MAX_TURNS = 50
+
+# How much of the battle log simulate_battle builds
+LOG_DETAIL_LEVELS = ('none', 'events', 'summary', 'full')
+
+# Actor codes used in battle events
+KNIGHT = 0
+MONSTER = 1
 
 class Combatant:
     def __init__(self, name, hp, max_hp, attack, defense, agility):
@@ -9,38 +25,44 @@ class Combatant:
         self.defense = defense
         self.agility = agility
         self.is_alive = True
-    
+
     def take_damage(self, damage):
         self.hp -= damage
         if self.hp <= 0:
             self.hp = 0
             self.is_alive = False
         return self.hp
-    
+
     def calculate_damage(self, target):
         """Calculate damage dealt to target"""
         raw_damage = self.attack - target.defense
         return max(1, raw_damage)  # Minimum 1 damage
 
-def simulate_battle(knight_data, monster):
-    """
-    Simulate a turn-based battle between knight and monster.
-    Returns battle log and final knight HP.
-    """
+def effective_stats(knight_data):
+    """Knight's (attack, defense, agility) after level and equipment bonuses."""
     # Calculate level bonus (each level adds +1 to all stats)
     level = knight_data.get('level', 1)
     level_bonus = level - 1  # Level 1 = 0 bonus, Level 2 = 1 bonus, etc.
-    
-    # Create combatants
+
+    return (
+        10 + level_bonus + knight_data.get('attack_bonus', 0),   # Base 10 + level + equipment
+        10 + level_bonus + knight_data.get('defense_bonus', 0),  # Base 10 + level + equipment
+        10 + level_bonus + knight_data.get('agility_bonus', 0)   # Base 10 + level + equipment
+    )
+
+def build_combatants(knight_data, monster):
+    """Create the knight and monster combatants for a battle."""
+    attack, defense, agility = effective_stats(knight_data)
+
     knight = Combatant(
         name=knight_data['name'],
         hp=knight_data['current_hp'],
         max_hp=knight_data['max_hp'],
-        attack=10 + level_bonus + knight_data.get('attack_bonus', 0),   # Base 10 + level + equipment
-        defense=10 + level_bonus + knight_data.get('defense_bonus', 0),  # Base 10 + level + equipment
-        agility=10 + level_bonus + knight_data.get('agility_bonus', 0)   # Base 10 + level + equipment
+        attack=attack,
+        defense=defense,
+        agility=agility
     )
-    
+
     monster_combatant = Combatant(
         name=monster.name,
         hp=monster.hp,
@@ -49,77 +71,379 @@ def simulate_battle(knight_data, monster):
         defense=monster.defense,
         agility=monster.agility
     )
-    
-    battle_log = []
-    battle_log.append(f"⚔️ {knight.name} encounters a {monster_combatant.name}!")
-    battle_log.append(f"Knight HP: {knight.hp}/{knight.max_hp} | Monster HP: {monster_combatant.hp}/{monster_combatant.max_hp}")
-    battle_log.append("")
-    
-    # Determine turn order based on agility
-    if knight.agility >= monster_combatant.agility:
-        first = knight
-        second = monster_combatant
+
+    return knight, monster_combatant
+
+def hits_to_kill(hp, damage):
+    """Number of hits of `damage` needed to bring `hp` to 0 (always at least 1)."""
+    return max(1, -(-hp // damage))
+
+def resolve_battle(knight, monster):
+    """
+    Work out a battle's outcome arithmetically instead of playing it turn by turn.
+
+    Damage per hit is fixed for each side, so the turn on which each combatant
+    would fall is known up front. Returns who moved first, the turn the battle
+    ended on, whether it timed out, and both combatants' final HP.
+    """
+    knight_first = knight.agility >= monster.agility
+    first, second = (knight, monster) if knight_first else (monster, knight)
+
+    first_damage = first.calculate_damage(second)
+    second_damage = second.calculate_damage(first)
+
+    # First attacker lands hit N at the start of turn N, second attacker at the end
+    first_kills_on = hits_to_kill(second.hp, first_damage)
+    second_kills_on = hits_to_kill(first.hp, second_damage)
+
+    first_alive = second_alive = True
+    if first_kills_on <= second_kills_on and first_kills_on <= MAX_TURNS:
+        turns = first_kills_on
+        first_hits, second_hits = turns, turns - 1
+        second_alive = False
+    elif second_kills_on < first_kills_on and second_kills_on <= MAX_TURNS:
+        turns = second_kills_on
+        first_hits, second_hits = turns, turns
+        first_alive = False
     else:
-        first = monster_combatant
-        second = knight
-    
-    battle_log.append(f"🏃 {first.name} moves first! (Agility: {first.agility})")
-    battle_log.append("")
-    
-    turn = 1
-    while knight.is_alive and monster_combatant.is_alive:
-        battle_log.append(f"--- Turn {turn} ---")
-        
-        # First attacker
-        damage = first.calculate_damage(second)
-        second.take_damage(damage)
-        battle_log.append(f"💥 {first.name} attacks {second.name} for {damage} damage!")
-        battle_log.append(f"   {second.name} HP: {second.hp}/{second.max_hp}")
-        
-        if not second.is_alive:
-            break
-        
-        # Second attacker
-        damage = second.calculate_damage(first)
-        first.take_damage(damage)
-        battle_log.append(f"💥 {second.name} attacks {first.name} for {damage} damage!")
-        battle_log.append(f"   {first.name} HP: {first.hp}/{first.max_hp}")
-        
-        battle_log.append("")
-        turn += 1
-        
-        # Safety check: max 50 turns
-        if turn > 50:
-            battle_log.append("⏱️ Battle timeout - Draw!")
+        turns = MAX_TURNS
+        first_hits, second_hits = turns, turns
+
+    first_hp = max(0, first.hp - second_hits * second_damage)
+    second_hp = max(0, second.hp - first_hits * first_damage)
+    if knight_first:
+        knight_hp, monster_hp = first_hp, second_hp
+        knight_alive, monster_alive = first_alive, second_alive
+    else:
+        knight_hp, monster_hp = second_hp, first_hp
+        knight_alive, monster_alive = second_alive, first_alive
+
+    return {
+        'knight_first': knight_first,
+        'first_damage': first_damage,
+        'second_damage': second_damage,
+        'turns': turns,
+        # The turn loop gives up once turn MAX_TURNS has been fully played
+        'timed_out': turns == MAX_TURNS and second_alive,
+        'knight_hp': knight_hp,
+        'knight_alive': knight_alive,
+        'monster_hp': monster_hp,
+        'monster_alive': monster_alive,
+    }
+
+def battle_events(knight, monster, outcome):
+    """
+    Compact event stream for a resolved battle.
+
+    Returns {'first', 'agility', 'knight_hp', 'monster_hp', 'hits'}: who moved
+    first (KNIGHT or MONSTER) and with what agility, both starting HPs, and
+    one (turn, actor, damage, target_hp_after) tuple per attack. Clients
+    render the sentences; render_events() does the same server-side.
+    """
+    if outcome['knight_first']:
+        first, second, first_actor, second_actor = knight, monster, KNIGHT, MONSTER
+    else:
+        first, second, first_actor, second_actor = monster, knight, MONSTER, KNIGHT
+    first_damage = outcome['first_damage']
+    second_damage = outcome['second_damage']
+    second_falls = not (outcome['monster_alive'] if outcome['knight_first'] else outcome['knight_alive'])
+
+    hits = []
+    for turn in range(1, outcome['turns'] + 1):
+        hits.append((turn, first_actor, first_damage, max(0, second.hp - turn * first_damage)))
+        if second_falls and turn == outcome['turns']:
             break
-    
-    # Battle result
-    battle_log.append("=" * 40)
-    if knight.is_alive:
-        battle_log.append(f"🎉 Victory! {knight.name} defeated the {monster_combatant.name}!")
-        battle_log.append(f"💚 {knight.name} HP remaining: {knight.hp}/{knight.max_hp}")
-        battle_log.append(f"⭐ Experience gained: {monster.xp_reward} XP")
+        hits.append((turn, second_actor, second_damage, max(0, first.hp - turn * second_damage)))
+
+    return {
+        'first': first_actor,
+        'agility': first.agility,
+        'knight_hp': knight.hp,
+        'monster_hp': monster.hp,
+        'hits': hits,
+    }
+
+def render_events(events, knight, monster):
+    """The per-turn log lines for a battle_events() stream."""
+    names = (knight.name, monster.name)
+    max_hps = (knight.max_hp, monster.max_hp)
+    lines = []
+    for turn, actor, damage, target_hp in events['hits']:
+        target = MONSTER if actor == KNIGHT else KNIGHT
+        if actor == events['first']:
+            lines.append(f"--- Turn {turn} ---")
+        lines.append(f"💥 {names[actor]} attacks {names[target]} for {damage} damage!")
+        lines.append(f"   {names[target]} HP: {target_hp}/{max_hps[target]}")
+        if actor != events['first']:
+            lines.append("")
+            if turn == MAX_TURNS:
+                lines.append("⏱️ Battle timeout - Draw!")
+    return lines
+
+def simulate_battle(knight_data, monster, log_detail='full'):
+    """
+    Simulate a turn-based battle between knight and monster.
+    Returns battle log and final knight HP.
+
+    log_detail controls how much of the log is built:
+    'full' is the turn-by-turn log, 'summary' only the opening and result
+    lines, 'events' the compact battle_events() stream instead of text,
+    and 'none' skips the log entirely.
+    """
+    if log_detail not in LOG_DETAIL_LEVELS:
+        raise ValueError(f"log_detail must be one of {LOG_DETAIL_LEVELS}")
+
+    knight, monster_combatant = build_combatants(knight_data, monster)
+    outcome = resolve_battle(knight, monster_combatant)
+
+    # Running out of turns counts as surviving
+    knight_alive = outcome['knight_alive']
+    if knight_alive:
         result = 'victory'
-        knight_alive = True
-    elif monster_combatant.is_alive:
-        battle_log.append(f"💀 Defeat! {knight.name} was slain by the {monster_combatant.name}!")
-        battle_log.append(f"⚰️  {knight.name} has died permanently...")
+    elif outcome['monster_alive']:
         result = 'defeat'
-        knight_alive = False
     else:
-        battle_log.append("🤝 Draw! Both combatants fell!")
-        battle_log.append(f"⚰️  {knight.name} has died permanently...")
         result = 'draw'
-        knight_alive = False
-    
-    # Ensure HP is 0 if knight died
-    if not knight_alive:
-        knight.hp = 0
-    
+
+    battle_log = []
+    events = None
+    if log_detail == 'events':
+        events = battle_events(knight, monster_combatant, outcome)
+    elif log_detail != 'none':
+        first = knight if outcome['knight_first'] else monster_combatant
+
+        battle_log.append(f"⚔️ {knight.name} encounters a {monster_combatant.name}!")
+        battle_log.append(f"Knight HP: {knight.hp}/{knight.max_hp} | Monster HP: {monster_combatant.hp}/{monster_combatant.max_hp}")
+        battle_log.append("")
+        battle_log.append(f"🏃 {first.name} moves first! (Agility: {first.agility})")
+        battle_log.append("")
+
+        if log_detail == 'full':
+            battle_log.extend(render_events(battle_events(knight, monster_combatant, outcome), knight, monster_combatant))
+        else:
+            battle_log.append(f"⏳ The battle lasted {outcome['turns']} turns.")
+            if outcome['timed_out']:
+                battle_log.append("⏱️ Battle timeout - Draw!")
+
+        # Battle result
+        battle_log.append("=" * 40)
+        if result == 'victory':
+            battle_log.append(f"🎉 Victory! {knight.name} defeated the {monster_combatant.name}!")
+            battle_log.append(f"💚 {knight.name} HP remaining: {outcome['knight_hp']}/{knight.max_hp}")
+            battle_log.append(f"⭐ Experience gained: {monster.xp_reward} XP")
+        elif result == 'defeat':
+            battle_log.append(f"💀 Defeat! {knight.name} was slain by the {monster_combatant.name}!")
+            battle_log.append(f"⚰️  {knight.name} has died permanently...")
+        else:
+            battle_log.append("🤝 Draw! Both combatants fell!")
+            battle_log.append(f"⚰️  {knight.name} has died permanently...")
+
     return {
         'result': result,
-        'knight_hp': knight.hp,
+        'knight_hp': outcome['knight_hp'],
         'knight_alive': knight_alive,
+        'turns': outcome['turns'],
         'log': battle_log,
+        'events': events,
         'xp_gained': monster.xp_reward if result == 'victory' else 0
     }
+
+# Packed battle inputs: format version, then the knight's effective
+# attack/defense/agility, HP before and max HP, then the monster's
+# hp/attack/defense/agility/xp_reward. Enough to replay a battle exactly.
+REPLAY_VERSION = 1
+REPLAY_FORMAT = struct.Struct('<B10i')
+
+class _ReplayMonster:
+    """Monster stand-in rebuilt from packed replay stats."""
+
+    def __init__(self, name, hp, attack, defense, agility, xp_reward):
+        self.name = name
+        self.hp = hp
+        self.max_hp = hp
+        self.attack = attack
+        self.defense = defense
+        self.agility = agility
+        self.xp_reward = xp_reward
+
+def pack_battle(knight_data, monster):
+    """Pack the inputs of a battle into a few dozen bytes for storage."""
+    attack, defense, agility = effective_stats(knight_data)
+    return REPLAY_FORMAT.pack(
+        REPLAY_VERSION,
+        attack, defense, agility, knight_data['current_hp'], knight_data['max_hp'],
+        monster.hp, monster.attack, monster.defense, monster.agility, monster.xp_reward
+    )
+
+def replay_battle(packed, knight_name, monster_name, log_detail='full'):
+    """Re-run a battle from pack_battle() output; returns simulate_battle()'s result."""
+    (version, attack, defense, agility, hp, max_hp,
+     monster_hp, monster_attack, monster_defense, monster_agility, xp_reward) = REPLAY_FORMAT.unpack(packed)
+    if version != REPLAY_VERSION:
+        raise ValueError(f"Unsupported battle replay version {version}")
+    # Effective stats are stored, so replay as a level 1 knight with matching bonuses
+    knight_data = {
+        'name': knight_name,
+        'current_hp': hp,
+        'max_hp': max_hp,
+        'level': 1,
+        'attack_bonus': attack - 10,
+        'defense_bonus': defense - 10,
+        'agility_bonus': agility - 10,
+    }
+    monster = _ReplayMonster(monster_name, monster_hp, monster_attack, monster_defense, monster_agility, xp_reward)
+    return simulate_battle(knight_data, monster, log_detail=log_detail)
+
+class BattleCache:
+    """
+    Bounded LRU cache of simulate_battle() results.
+
+    A battle's outcome depends only on the knight's effective stats and
+    current HP plus the monster's combat stats, so that is the key. The
+    monster is keyed by value rather than identity and equipment is already
+    folded into the effective stats, so editing monster or item definitions
+    at runtime simply produces new keys. The knight's name and max HP only
+    appear in the text log, so they are part of the key only when one is built.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, knight_data, monster, log_detail):
+        monster_key = (monster.name, monster.hp, monster.max_hp, monster.attack,
+                       monster.defense, monster.agility, monster.xp_reward)
+        log_key = None if log_detail in ('none', 'events') else (knight_data['name'], knight_data['max_hp'])
+        return (effective_stats(knight_data), knight_data['current_hp'], monster_key, log_detail, log_key)
+
+    def simulate(self, knight_data, monster, log_detail='full'):
+        """simulate_battle(), answered from the cache when this fight has been seen before."""
+        key = self._key(knight_data, monster, log_detail)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if result is None:
+            result = simulate_battle(knight_data, monster, log_detail=log_detail)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        # Callers add fields to the result, so never hand out the cached dict itself
+        return {**result, 'log': list(result['log'])}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+# Shared cache used by the battle endpoint
+battle_cache = BattleCache(maxsize=int(os.getenv('BATTLE_CACHE_SIZE', '4096')))
+
+def cached_simulate_battle(knight_data, monster, log_detail='full'):
+    """simulate_battle() through the shared battle_cache."""
+    return battle_cache.simulate(knight_data, monster, log_detail=log_detail)
+
+# Result names indexed by the codes simulate_battles() produces
+RESULT_NAMES = ('victory', 'defeat', 'draw')
+
+def knight_arrays(knights):
+    """Column arrays for simulate_battles() from a list of knight dicts (as passed to simulate_battle)."""
+    return {
+        'level': np.array([k.get('level', 1) for k in knights], dtype=np.int64),
+        'current_hp': np.array([k['current_hp'] for k in knights], dtype=np.int64),
+        'attack_bonus': np.array([k.get('attack_bonus', 0) for k in knights], dtype=np.int64),
+        'defense_bonus': np.array([k.get('defense_bonus', 0) for k in knights], dtype=np.int64),
+        'agility_bonus': np.array([k.get('agility_bonus', 0) for k in knights], dtype=np.int64),
+    }
+
+def monster_arrays(monsters):
+    """Column arrays for simulate_battles() from a list of Monster objects."""
+    return {
+        'hp': np.array([m.hp for m in monsters], dtype=np.int64),
+        'attack': np.array([m.attack for m in monsters], dtype=np.int64),
+        'defense': np.array([m.defense for m in monsters], dtype=np.int64),
+        'agility': np.array([m.agility for m in monsters], dtype=np.int64),
+        'xp_reward': np.array([m.xp_reward for m in monsters], dtype=np.int64),
+    }
+
+def simulate_battles(knights, monsters):
+    """
+    Resolve every knight against every monster in one vectorized call.
+
+    knights is a dict of equal-length arrays keyed like simulate_battle's
+    knight_data ('level', 'current_hp', 'attack_bonus', 'defense_bonus',
+    'agility_bonus'); see knight_arrays(). monsters is either a list of
+    Monster objects or a dict of arrays from monster_arrays().
+
+    Returns a dict of (n_knights, n_monsters) arrays: 'result' (index into
+    RESULT_NAMES), 'knight_hp', 'knight_alive', 'turns' and 'xp_gained'.
+    Matches simulate_battle() pair for pair.
+    """
+    if not isinstance(monsters, dict):
+        monsters = monster_arrays(monsters)
+
+    # Knights down the rows, monsters across the columns
+    def column(values):
+        return np.asarray(values, dtype=np.int64)[:, None]
+
+    def row(values):
+        return np.asarray(values, dtype=np.int64)[None, :]
+
+    level_bonus = column(knights.get('level', 1)) - 1
+    knight_hp = column(knights['current_hp'])
+    knight_attack = 10 + level_bonus + column(knights.get('attack_bonus', 0))
+    knight_defense = 10 + level_bonus + column(knights.get('defense_bonus', 0))
+    knight_agility = 10 + level_bonus + column(knights.get('agility_bonus', 0))
+
+    monster_hp = row(monsters['hp'])
+    monster_attack = row(monsters['attack'])
+    monster_defense = row(monsters['defense'])
+    monster_agility = row(monsters['agility'])
+    xp_reward = row(monsters['xp_reward'])
+
+    knight_first = knight_agility >= monster_agility
+    knight_damage = np.maximum(1, knight_attack - monster_defense)
+    monster_damage = np.maximum(1, monster_attack - knight_defense)
+
+    # Same turn arithmetic as resolve_battle()
+    knight_kills_on = np.maximum(1, -(-monster_hp // knight_damage))
+    monster_kills_on = np.maximum(1, -(-knight_hp // monster_damage))
+    first_kills_on = np.where(knight_first, knight_kills_on, monster_kills_on)
+    second_kills_on = np.where(knight_first, monster_kills_on, knight_kills_on)
+
+    first_wins = (first_kills_on <= second_kills_on) & (first_kills_on <= MAX_TURNS)
+    second_wins = ~first_wins & (second_kills_on < first_kills_on) & (second_kills_on <= MAX_TURNS)
+    turns = np.where(first_wins, first_kills_on, np.where(second_wins, second_kills_on, MAX_TURNS))
+
+    knight_alive = np.where(knight_first, ~second_wins, ~first_wins)
+    # Moving first, the knight is spared the monster's hit on the killing turn
+    hits_taken = np.where(knight_first & first_wins, turns - 1, turns)
+    final_hp = np.where(knight_alive, np.maximum(0, knight_hp - hits_taken * monster_damage), 0)
+
+    return {
+        'result': np.where(knight_alive, 0, 1).astype(np.int8),
+        'knight_hp': final_hp,
+        'knight_alive': knight_alive,
+        'turns': turns,
+        'xp_gained': np.where(knight_alive, xp_reward, 0),
+    }
@@ -0,0 +1,250 @@
+# Asynchronous battle jobs for Knight Club
+#
+# POST /api/battle queues a job and returns its id; a pool of worker threads
+# drains the queue, runs the battle (simulation, loot, DB writes) and stores
+# the result for GET /api/battle/<id>. Two queue backends, picked with
+# BATTLE_QUEUE:
+#
+#   memory  - in-process queue (default)
+#   sqlite  - jobs persisted in a local SQLite file (BATTLE_QUEUE_PATH),
+#             so queued work and results survive a worker restart
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the battle queue is at capacity."""
+
+
+def _new_job_id():
+    return uuid.uuid4().hex
+
+
+class InProcessBattleQueue:
+    """Battle jobs held in memory; results are kept for `retention` seconds."""
+
+    def __init__(self, maxsize=1000, retention=600):
+        self.retention = retention
+        self._pending = queue.Queue(maxsize)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        self._prune()
+        job_id = _new_job_id()
+        with self._lock:
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'status_code': None,
+                'result': None,
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+        try:
+            self._pending.put_nowait((job_id, payload))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise QueueFullError('Battle queue is full')
+        return job_id
+
+    def claim(self, timeout=1.0):
+        """Next queued (job_id, payload), or None if nothing arrived within timeout."""
+        try:
+            job_id, payload = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._jobs[job_id]['status'] = 'running'
+        return job_id, payload
+
+    def complete(self, job_id, result, status_code):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job['status'] = 'done' if status_code < 400 else 'failed'
+                job['status_code'] = status_code
+                job['result'] = result
+                job['finished_at'] = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def depth(self):
+        return self._pending.qsize()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SQLiteBattleQueue:
+    """Battle jobs stored in a local SQLite file; results are kept for `retention` seconds."""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path, maxsize=1000, retention=600):
+        self.path = path
+        self.maxsize = maxsize
+        self.retention = retention
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS battle_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                status_code INTEGER,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_battle_jobs_status ON battle_jobs (status, created_at)")
+        # A job that was running when the process died may or may not have
+        # committed; never run it twice
+        conn.execute("""
+            UPDATE battle_jobs
+            SET status = 'failed', status_code = 500, finished_at = ?,
+                result = '{"error": "Battle interrupted by a worker restart"}'
+            WHERE status = 'running'
+        """, (time.time(),))
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, payload):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM battle_jobs WHERE finished_at < ?", (now - self.retention,))
+        if self.depth() >= self.maxsize:
+            raise QueueFullError('Battle queue is full')
+        job_id = _new_job_id()
+        conn.execute(
+            "INSERT INTO battle_jobs (id, status, payload, created_at) VALUES (?, 'queued', ?, ?)",
+            (job_id, json.dumps(payload), now)
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def claim(self, timeout=1.0):
+        """Next queued (job_id, payload), or None if nothing arrived within timeout."""
+        conn = self._conn()
+        deadline = time.monotonic() + timeout
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, payload FROM battle_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE battle_jobs SET status = 'running' WHERE id = ?", (row[0],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if row:
+                return row[0], json.loads(row[1])
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._wakeup:
+                self._wakeup.wait(min(remaining, self.POLL_INTERVAL))
+
+    def complete(self, job_id, result, status_code):
+        self._conn().execute(
+            "UPDATE battle_jobs SET status = ?, status_code = ?, result = ?, finished_at = ? WHERE id = ?",
+            ('done' if status_code < 400 else 'failed', status_code,
+             json.dumps(result, default=str), time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            "SELECT id, status, status_code, result, created_at, finished_at FROM battle_jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'status_code': row[2],
+            'result': json.loads(row[3]) if row[3] else None,
+            'created_at': row[4],
+            'finished_at': row[5],
+        }
+
+    def depth(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM battle_jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+
+
+class BattleWorkerPool:
+    """
+    Worker threads that drain a battle queue. handler(payload) returns
+    (result_dict, status_code), the same pair the HTTP handler would send.
+    """
+
+    def __init__(self, jobs, handler, workers=4):
+        self.jobs = jobs
+        self.handler = handler
+        self.workers = workers
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the workers (once)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'battle-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            claimed = self.jobs.claim(timeout=1.0)
+            if claimed is None:
+                continue
+            job_id, payload = claimed
+            try:
+                result, status_code = self.handler(payload)
+            except Exception as e:
+                logger.exception("Battle job %s failed", job_id)
+                result, status_code = {'error': str(e) or 'Unknown error occurred'}, 500
+            self.jobs.complete(job_id, result, status_code)
+
+
+def queue_from_env():
+    """Build the battle queue selected by BATTLE_QUEUE (memory or sqlite)."""
+    maxsize = int(os.getenv('BATTLE_QUEUE_MAX', '1000'))
+    retention = float(os.getenv('BATTLE_JOB_RETENTION', '600'))
+    if os.getenv('BATTLE_QUEUE', 'memory') == 'sqlite':
+        path = os.getenv('BATTLE_QUEUE_PATH', '/tmp/knightclub-battles.sqlite3')
+        return SQLiteBattleQueue(path, maxsize=maxsize, retention=retention)
+    return InProcessBattleQueue(maxsize=maxsize, retention=retention)
@@ -0,0 +1,74 @@
+# Small in-process caches for Knight Club
+import threading
+import time
+
+
+class CachedValue:
+    """
+    A single value that is recomputed at most once per `ttl` seconds.
+
+    Refreshes are single-flight: when the value is stale, the first caller
+    runs `loader` while concurrent callers either get the previous value
+    (if there is one) or wait for that refresh to finish, so a burst of
+    requests triggers one recompute instead of one each.
+    """
+
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self._cond = threading.Condition()
+        self._value = None
+        self._has_value = False
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._generation = 0
+        self.hits = 0
+        self.refreshes = 0
+
+    def get(self):
+        with self._cond:
+            while True:
+                if self._has_value and time.monotonic() < self._expires_at:
+                    self.hits += 1
+                    return self._value
+                if not self._refreshing:
+                    self._refreshing = True
+                    generation = self._generation
+                    break
+                if self._has_value:
+                    # Someone is already refreshing; serve the previous value meanwhile
+                    self.hits += 1
+                    return self._value
+                self._cond.wait()
+
+        try:
+            value = self.loader()
+        except Exception:
+            with self._cond:
+                self._refreshing = False
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._value = value
+            self._has_value = True
+            self.refreshes += 1
+            # If invalidated while loading, the result may already be stale
+            if generation == self._generation:
+                self._expires_at = time.monotonic() + self.ttl
+            else:
+                self._expires_at = 0.0
+            self._refreshing = False
+            self._cond.notify_all()
+        return value
+
+    def peek(self):
+        """The current value (possibly stale) without loading, or None."""
+        with self._cond:
+            return self._value if self._has_value else None
+
+    def invalidate(self):
+        """Force the next get() to recompute."""
+        with self._cond:
+            self._expires_at = 0.0
+            self._generation += 1
@@ -0,0 +1,108 @@
+# HTTP-cacheable catalog documents for Knight Club
+#
+# Item, shop and monster definitions only change with a deploy (or, for
+# monsters, a data file reload), so each is serialized once into a
+# CatalogDocument: the JSON body plus a content hash used as its version and
+# ETag. Clients fetch GET /api/catalog for the current versions, then
+# /api/catalog/<name>?v=<version>, which can be cached forever because a new
+# version means a new URL. Unversioned requests get a short max-age and are
+# revalidated with If-None-Match.
+import hashlib
+import json
+import os
+
+from items import CATALOG
+
+# Seconds clients may reuse an unversioned catalog response before revalidating
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '300'))
+# Versioned URLs never change content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# What the shop sells: item id, price in gold and the shop's blurb
+SHOP = (
+    {'id': 501, 'price': 100, 'description': 'Restores 25 HP when consumed'},
+)
+SHOP_PRICES = {entry['id']: entry['price'] for entry in SHOP}
+
+
+class CatalogDocument:
+    """A serialized catalog payload with its content-hash version."""
+
+    def __init__(self, payload, key=None):
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        self.version = hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+        if key is not None:
+            # Carry the version inside the document too, for clients that store it
+            body = json.dumps({'version': self.version, key: payload}, sort_keys=True, separators=(',', ':'))
+        self.body = body.encode('utf-8')
+
+
+def item_payload(record):
+    item = {
+        'name': record.name,
+        'type': record.type,
+        'stackable': record.stackable,
+        'slot': record.slot,
+        'stats': dict(record.stats),
+        'rarity': record.rarity,
+        'tier': record.tier,
+        'description': record.description,
+        'sell_price': record.sell_price,
+    }
+    if record.effect is not None:
+        item['effect'] = dict(record.effect)
+    return item
+
+
+def shop_payload():
+    """The shop list as GET /api/shop/items has always returned it."""
+    items = []
+    for entry in SHOP:
+        record = CATALOG.get(entry['id'])
+        items.append({
+            'id': entry['id'],
+            'name': record.name,
+            'description': entry.get('description', record.description),
+            'price': entry['price'],
+            'type': record.type,
+        })
+    return items
+
+
+def monster_payload(roster):
+    return {
+        tier: [
+            {
+                'index': index,
+                'name': monster.name,
+                'hp': monster.hp,
+                'attack': monster.attack,
+                'defense': monster.defense,
+                'agility': monster.agility,
+                'xp_reward': monster.xp_reward,
+                'gold_drop': list(monster.gold_drop),
+                'loot': [{'id': item_id, 'chance': chance} for item_id, chance in monster.loot_table],
+            }
+            for index, monster in enumerate(monsters)
+        ]
+        for tier, monsters in roster.tiers.items()
+    }
+
+
+# Built once at import, like the item catalog itself
+ITEMS_DOCUMENT = CatalogDocument({str(item_id): item_payload(record)
+                                  for item_id, record in CATALOG.records.items()}, key='items')
+SHOP_DOCUMENT = CatalogDocument(shop_payload(), key='items')
+SHOP_LIST_DOCUMENT = CatalogDocument(shop_payload())
+
+_monsters = (None, None)  # (roster, document) for the last roster served
+
+
+def monsters_document(roster):
+    """The document for a monster roster, rebuilt only when the registry swaps rosters."""
+    global _monsters
+    cached_roster, document = _monsters
+    if cached_roster is not roster:
+        document = CatalogDocument(monster_payload(roster), key='tiers')
+        _monsters = (roster, document)
+    return document
@@ -0,0 +1,265 @@
+# Database connection pooling for Knight Club
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class InstrumentedCursor:
+    """
+    Cursor wrapper that times each statement and reports it to the pool's
+    query listeners. A statement that returns rows is reported once they are
+    read (fetchone/fetchmany/fetchall, or close), so the row count is known
+    and the time includes fetching them. Everything else is delegated.
+    """
+
+    def __init__(self, cursor, listeners):
+        self._cursor = cursor
+        self._listeners = listeners
+        self._pending = None  # (statement, started) awaiting a fetch
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _report(self, statement, started):
+        duration = time.perf_counter() - started
+        rows = self._cursor.rowcount
+        for listener in self._listeners:
+            listener(statement, duration, rows)
+
+    def _finish(self):
+        if self._pending is not None:
+            statement, started = self._pending
+            self._pending = None
+            self._report(statement, started)
+
+    def _timed(self, method, statement, params):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            result = method(statement, params)
+        except Exception:
+            self._report(statement, started)
+            raise
+        if getattr(self._cursor, 'with_rows', False):
+            self._pending = (statement, started)
+        else:
+            self._report(statement, started)
+        return result
+
+    def execute(self, statement, params=None):
+        return self._timed(self._cursor.execute, statement, params)
+
+    def executemany(self, statement, seq_params):
+        return self._timed(self._cursor.executemany, statement, seq_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._finish()
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a MySQL connection checked out of a pool.
+    Calling close() hands the connection back to the pool instead of
+    tearing down the socket. Everything else is delegated to the real
+    connection, so handlers use it exactly like mysql.connector's.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise mysql.connector.InterfaceError('Connection already returned to pool')
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise mysql.connector.InterfaceError('Connection already returned to pool')
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._pool.query_listeners:
+            return InstrumentedCursor(cursor, self._pool.query_listeners)
+        return cursor
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def close(self):
+        """Return the connection to the pool. Safe to call more than once."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of MySQL connections.
+
+    - At most `size` connections are ever open at once.
+    - get_connection() blocks up to `timeout` seconds when every connection
+      is checked out, then raises PoolExhaustedError.
+    - Connections idle for longer than `idle_check` seconds are pinged
+      before being handed out and transparently replaced if dead.
+    - Functions in `query_listeners` are called as
+      listener(statement, duration_seconds, rowcount) after every statement.
+    """
+
+    def __init__(self, size=10, timeout=5.0, idle_check=30.0, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._connect_kwargs = connect_kwargs
+        self.query_listeners = []
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw_connection, returned_at), most recent last
+        self._open = 0
+        self._waiting = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connects': 0,
+            'health_check_failures': 0,
+            'discarded': 0,
+            'peak_in_use': 0,
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self._connect_kwargs)
+        with self._cond:
+            self._stats['connects'] += 1
+        return raw
+
+    def _is_healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except mysql.connector.Error:
+            pass
+
+    def get_connection(self):
+        """Check out a connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    raw, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f'No database connection available after {self.timeout}s '
+                        f'({self.size} in use)'
+                    )
+                self._stats['waits'] += 1
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._stats['checkouts'] += 1
+            in_use = self._open - len(self._idle)
+            if in_use > self._stats['peak_in_use']:
+                self._stats['peak_in_use'] = in_use
+
+        # Network work happens outside the lock
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif time.monotonic() - returned_at > self.idle_check and not self._is_healthy(raw):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._discard(raw)
+                raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def _release(self, raw):
+        """Put a connection back in the pool, rolling back any open transaction."""
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._open -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+
+        if not healthy:
+            self._discard(raw)
+
+    def stats(self):
+        """Snapshot of pool usage and saturation counters."""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._open - idle,
+                'idle': idle,
+                'waiting': self._waiting,
+                **self._stats,
+            }
+
+
+def pool_from_env():
+    """Build the application's connection pool from DB_* environment variables."""
+    return ConnectionPool(
+        size=int(os.getenv('DB_POOL_SIZE', '10')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+        idle_check=float(os.getenv('DB_POOL_IDLE_CHECK', '30')),
+        host=os.getenv('DB_HOST', 'mysql'),
+        port=int(os.getenv('DB_PORT', '3306')),
+        database=os.getenv('DB_NAME', 'knightclub'),
+        user=os.getenv('DB_USER', 'app'),
+        password=os.getenv('DB_PASSWORD', 'password')
+    )
@@ -0,0 +1,106 @@
+# Multi-battle grinding for Knight Club
+#
+# POST /api/battle/grind fights up to N battles in a row against one
+# difficulty tier. The series is resolved here entirely in memory: each
+# battle uses the knight's HP, level and XP left by the previous one, and the
+# loot for all victories over a monster is rolled in one LootTable call. The
+# endpoint then writes the combined effect in a single transaction.
+import os
+from collections import namedtuple
+
+from battle import cached_simulate_battle, pack_battle
+from monsters import get_monster
+
+# Upper bound on battles per grind request
+GRIND_MAX_BATTLES = int(os.getenv('GRIND_MAX_BATTLES', '100'))
+
+# Why a series ended
+STOP_COMPLETED = 'completed'  # fought every requested battle
+STOP_DIED = 'died'            # the knight fell (defeat or draw)
+STOP_HP_FLOOR = 'hp_floor'    # HP reached the requested floor
+
+# One battle of a series, as recorded in the history
+GrindBattle = namedtuple('GrindBattle', 'monster result hp_before hp_after xp_gained gold items replay')
+
+
+class GrindResult:
+    """Outcome of fight_series(): the battles fought and the knight's final state."""
+
+    def __init__(self, battles, stopped, hp, alive, exp, level):
+        self.battles = battles
+        self.stopped = stopped
+        self.hp = hp
+        self.alive = alive
+        self.exp = exp
+        self.level = level
+
+    def count(self, result):
+        return sum(1 for battle in self.battles if battle.result == result)
+
+    @property
+    def xp_gained(self):
+        return sum(battle.xp_gained for battle in self.battles)
+
+    @property
+    def gold(self):
+        return sum(battle.gold for battle in self.battles)
+
+    def item_counts(self):
+        """{item_id: count} over every victory, in first-drop order."""
+        counts = {}
+        for battle in self.battles:
+            for item_id in battle.items:
+                counts[item_id] = counts.get(item_id, 0) + 1
+        return counts
+
+    def monster_counts(self):
+        counts = {}
+        for battle in self.battles:
+            counts[battle.monster.name] = counts.get(battle.monster.name, 0) + 1
+        return counts
+
+
+def fight_series(knight_data, difficulty, max_battles, hp_floor=0):
+    """
+    Fight up to max_battles random monsters of a tier, stopping early when the
+    knight dies or its HP is at or below hp_floor. knight_data is the row
+    run_battle() loads (with regenerated current_hp) and is not modified.
+    """
+    knight = dict(knight_data)
+    fought = []  # (monster, simulate_battle result, hp_before, replay)
+    stopped = STOP_COMPLETED
+
+    for _ in range(max_battles):
+        if knight['current_hp'] <= max(hp_floor, 0):
+            stopped = STOP_HP_FLOOR
+            break
+        monster = get_monster(difficulty)
+        outcome = cached_simulate_battle(knight, monster, log_detail='none')
+        fought.append((monster, outcome, knight['current_hp'], pack_battle(knight, monster)))
+
+        knight['current_hp'] = outcome['knight_hp']
+        if outcome['result'] != 'victory':
+            knight['is_alive'] = outcome['knight_alive']
+            stopped = STOP_DIED
+            break
+        knight['exp'] += outcome['xp_gained']
+        knight['level'] = (knight['exp'] // 100) + 1  # Level up every 100 XP
+
+    # Roll every victory's loot against a monster in one batch, in battle order
+    loot = {}
+    for monster, outcome, _, _ in fought:
+        if outcome['result'] == 'victory':
+            loot.setdefault(monster.name, [monster, 0])[1] += 1
+    rolls = {}
+    for name, (monster, victories) in loot.items():
+        gold, drops = monster.loot.roll_many(victories)
+        rolls[name] = iter(zip(gold.tolist(), (monster.loot.item_ids[row].tolist() for row in drops)))
+
+    battles = []
+    for monster, outcome, hp_before, replay in fought:
+        gold, items = next(rolls[monster.name]) if outcome['result'] == 'victory' else (0, [])
+        battles.append(GrindBattle(monster, outcome['result'], hp_before, outcome['knight_hp'],
+                                   outcome['xp_gained'], gold, items, replay))
+
+    return GrindResult(battles, stopped, knight['current_hp'], bool(knight['is_alive']),
+                       knight['exp'], knight['level'])
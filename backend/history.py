@@ -0,0 +1,86 @@
+# Battle history for Knight Club
+#
+# Every battle appends one row to `battles`. Instead of the log text, the row
+# keeps the packed battle inputs (battle.pack_battle, ~40 bytes); the log is
+# rebuilt on demand by replaying them, since battles are deterministic.
+from datetime import datetime
+
+from battle import pack_battle, replay_battle
+
+# Page size limits for GET /api/knights/<id>/battles
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def record_battle(cursor, knight_data, monster, difficulty, battle_result, gold_gained=0):
+    """Append a battle to the history, in the caller's transaction."""
+    cursor.execute("""
+        INSERT INTO battles
+            (knight_id, monster_name, difficulty, outcome, hp_before, hp_after, exp_gained, gold_gained, replay)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        knight_data['id'], monster.name, difficulty, battle_result['result'],
+        knight_data['current_hp'], battle_result['knight_hp'],
+        battle_result['xp_gained'], gold_gained,
+        pack_battle(knight_data, monster)
+    ))
+
+def record_battles(cursor, knight_id, difficulty, battles):
+    """Append a grind's battles (grind.GrindBattle) in one multi-row INSERT, in the caller's transaction."""
+    if not battles:
+        return
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(battles))
+    params = []
+    for battle in battles:
+        params.extend((knight_id, battle.monster.name, difficulty, battle.result,
+                       battle.hp_before, battle.hp_after, battle.xp_gained, battle.gold, battle.replay))
+    cursor.execute(f"""
+        INSERT INTO battles
+            (knight_id, monster_name, difficulty, outcome, hp_before, hp_after, exp_gained, gold_gained, replay)
+        VALUES {placeholders}
+    """, params)
+
+def encode_cursor(row):
+    """Opaque keyset cursor pointing just past `row`."""
+    return f"{row['created_at'].isoformat()}_{row['id']}"
+
+def decode_cursor(cursor_value):
+    """(created_at, id) from encode_cursor(); raises ValueError if malformed."""
+    created_at, _, battle_id = cursor_value.rpartition('_')
+    return datetime.fromisoformat(created_at), int(battle_id)
+
+def list_battles(cursor, knight_id, knight_name, limit=DEFAULT_PAGE_SIZE, after=None, log_detail='none'):
+    """
+    One page of a knight's battles, newest first, via idx_battles_knight_created.
+    `after` is a decoded cursor from a previous page. Returns (battles, next_cursor).
+    """
+    query = """
+        SELECT id, monster_name, difficulty, outcome, hp_before, hp_after,
+               exp_gained, gold_gained, replay, created_at
+        FROM battles
+        WHERE knight_id = %s
+    """
+    params = [knight_id]
+    if after is not None:
+        created_at, battle_id = after
+        query += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+        params.extend([created_at, created_at, battle_id])
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    # One extra row tells us whether there is another page
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    battles = []
+    for row in rows:
+        replay = bytes(row.pop('replay'))
+        if log_detail == 'events':
+            row['events'] = replay_battle(replay, knight_name, row['monster_name'], log_detail='events')['events']
+        elif log_detail != 'none':
+            row['log'] = replay_battle(replay, knight_name, row['monster_name'], log_detail=log_detail)['log']
+        battles.append(row)
+
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+    return battles, next_cursor
@@ -0,0 +1,149 @@
+# Inventory writes for Knight Club
+#
+# Stackable items are kept in one row per knight, keyed by stack_item_id. After
+# applying migration-add-inventory-stack-key.sql, merge the stacks that existed
+# before the key with:
+#
+#   python inventory.py          # report stacks that need merging
+#   python inventory.py --fix    # ...and merge them
+import sys
+
+from items import CATALOG
+
+def grant_items(cursor, knight_id, grants):
+    """
+    Add items to a knight's inventory in at most two statements.
+
+    grants is a list of (item_id, quantity) pairs; repeated ids are summed and
+    unknown ids are skipped. Stackable items go through one upsert on the
+    (knight_id, stack_item_id) unique key, so concurrent grants land on the
+    same stack. Non-stackable items get one row per unit from a single
+    multi-row INSERT. Returns the number of units granted.
+    """
+    totals = {}
+    for item_id, quantity in grants:
+        if item_id in CATALOG and quantity > 0:
+            totals[item_id] = totals.get(item_id, 0) + quantity
+
+    stack_rows = []
+    unit_rows = []
+    for item_id, quantity in totals.items():
+        if CATALOG.get(item_id).stackable:
+            stack_rows.append((knight_id, item_id, quantity, item_id))
+        else:
+            unit_rows.extend([(knight_id, item_id)] * quantity)
+
+    if stack_rows:
+        placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(stack_rows))
+        cursor.execute(f"""
+            INSERT INTO inventory (knight_id, item_id, quantity, stack_item_id)
+            VALUES {placeholders} AS new
+            ON DUPLICATE KEY UPDATE quantity = quantity + new.quantity
+        """, [value for row in stack_rows for value in row])
+
+    if unit_rows:
+        placeholders = ', '.join(['(%s, %s, 1)'] * len(unit_rows))
+        cursor.execute(f"""
+            INSERT INTO inventory (knight_id, item_id, quantity)
+            VALUES {placeholders}
+        """, [value for row in unit_rows for value in row])
+
+    return sum(totals.values())
+
+def sell_items(cursor, knight_id, item_ids, inventory_ids=None):
+    """
+    Sell a knight's unequipped items whose item_id is in item_ids (optionally
+    only the given inventory rows) in set-based statements: lock the knight
+    and read its owner, lock and count the rows, delete them, credit the
+    owner's gold. Prices come from the item catalog. Run inside the caller's
+    transaction; returns (items_sold, gold).
+    """
+    if not item_ids or inventory_ids == []:
+        return 0, 0
+
+    # Gold goes to whoever owns the knight, read under the same lock battles take
+    cursor.execute("SELECT user_id FROM knights WHERE id = %s FOR UPDATE", (knight_id,))
+    knight = cursor.fetchone()
+    if not knight:
+        return 0, 0
+
+    conditions = "knight_id = %s AND is_equipped = FALSE AND item_id IN ({})".format(
+        ', '.join(['%s'] * len(item_ids)))
+    params = [knight_id, *item_ids]
+    if inventory_ids is not None:
+        conditions += " AND id IN ({})".format(', '.join(['%s'] * len(inventory_ids)))
+        params.extend(inventory_ids)
+
+    # Lock the rows being sold so the count and the delete agree
+    cursor.execute(f"""
+        SELECT item_id, COUNT(*) AS count
+        FROM inventory
+        WHERE {conditions}
+        GROUP BY item_id
+        FOR UPDATE
+    """, params)
+    counts = cursor.fetchall()
+    if not counts:
+        return 0, 0
+
+    items_sold = sum(row['count'] for row in counts)
+    total_gold = sum(CATALOG.get(row['item_id']).sell_price * row['count'] for row in counts)
+
+    cursor.execute(f"DELETE FROM inventory WHERE {conditions}", params)
+    cursor.execute("""
+        UPDATE users
+        SET gold = gold + %s
+        WHERE id = %s
+    """, (total_gold, knight['user_id']))
+
+    return items_sold, total_gold
+
+def find_unmerged_stacks(cursor):
+    """
+    Stackable items a knight holds in several rows, or in a row without its
+    stack key. Item ids come from the catalog. Returns a list of
+    (knight_id, item_id, keep_id, total_quantity), keep_id being the oldest row.
+    """
+    stackable = CATALOG.stackable_ids()
+    if not stackable:
+        return []
+    cursor.execute("""
+        SELECT knight_id, item_id, MIN(id) AS keep_id, SUM(quantity) AS total
+        FROM inventory
+        WHERE is_equipped = FALSE AND item_id IN ({})
+        GROUP BY knight_id, item_id
+        HAVING COUNT(*) > 1 OR SUM(stack_item_id IS NULL) > 0
+    """.format(', '.join(['%s'] * len(stackable))), stackable)
+    return [(row['knight_id'], row['item_id'], row['keep_id'], int(row['total'])) for row in cursor.fetchall()]
+
+def merge_stacks(cursor):
+    """Fold each unmerged stack into its oldest row and key it. Safe to re-run; returns the stacks merged."""
+    stacks = find_unmerged_stacks(cursor)
+    if stacks:
+        # Drop the extra rows first so keying the kept row can't collide with one of them
+        cursor.executemany("""
+            DELETE FROM inventory
+            WHERE knight_id = %s AND item_id = %s AND is_equipped = FALSE AND id <> %s
+        """, [(knight_id, item_id, keep_id) for knight_id, item_id, keep_id, _ in stacks])
+        cursor.executemany("""
+            UPDATE inventory
+            SET quantity = %s, stack_item_id = item_id
+            WHERE id = %s
+        """, [(total, keep_id) for _, _, keep_id, total in stacks])
+    return stacks
+
+if __name__ == '__main__':
+    from db import pool_from_env
+
+    fix = '--fix' in sys.argv[1:]
+    conn = pool_from_env().get_connection()
+    cursor = conn.cursor(dictionary=True)
+    stacks = merge_stacks(cursor) if fix else find_unmerged_stacks(cursor)
+    for knight_id, item_id, keep_id, total in stacks:
+        print(f"knight {knight_id}: item {item_id} -> row {keep_id}, quantity {total}")
+    if fix:
+        conn.commit()
+    print(f"{len(stacks)} stack(s) {'merged' if fix else 'to merge'}")
+    cursor.close()
+    conn.close()
+    sys.exit(1 if stacks and not fix else 0)
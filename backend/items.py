@@ -1,4 +1,6 @@
 # Item definitions for Knight Club
+from collections import namedtuple
+from types import MappingProxyType
 
 ITEMS = {
     # Materials (stackable)
@@ -243,4 +245,139 @@ def get_item(item_id):
 
 def get_items_by_type(item_type):
     """Get all items of a specific type."""
-    return {k: v for k, v in ITEMS.items() if v['type'] == item_type}
+    return {k: ITEMS[k] for k in CATALOG.by_type.get(item_type, ())}
+
+# Item tier by id range (2xx = wooden, 3xx = stone, ...)
+TIERS = {
+    1: 'material',
+    2: 'wooden',
+    3: 'stone',
+    4: 'iron',
+    5: 'consumable',
+}
+
+# Gold paid for selling one item, by tier (an item may set its own "sell_price")
+TIER_SELL_PRICES = {
+    'wooden': 10,
+    'stone': 40,
+    'iron': 100,
+}
+DEFAULT_SELL_PRICE = 5
+
+# Compact, read-only view of an item definition
+ItemRecord = namedtuple('ItemRecord', [
+    'id', 'name', 'type', 'stackable', 'slot', 'stats', 'rarity', 'tier', 'description', 'effect',
+    'sell_price'
+])
+
+class ItemCatalog:
+    """
+    Item definitions compiled once into immutable records, lookup indexes and
+    ready-made response fragments.
+
+    The *_list() helpers turn inventory rows into the JSON shapes the API
+    returns by merging a row's few per-row fields into a prebuilt fragment,
+    instead of re-reading the item definition field by field for every row.
+    """
+
+    def __init__(self, items):
+        self.records = {}
+        self.by_slot = {}
+        self.by_type = {}
+        self.by_rarity = {}
+        self.by_tier = {}
+        self._equipment_fragments = {}
+        self._detail_fragments = {}
+
+        for item_id in sorted(items):
+            item_def = items[item_id]
+            tier = TIERS.get(item_id // 100, 'special')
+            record = ItemRecord(
+                id=item_id,
+                name=item_def['name'],
+                type=item_def['type'],
+                stackable=item_def['stackable'],
+                slot=item_def.get('slot'),
+                stats=MappingProxyType(dict(item_def.get('stats', {}))),
+                rarity=item_def.get('rarity', 'common'),
+                tier=tier,
+                description=item_def.get('description', ''),
+                effect=MappingProxyType(dict(item_def['effect'])) if 'effect' in item_def else None,
+                sell_price=item_def.get('sell_price', TIER_SELL_PRICES.get(tier, DEFAULT_SELL_PRICE)),
+            )
+            self.records[item_id] = record
+
+            for index, key in ((self.by_slot, record.slot), (self.by_type, record.type),
+                               (self.by_rarity, record.rarity), (self.by_tier, record.tier)):
+                if key is not None:
+                    index.setdefault(key, []).append(item_id)
+
+            # Shapes used by get_knight / equip_item and by get_inventory
+            self._equipment_fragments[item_id] = {
+                'item_id': item_id,
+                'name': record.name,
+                'slot': record.slot,
+                'stats': dict(record.stats),
+                'type': record.type
+            }
+            self._detail_fragments[item_id] = {
+                'name': record.name,
+                'type': record.type,
+                'stackable': record.stackable,
+                'stats': dict(record.stats),
+                'slot': record.slot,
+                'rarity': record.rarity,
+                'description': record.description
+            }
+
+        for index in (self.by_slot, self.by_type, self.by_rarity, self.by_tier):
+            for key in index:
+                index[key] = tuple(index[key])
+
+    def __contains__(self, item_id):
+        return item_id in self.records
+
+    def get(self, item_id):
+        """ItemRecord for an id, or None."""
+        return self.records.get(item_id)
+
+    def stackable_ids(self):
+        """Ids of stackable items (materials, consumables), which live in one row per knight."""
+        return [item_id for item_id, record in self.records.items() if record.stackable]
+
+    def sellable_ids(self, tier=None, slot=None):
+        """Ids of equipment (non-stackable) items, optionally narrowed to a tier and/or slot."""
+        return [
+            item_id for item_id, record in self.records.items()
+            if not record.stackable
+            and (tier is None or record.tier == tier)
+            and (slot is None or record.slot == slot)
+        ]
+
+    def equipment_list(self, rows):
+        """Equipped rows (id, item_id) as the knight's 'equipment' list."""
+        fragments = self._equipment_fragments
+        return [
+            {'inventory_id': row['id'], **fragments[row['item_id']]}
+            for row in rows if row['item_id'] in fragments
+        ]
+
+    def inventory_list(self, rows):
+        """Inventory rows (id, item_id, quantity, is_equipped) as the knight's 'inventory' list."""
+        fragments = self._equipment_fragments
+        return [
+            {'inventory_id': row['id'], **fragments[row['item_id']],
+             'quantity': row['quantity'], 'is_equipped': row['is_equipped']}
+            for row in rows if row['item_id'] in fragments
+        ]
+
+    def inventory_detail_list(self, rows):
+        """Inventory rows with every item field, as returned by /api/inventory."""
+        fragments = self._detail_fragments
+        return [
+            {**row, **fragments[row['item_id']]}
+            for row in rows if row['item_id'] in fragments
+        ]
+
+# Built once at import; item definitions only change between deploys
+CATALOG = ItemCatalog(ITEMS)
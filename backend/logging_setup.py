@@ -0,0 +1,95 @@
+# Logging for Knight Club
+#
+# Request and battle-worker threads only put records on an in-memory queue;
+# a single background listener thread formats them and writes to stderr, so a
+# slow or contended stderr never stalls a request. Each record is one JSON
+# line; structured values go in `extra={'fields': {...}}`.
+#
+# Levels come from the environment:
+#
+#   LOG_LEVEL   level for everything (default INFO)
+#   LOG_LEVELS  per-subsystem overrides, e.g. "battle=DEBUG,db=WARNING"
+#               (logger names; werkzeug defaults to WARNING since requests
+#               already get their own access line)
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+DEFAULT_LOGGER_LEVELS = {'werkzeug': 'WARNING'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, plus any 'fields'."""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue a record with its message resolved; the listener does the formatting."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames alive; render them before they cross threads
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec):
+    """'battle=DEBUG,db=WARNING' -> {'battle': 'DEBUG', 'db': 'WARNING'}; bad entries are skipped."""
+    levels = {}
+    for part in (spec or '').split(','):
+        name, sep, level = part.partition('=')
+        name, level = name.strip(), level.strip().upper()
+        if sep and name and isinstance(logging.getLevelName(level), int):
+            levels[name] = level
+    return levels
+
+
+def configure_logging():
+    """Route all logging through a queue drained by a background thread (once per process)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(records))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    levels = dict(DEFAULT_LOGGER_LEVELS)
+    levels.update(parse_levels(os.getenv('LOG_LEVELS')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,74 @@
+# Compiled monster loot tables for Knight Club
+#
+# Each Monster compiles its gold range and (item_id, drop_chance) list once
+# into a LootTable. Every entry is an independent roll, exactly as before:
+# roll() does one battle with the `random` module, roll_many() does many
+# battles in one NumPy call for simulations and bulk fights.
+import logging
+import random
+
+import numpy as np
+
+from items import CATALOG
+
+logger = logging.getLogger(__name__)
+
+_rng = np.random.default_rng()
+
+
+class LootTable:
+    """A monster's gold range and independent item drops, ready to roll."""
+
+    def __init__(self, gold_drop, entries):
+        self.gold_min, self.gold_max = gold_drop
+        self.entries = tuple((item_id, drop_chance) for item_id, drop_chance in entries)
+        self.item_ids = np.array([item_id for item_id, _ in self.entries], dtype=np.int64)
+        self.chances = np.array([drop_chance for _, drop_chance in self.entries], dtype=np.float64)
+
+        # Response fragments for each droppable item, resolved once
+        self.fragments = {}
+        for item_id, _ in self.entries:
+            record = CATALOG.get(item_id)
+            if record:
+                self.fragments[item_id] = {'id': item_id, 'name': record.name}
+            else:
+                logger.warning('Loot item %s not found', item_id)
+
+    def roll(self, rng=None):
+        """One battle's loot: {'gold': int, 'items': [item_id, ...]} in table order (rng: a random.Random)."""
+        rng = rng or random
+        loot = {'gold': rng.randint(self.gold_min, self.gold_max), 'items': []}
+        for item_id, drop_chance in self.entries:
+            if rng.random() < drop_chance:
+                loot['items'].append(item_id)
+        return loot
+
+    def roll_many(self, n, rng=None):
+        """
+        Loot for n battles in one call. Returns (gold, drops): gold is an (n,)
+        array, drops an (n, len(entries)) bool array whose columns follow
+        self.entries / self.item_ids. rng is a numpy Generator.
+        """
+        rng = rng or _rng
+        gold = rng.integers(self.gold_min, self.gold_max, size=n, endpoint=True)
+        drops = rng.random((n, len(self.entries))) < self.chances
+        return gold, drops
+
+    def count_items(self, drops):
+        """{item_id: times dropped} from a roll_many() drops array (zero counts left out)."""
+        counts = {}
+        for item_id, count in zip(self.item_ids.tolist(), drops.sum(axis=0).tolist()):
+            if count:
+                counts[item_id] = counts.get(item_id, 0) + count
+        return counts
+
+    def roll_totals(self, n, rng=None):
+        """(total gold, {item_id: count}) won over n victories."""
+        gold, drops = self.roll_many(n, rng)
+        return int(gold.sum()), self.count_items(drops)
+
+    def describe(self, item_ids):
+        """[{'id', 'name'}] for dropped items; ids missing from the catalog are left out."""
+        fragments = self.fragments
+        return [fragments[item_id] for item_id in item_ids if item_id in fragments]
+
@@ -1,7 +1,44 @@
 # Monster definitions for Knight Club
+#
+# Monsters live in a JSON data file (monsters.json next to this module, or
+# MONSTERS_PATH) so they can be rebalanced without a new image. The file is
+# compiled into an immutable MonsterRoster with indexes by tier and name;
+# every lookup reads the current roster through one reference, and a watcher
+# thread swaps in a new roster when the file's mtime changes. A file that
+# fails to load or validate (check_monster) is logged and the previous roster
+# stays in service.
+#
+# In the cluster MONSTERS_PATH points into the optional `monster-data`
+# ConfigMap; update it with
+#
+#   kubectl create configmap monster-data --from-file=backend/monsters.json \
+#       -n knight-club --dry-run=client -o yaml | kubectl apply -f -
+import json
+import logging
+import os
 import random
+import threading
+import time
+from types import MappingProxyType
+
+from items import CATALOG
+from loot import LootTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MONSTERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monsters.json')
+MONSTERS_PATH = os.getenv('MONSTERS_PATH', DEFAULT_MONSTERS_PATH)
+# Seconds between checks of the data file for changes (0 disables reloading)
+MONSTERS_RELOAD_INTERVAL = float(os.getenv('MONSTERS_RELOAD_INTERVAL', '10'))
+
+DEFAULT_TIER = 'easy'
 
 class Monster:
+    """
+    A monster template. Shared by every battle against it, so never modified
+    after loading; `stats` and `loot` are precomputed.
+    """
+
     def __init__(self, name, hp, attack, defense, agility, xp_reward, gold_drop, loot_table):
         self.name = name
         self.hp = hp
@@ -10,9 +47,11 @@ class Monster:
         self.defense = defense
         self.agility = agility
         self.xp_reward = xp_reward
-        self.gold_drop = gold_drop  # (min, max) tuple
-        self.loot_table = loot_table  # List of (item_id, drop_chance) tuples
-    
+        self.gold_drop = tuple(gold_drop)  # (min, max) tuple
+        self.loot_table = tuple((item_id, drop_chance) for item_id, drop_chance in loot_table)
+        self.stats = (hp, attack, defense, agility, xp_reward)  # combat stats, as battles key them
+        self.loot = LootTable(self.gold_drop, self.loot_table)  # compiled once for rolling
+
     def to_dict(self):
         return {
             'name': self.name,
@@ -23,146 +62,132 @@ class Monster:
             'agility': self.agility
         }
 
-# Monster database - organized by difficulty
-MONSTERS = {
-    'easy': [
-        Monster(
-            name='Level 1 Slime',
-            hp=20,
-            attack=8,
-            defense=2,
-            agility=5,
-            xp_reward=10,
-            gold_drop=(1, 2),
-            loot_table=[
-                (101, 0.70),  # 70% Slime Residue
-                (201, 0.10),  # 10% Wooden Sword
-                (202, 0.10),  # 10% Wooden Shield
-                (203, 0.05),  # 5% Wooden Helmet
-                (204, 0.05),  # 5% Wooden Chest Armor
-                (205, 0.05),  # 5% Wooden Pants
-            ]
-        ),
-        Monster(
-            name='Giant Rat',
-            hp=30,
-            attack=10,
-            defense=3,
-            agility=8,
-            xp_reward=15,
-            gold_drop=(1, 3),
-            loot_table=[
-                (101, 0.40),  # 40% Slime Residue
-                (201, 0.15),  # 15% Wooden Sword
-                (206, 0.10),  # 10% Wooden Bow
-                (208, 0.10),  # 10% Wooden Dagger
-                (202, 0.10),  # 10% Wooden Shield
-                (205, 0.08),  # 8% Wooden Pants
-            ]
-        ),
-        Monster(
-            name='Weak Goblin',
-            hp=35,
-            attack=12,
-            defense=4,
-            agility=6,
-            xp_reward=20,
-            gold_drop=(1, 3),
-            loot_table=[
-                (102, 0.80),  # 80% Goblin Ear
-                (201, 0.15),  # 15% Wooden Sword
-                (207, 0.10),  # 10% Wooden Staff
-                (203, 0.08),  # 8% Wooden Helmet
-                (204, 0.08),  # 8% Wooden Chest Armor
-            ]
-        ),
-    ],
-    'medium': [
-        Monster(
-            name='Forest Wolf',
-            hp=60,
-            attack=18,
-            defense=6,
-            agility=12,
-            xp_reward=40,
-            gold_drop=(3, 6),
-            loot_table=[
-                (103, 0.75),  # 75% Wolf Fang
-                (301, 0.08),  # 8% Stone Sword (was 2%)
-                (302, 0.06),  # 6% Stone Axe (was 1.5%)
-                (303, 0.04),  # 4% Stone Shield (was 1%)
-            ]
-        ),
-        Monster(
-            name='Goblin Warrior',
-            hp=70,
-            attack=20,
-            defense=8,
-            agility=10,
-            xp_reward=50,
-            gold_drop=(3, 7),
-            loot_table=[
-                (102, 0.90),  # 90% Goblin Ear
-                (301, 0.10),  # 10% Stone Sword (was 2.5%)
-                (303, 0.08),  # 8% Stone Shield (was 2%)
-                (304, 0.06),  # 6% Stone Helmet (was 1.5%)
-                (305, 0.04),  # 4% Stone Chest Armor (was 1%)
-            ]
-        ),
-        Monster(
-            name='Troglodite',
-            hp=75,
-            attack=20,
-            defense=10,
-            agility=6,
-            xp_reward=55,
-            gold_drop=(4, 8),
-            loot_table=[
-                (302, 0.12),  # 12% Stone Axe (was 3%)
-                (301, 0.10),  # 10% Stone Sword (was 2.5%)
-                (305, 0.08),  # 8% Stone Chest Armor (was 2%)
-                (303, 0.06),  # 6% Stone Shield (was 1.5%)
-            ]
-        ),
-    ],
-    'hard': [
-        Monster(
-            name='Orc',
-            hp=120,
-            attack=28,
-            defense=15,
-            agility=8,
-            xp_reward=100,
-            gold_drop=(6, 12),
-            loot_table=[
-                (104, 0.80),  # 80% Orc Tusk
-                (401, 0.16),  # 16% Iron Sword (was 4%)
-                (402, 0.14),  # 14% Iron Axe (was 3.5%)
-                (403, 0.12),  # 12% Iron Shield (was 3%)
-                (404, 0.10),  # 10% Iron Helmet (was 2.5%)
-                (405, 0.10),  # 10% Iron Chest Armor (was 2.5%)
-                (406, 0.08),  # 8% Iron Pants (was 2%)
-            ]
-        ),
-        Monster(
-            name='Giant Spider',
-            hp=130,
-            attack=25,
-            defense=12,
-            agility=14,
-            xp_reward=110,
-            gold_drop=(7, 14),
-            loot_table=[
-                (105, 0.70),  # 70% Spider Silk
-                (406, 0.20),  # 20% Iron Pants
-                (410, 0.05),  # 5% Silk Cape
-                (401, 0.12),  # 12% Iron Sword
-                (403, 0.10),  # 10% Iron Shield
-                (404, 0.08),  # 8% Iron Helmet
+class MonsterRoster:
+    """Immutable set of monsters: a tuple per tier and a name index."""
+
+    def __init__(self, tiers, version=None):
+        self.tiers = MappingProxyType({tier: tuple(monsters) for tier, monsters in tiers.items()})
+        by_name = {}
+        for monsters in self.tiers.values():
+            for monster in monsters:
+                if monster.name in by_name:
+                    raise ValueError(f'Duplicate monster name {monster.name!r}')
+                by_name[monster.name] = monster
+        self.by_name = MappingProxyType(by_name)
+        self.version = version
+        if not self.tiers.get(DEFAULT_TIER):
+            raise ValueError(f'The {DEFAULT_TIER!r} tier must have at least one monster')
+        # Plain-dict twin of `tiers` for the hot path, empty tiers already resolved
+        self.default = self.tiers[DEFAULT_TIER]
+        self._lookup = {tier: monsters or self.default for tier, monsters in self.tiers.items()}
+
+    def tier(self, difficulty):
+        """Monsters of a tier; unknown or empty tiers fall back to the default tier."""
+        return self._lookup.get(difficulty, self.default)
+
+def check_monster(monster):
+    """
+    Raise ValueError if a monster would fail in battle: non-positive HP or
+    attack, negative stats, an empty gold range, or a loot entry that isn't a
+    catalog item or whose chance is outside [0, 1].
+    """
+    if monster.hp <= 0 or monster.attack <= 0:
+        raise ValueError(f'{monster.name}: hp and attack must be positive')
+    if monster.defense < 0 or monster.agility < 0 or monster.xp_reward < 0:
+        raise ValueError(f'{monster.name}: defense, agility and xp_reward must not be negative')
+    low, high = monster.gold_drop
+    if not 0 <= low <= high:
+        raise ValueError(f'{monster.name}: gold_drop must be [min, max] with 0 <= min <= max')
+    for item_id, chance in monster.loot_table:
+        if CATALOG.get(item_id) is None:
+            raise ValueError(f'{monster.name}: loot item {item_id} is not in the item catalog')
+        if not 0.0 <= chance <= 1.0:
+            raise ValueError(f'{monster.name}: drop chance {chance} for item {item_id} is outside [0, 1]')
+
+def parse_roster(data, version=None):
+    """Build a MonsterRoster from the data file's JSON; raises ValueError if it is malformed or invalid."""
+    try:
+        tiers = {
+            tier: [
+                Monster(
+                    name=entry['name'],
+                    hp=int(entry['hp']),
+                    attack=int(entry['attack']),
+                    defense=int(entry['defense']),
+                    agility=int(entry['agility']),
+                    xp_reward=int(entry['xp_reward']),
+                    gold_drop=(int(entry['gold_drop'][0]), int(entry['gold_drop'][1])),
+                    loot_table=[(int(item_id), float(chance)) for item_id, chance in entry.get('loot_table', [])],
+                )
+                for entry in entries
             ]
-        ),
-    ]
-}
+            for tier, entries in data['tiers'].items()
+        }
+    except (KeyError, TypeError, IndexError, ValueError) as e:
+        raise ValueError(f'Invalid monster data: {e!r}') from e
+    for monsters in tiers.values():
+        for monster in monsters:
+            check_monster(monster)
+    return MonsterRoster(tiers, version=version)
+
+def load_roster(path):
+    """Read and compile a monster data file."""
+    version = os.stat(path).st_mtime_ns
+    with open(path) as f:
+        data = json.load(f)
+    return parse_roster(data, version=version)
+
+class MonsterRegistry:
+    """
+    Holds the current MonsterRoster and reloads it when the data file changes.
+    If `path` doesn't exist (e.g. the ConfigMap isn't created), the bundled
+    file is served until it appears.
+    """
+
+    def __init__(self, path=MONSTERS_PATH, fallback=DEFAULT_MONSTERS_PATH, interval=MONSTERS_RELOAD_INTERVAL):
+        self.path = path
+        self.fallback = fallback
+        self.interval = interval
+        self.roster = load_roster(self._source())
+        self._source_path = self._source()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _source(self):
+        return self.path if os.path.exists(self.path) else self.fallback
+
+    def reload(self):
+        """Swap in the data file's roster if it changed; returns True if it did."""
+        with self._lock:
+            source = self._source()
+            try:
+                if source == self._source_path and os.stat(source).st_mtime_ns == self.roster.version:
+                    return False
+                roster = load_roster(source)
+            except (OSError, ValueError) as e:
+                logger.error('Keeping current monsters; failed to load %s: %s', source, e)
+                return False
+            self.roster = roster
+            self._source_path = source
+        logger.info('Loaded %d monsters from %s', len(roster.by_name), source)
+        return True
+
+    def start(self):
+        """Start the background watcher (once; no-op when reloading is disabled)."""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name='monster-reload', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.reload()
+
+registry = MonsterRegistry()
 
 def get_monster(difficulty='easy', index=None):
     """
@@ -170,13 +195,21 @@ def get_monster(difficulty='easy', index=None):
     If index is provided and valid, returns that specific monster.
     Otherwise returns a random monster from that difficulty tier.
     """
-    monsters = MONSTERS.get(difficulty, MONSTERS['easy'])
-    if not monsters:
-        return MONSTERS['easy'][0]  # Fallback to easy slime
-    
+    monsters = registry.roster.tier(difficulty)
+
     # If index is specified and valid, use it
     if index is not None and 0 <= index < len(monsters):
         return monsters[index]
-    
+
     # Otherwise, return a random monster from the tier
-    return random.choice(monsters)
+    return monsters[random.randrange(len(monsters))]
+
+def pick_monster(difficulty='easy'):
+    """A random monster of a tier and its index in it (for battle previews)."""
+    monsters = registry.roster.tier(difficulty)
+    index = random.randrange(len(monsters))
+    return index, monsters[index]
+
+def monster_by_name(name):
+    """The monster with this name, or None."""
+    return registry.roster.by_name.get(name)
@@ -0,0 +1,68 @@
+# Password hashing for Knight Club
+#
+# bcrypt is deliberately slow, so hashing and checking run on a small bounded
+# thread pool (bcrypt releases the GIL while it works) rather than directly on
+# the request thread. At most PASSWORD_WORKERS hashes run at once and at most
+# PASSWORD_QUEUE_MAX may be queued; beyond that, or after waiting
+# PASSWORD_TIMEOUT seconds, callers get PasswordQueueFullError instead of
+# piling up behind a login burst.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+# bcrypt work factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', '2'))
+PASSWORD_QUEUE_MAX = int(os.getenv('PASSWORD_QUEUE_MAX', '32'))
+PASSWORD_TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', '10'))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='bcrypt')
+_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_MAX)
+
+
+class PasswordQueueFullError(Exception):
+    """Raised when too many password operations are already waiting, or one timed out."""
+
+
+def _run(fn, *args):
+    """Run fn on the hashing pool and wait for its result."""
+    if not _slots.acquire(blocking=False):
+        raise PasswordQueueFullError('Too many logins in progress')
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is freed when the job finishes (or is cancelled), not when we stop
+    # waiting, so timed-out hashes still count against the bound
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=PASSWORD_TIMEOUT)
+    except FutureTimeoutError:
+        # Drop the job if it hasn't started yet; a running hash holds its slot until done.
+        # To callers a timeout is the pool being too busy, like a full queue
+        future.cancel()
+        raise PasswordQueueFullError('Password hashing timed out') from None
+
+
+def hash_password(password, rounds=None):
+    """bcrypt hash of a password at the configured work factor."""
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode('utf-8'), salt)
+
+
+def verify_password(password, password_hash):
+    """Check a password against a stored bcrypt hash."""
+    return _run(bcrypt.checkpw, password.encode('utf-8'), bytes(password_hash))
+
+
+def hash_rounds(password_hash):
+    """Work factor a bcrypt hash was made with ($2b$<rounds>$...)."""
+    return int(bytes(password_hash).split(b'$')[2])
+
+
+def needs_rehash(password_hash):
+    """True if a hash was made with a different work factor than BCRYPT_ROUNDS."""
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
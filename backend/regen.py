@@ -0,0 +1,32 @@
+# Lazy HP regeneration for Knight Club
+#
+# Living knights heal 1 HP every 15 minutes. Instead of a periodic UPDATE of
+# every knight, each row keeps the time its HP was last written
+# (knights.hp_updated_at) and the healed HP is worked out whenever the knight
+# is read. It is only persisted when HP changes for another reason.
+
+# Seconds per regenerated HP point
+REGEN_INTERVAL = 15 * 60
+
+# Seconds since the knight's HP was last written, for a knights row aliased k
+HP_ELAPSED_SQL = "TIMESTAMPDIFF(SECOND, k.hp_updated_at, NOW())"
+
+# Regenerated HP for a knights row aliased k (read-only twin of regen_hp())
+CURRENT_HP_SQL = (
+    "LEAST(k.max_hp, k.current_hp + IF(k.is_alive AND k.current_hp < k.max_hp, "
+    f"FLOOR(GREATEST({HP_ELAPSED_SQL}, 0) / {REGEN_INTERVAL}), 0))"
+)
+
+def regen_hp(current_hp, max_hp, elapsed, is_alive=True):
+    """
+    HP after `elapsed` seconds of regeneration from the stored current_hp.
+    Returns (hp, carry): carry is the seconds of progress toward the next
+    point, to be kept when this HP is written back (0 once at full HP).
+    """
+    if not is_alive or current_hp >= max_hp:
+        return current_hp, 0
+    ticks, carry = divmod(max(0, elapsed or 0), REGEN_INTERVAL)
+    hp = min(max_hp, current_hp + ticks)
+    if hp >= max_hp:
+        return hp, 0
+    return hp, carry
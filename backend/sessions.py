@@ -0,0 +1,98 @@
+# Signed session tokens for Knight Club
+#
+# /api/login issues a token carrying the user id and the ids of that user's
+# living knights:
+#
+#   base64url(json claims) "." base64url(HMAC-SHA256 of the claims part)
+#
+# Clients send it back as "Authorization: Bearer <token>" and ownership checks
+# are answered from the claims instead of a query on the knights table.
+# Tokens expire after SESSION_TTL seconds and are reissued whenever the set of
+# living knights changes (a knight is created or dies).
+#
+# SESSION_SECRET must be the same on every backend replica; without it each
+# process signs with its own random key and tokens only work on that process.
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = int(os.getenv('SESSION_TTL', '43200'))
+
+
+def _load_secret():
+    secret = os.getenv('SESSION_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    logger.warning("SESSION_SECRET is not set; session tokens will only be valid on this process")
+    return secrets.token_bytes(32)
+
+
+SESSION_SECRET = _load_secret()
+
+# Verified token claims; knight_ids is a frozenset of living knight ids
+Session = namedtuple('Session', 'user_id knight_ids expires_at')
+
+
+class InvalidTokenError(Exception):
+    """Raised for a session token that is malformed, tampered with or expired."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(SESSION_SECRET, payload.encode('ascii'), hashlib.sha256).digest()
+
+
+def issue_token(user_id, knight_ids, ttl=None):
+    """A signed token for user_id owning knight_ids, valid for ttl (default SESSION_TTL) seconds."""
+    claims = {
+        'uid': user_id,
+        'knights': sorted(set(knight_ids)),
+        'exp': int(time.time()) + (ttl or SESSION_TTL),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_b64encode(_sign(payload))}'
+
+
+def read_token(token):
+    """Verify a token and return its Session. Raises InvalidTokenError."""
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            raise InvalidTokenError('Bad session signature')
+        claims = json.loads(_b64decode(payload))
+        session = Session(int(claims['uid']), frozenset(claims['knights']), int(claims['exp']))
+    except (ValueError, TypeError, KeyError):
+        raise InvalidTokenError('Malformed session token')
+    if session.expires_at < time.time():
+        raise InvalidTokenError('Session expired')
+    return session
+
+
+def refresh_token(session, added=(), removed=()):
+    """A new token for the same user with knights added to / removed from the claims."""
+    return issue_token(session.user_id, (session.knight_ids | set(added)) - set(removed))
+
+
+def session_claims(session):
+    """A verified session as plain claims, for handing to a battle job instead of the token."""
+    return {'uid': session.user_id, 'knights': sorted(session.knight_ids), 'exp': session.expires_at}
+
+
+def session_from_claims(claims):
+    """The Session for session_claims() output; trusted as verified when it was made."""
+    return Session(int(claims['uid']), frozenset(claims['knights']), int(claims['exp']))
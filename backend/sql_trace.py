@@ -0,0 +1,102 @@
+# Opt-in per-request SQL tracing for Knight Club
+#
+# With tracing on, every statement a request (or battle job) runs is recorded
+# with its duration and row count. The request then gets an X-SQL-Trace
+# summary header and one log line on the "sql" logger, and statements that
+# ran several times with only their parameters changing are flagged as
+# likely N+1 patterns. Controlled by:
+#
+#   SQL_TRACE         off (default) | header (only requests sending
+#                     "X-SQL-Trace: 1") | all
+#   SQL_TRACE_REPEAT  executions of one statement shape that count as
+#                     repeated (default 2)
+import os
+import re
+from collections import namedtuple
+
+TRACE_MODES = ('off', 'header', 'all')
+TRACE_MODE = os.getenv('SQL_TRACE', 'off').lower()
+if TRACE_MODE not in TRACE_MODES:
+    TRACE_MODE = 'off'
+REPEAT_THRESHOLD = int(os.getenv('SQL_TRACE_REPEAT', '2'))
+
+TRACE_HEADER = 'X-SQL-Trace'
+
+TracedStatement = namedtuple('TracedStatement', 'statement duration rows')
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUE_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """
+    The shape of a statement: literals and placeholders become ?, and IN
+    lists / multi-row VALUES collapse, so executions that differ only in
+    parameters compare equal.
+    """
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode('utf-8', 'replace')
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _VALUE_LIST.sub('(...)', shape)
+    return _VALUE_ROWS.sub('(...)', shape)
+
+
+def tracing_enabled(header_value=None):
+    """Whether to trace a request that sent `header_value` in X-SQL-Trace."""
+    if TRACE_MODE == 'all':
+        return True
+    return TRACE_MODE == 'header' and header_value in ('1', 'true', 'yes')
+
+
+class QueryTrace:
+    """The statements run by one request or battle job."""
+
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement, duration, rows):
+        self.statements.append(TracedStatement(statement, duration, rows))
+
+    def repeated(self, threshold=None):
+        """[(shape, count, total_seconds)] for shapes run at least `threshold` times, most first."""
+        threshold = threshold or REPEAT_THRESHOLD
+        groups = {}
+        for traced in self.statements:
+            shape = normalize(traced.statement)
+            count, total = groups.get(shape, (0, 0.0))
+            groups[shape] = (count + 1, total + traced.duration)
+        found = [(shape, count, total) for shape, (count, total) in groups.items() if count >= threshold]
+        return sorted(found, key=lambda entry: (-entry[1], -entry[2]))
+
+    def summary(self):
+        return {
+            'queries': len(self.statements),
+            'time_ms': round(sum(t.duration for t in self.statements) * 1000, 2),
+            'rows': sum(max(t.rows, 0) for t in self.statements if t.rows is not None),
+            'repeated': [
+                {'statement': shape, 'count': count, 'time_ms': round(total * 1000, 2)}
+                for shape, count, total in self.repeated()
+            ],
+        }
+
+    def header_value(self, summary=None):
+        summary = summary or self.summary()
+        return (f"queries={summary['queries']}; time_ms={summary['time_ms']}; "
+                f"rows={summary['rows']}; repeated={len(summary['repeated'])}")
+
+    def log_fields(self, summary=None):
+        """Structured fields for the trace log line, including every statement."""
+        summary = summary or self.summary()
+        return {
+            **summary,
+            'statements': [
+                {'statement': normalize(t.statement), 'ms': round(t.duration * 1000, 3), 'rows': t.rows}
+                for t in self.statements
+            ],
+        }
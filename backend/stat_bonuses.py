@@ -0,0 +1,102 @@
+# Persisted equipment stat bonuses for Knight Club
+#
+# knights.attack_bonus / defense_bonus / agility_bonus hold the summed stats
+# of a knight's equipped items, so battles read one row instead of querying
+# the inventory. equip/unequip keep them current; this module can also
+# recompute them from the inventory (e.g. after item stats are rebalanced):
+#
+#   python stat_bonuses.py          # report knights whose bonuses are stale
+#   python stat_bonuses.py --fix    # ...and rewrite them
+import sys
+
+from items import CATALOG
+
+STATS = ('attack', 'defense', 'agility')
+
+def item_bonuses(item_id):
+    """(attack, defense, agility) granted by one item."""
+    record = CATALOG.get(item_id)
+    if not record:
+        return (0, 0, 0)
+    return tuple(record.stats.get(stat, 0) for stat in STATS)
+
+def equipment_bonuses(item_ids):
+    """Summed (attack, defense, agility) for a collection of equipped item ids."""
+    totals = [0, 0, 0]
+    for item_id in item_ids:
+        for i, value in enumerate(item_bonuses(item_id)):
+            totals[i] += value
+    return tuple(totals)
+
+def apply_bonus_delta(cursor, knight_id, added=(), removed=()):
+    """Adjust a knight's stored bonuses for items equipped (added) and unequipped (removed)."""
+    plus = equipment_bonuses(added)
+    minus = equipment_bonuses(removed)
+    delta = tuple(p - m for p, m in zip(plus, minus))
+    if delta == (0, 0, 0):
+        return
+    cursor.execute("""
+        UPDATE knights
+        SET attack_bonus = attack_bonus + %s,
+            defense_bonus = defense_bonus + %s,
+            agility_bonus = agility_bonus + %s
+        WHERE id = %s
+    """, (*delta, knight_id))
+
+def find_stale_bonuses(cursor, knight_id=None):
+    """
+    Compare stored bonuses with the equipped inventory.
+    Returns a list of (knight_id, stored, expected) for every mismatch.
+    """
+    query = """
+        SELECT k.id, k.attack_bonus, k.defense_bonus, k.agility_bonus, i.item_id
+        FROM knights k
+        LEFT JOIN inventory i ON i.knight_id = k.id AND i.is_equipped = TRUE
+    """
+    params = ()
+    if knight_id is not None:
+        query += " WHERE k.id = %s"
+        params = (knight_id,)
+    cursor.execute(query, params)
+
+    stored = {}
+    equipped = {}
+    for row in cursor.fetchall():
+        stored[row['id']] = (row['attack_bonus'], row['defense_bonus'], row['agility_bonus'])
+        items = equipped.setdefault(row['id'], [])
+        if row['item_id'] is not None:
+            items.append(row['item_id'])
+
+    stale = []
+    for kid, current in stored.items():
+        expected = equipment_bonuses(equipped[kid])
+        if current != expected:
+            stale.append((kid, current, expected))
+    return stale
+
+def rebuild_bonuses(cursor, knight_id=None):
+    """Rewrite stale bonuses from the inventory. Returns the mismatches that were fixed."""
+    stale = find_stale_bonuses(cursor, knight_id)
+    if stale:
+        cursor.executemany("""
+            UPDATE knights
+            SET attack_bonus = %s, defense_bonus = %s, agility_bonus = %s
+            WHERE id = %s
+        """, [(*expected, kid) for kid, _, expected in stale])
+    return stale
+
+if __name__ == '__main__':
+    from db import pool_from_env
+
+    fix = '--fix' in sys.argv[1:]
+    conn = pool_from_env().get_connection()
+    cursor = conn.cursor(dictionary=True)
+    stale = rebuild_bonuses(cursor) if fix else find_stale_bonuses(cursor)
+    for kid, current, expected in stale:
+        print(f"knight {kid}: stored {current}, expected {expected}")
+    if fix:
+        conn.commit()
+    print(f"{len(stale)} knight(s) {'fixed' if fix else 'out of date'}")
+    cursor.close()
+    conn.close()
+    sys.exit(1 if stale and not fix else 0)
@@ -0,0 +1,144 @@
+# Benchmark cases for Knight Club's pure-Python hot paths
+#
+# Each case builds its inputs once and returns a zero-argument callable that
+# does the work being measured. Nothing here touches the database: the
+# enrichment cases feed the same row shapes the handlers get from MySQL.
+import datetime
+import random
+
+from battle import simulate_battle
+from items import CATALOG
+from monsters import Monster, get_monster, monster_by_name
+from stat_bonuses import equipment_bonuses
+
+# Full sets per tier, equipped in distinct slots
+STONE_SET = (301, 302, 303, 304, 305)
+IRON_SET = (401, 402, 403, 404, 405, 406)
+
+CASES = {}
+
+
+def case(name):
+    def register(factory):
+        CASES[name] = factory
+        return factory
+    return register
+
+
+def knight(level=1, hp=100, gear=()):
+    """Knight row as the battle handler loads it, with bonuses for `gear`."""
+    attack, defense, agility = equipment_bonuses(gear)
+    return {
+        'id': 1, 'user_id': 1, 'name': 'Sir Bench', 'class': 'knight',
+        'level': level, 'exp': (level - 1) * 100, 'current_hp': hp, 'max_hp': 100, 'is_alive': True,
+        'attack_bonus': attack, 'defense_bonus': defense, 'agility_bonus': agility,
+    }
+
+
+def monster(name):
+    return monster_by_name(name)
+
+
+def _battle(knight_data, monster_name, log_detail):
+    target = monster(monster_name)
+    return lambda: simulate_battle(knight_data, target, log_detail=log_detail)
+
+
+# Battles: the extremes of the roster and every log detail level
+for _detail in ('none', 'events', 'summary', 'full'):
+    case(f'battle.naked_l1_vs_slime.{_detail}')(
+        lambda d=_detail: _battle(knight(), 'Level 1 Slime', d))
+case('battle.stone_l5_vs_troglodite.full')(
+    lambda: _battle(knight(level=5, gear=STONE_SET), 'Troglodite', 'full'))
+case('battle.iron_l10_vs_orc.full')(
+    lambda: _battle(knight(level=10, gear=IRON_SET), 'Orc', 'full'))
+case('battle.iron_l10_vs_orc.none')(
+    lambda: _battle(knight(level=10, gear=IRON_SET), 'Orc', 'none'))
+# Lopsided loss: the knight chips 1 HP a turn and falls on turn 7
+case('battle.naked_l1_vs_spider.full')(
+    lambda: _battle(knight(), 'Giant Spider', 'full'))
+
+
+# No roster fight gets near MAX_TURNS, so the longest log needs a dummy that
+# neither side can kill in time
+TRAINING_DUMMY = Monster('Training Dummy', 1000, 1, 99, 1, 0, (0, 0), [])
+
+
+@case('battle.naked_l1_vs_dummy.full')
+def battle_timeout():
+    knight_data = knight()
+    return lambda: simulate_battle(knight_data, TRAINING_DUMMY, log_detail='full')
+
+
+@case('loot.slime')
+def loot_slime():
+    from app import generate_loot
+    target = monster('Level 1 Slime')
+    return lambda: generate_loot(target)
+
+
+@case('loot.spider')
+def loot_spider():
+    from app import generate_loot
+    target = monster('Giant Spider')
+    return lambda: generate_loot(target)
+
+
+@case('loot.spider.roll_many_1000')
+def loot_spider_batch():
+    import numpy as np
+    target = monster('Giant Spider')
+    rng = np.random.default_rng(2026)
+    return lambda: target.loot.roll_totals(1000, rng)
+
+
+@case('monsters.get_monster.random')
+def get_monster_random():
+    return lambda: get_monster('medium')
+
+
+@case('monsters.get_monster.indexed')
+def get_monster_indexed():
+    return lambda: get_monster('hard', index=1)
+
+
+def inventory_rows(count, equipped=()):
+    """Inventory rows of `count` assorted items; ids in `equipped` are worn."""
+    item_ids = sorted(CATALOG.records)
+    created = datetime.datetime(2026, 1, 1)
+    rows = []
+    for i in range(count):
+        item_id = item_ids[i % len(item_ids)]
+        rows.append({
+            'id': i + 1, 'item_id': item_id,
+            'quantity': 3 if CATALOG.records[item_id].stackable else 1,
+            'is_equipped': 1 if item_id in equipped and i < len(item_ids) else 0,
+            'created_at': created,
+        })
+    return rows
+
+
+def _knight_detail(count):
+    from app import knight_snapshot_response
+    knight_row = {key: value for key, value in knight(level=10, gear=IRON_SET).items()
+                  if not key.endswith('_bonus')}
+    items = [{key: row[key] for key in ('id', 'item_id', 'quantity', 'is_equipped')}
+             for row in inventory_rows(count, equipped=IRON_SET)]
+    return lambda: knight_snapshot_response(knight_row, items)
+
+
+def _inventory_detail(count):
+    rows = inventory_rows(count, equipped=IRON_SET)
+    return lambda: CATALOG.inventory_detail_list(rows)
+
+
+# get_knight / equip response and get_inventory enrichment, small and large bags
+case('enrich.get_knight.20_items')(lambda: _knight_detail(20))
+case('enrich.get_knight.200_items')(lambda: _knight_detail(200))
+case('enrich.get_inventory.20_items')(lambda: _inventory_detail(20))
+case('enrich.get_inventory.200_items')(lambda: _inventory_detail(200))
+
+
+def seed():
+    """Reset the RNG used by loot rolls and random monsters, so runs are comparable."""
+    random.seed(2026)
@@ -0,0 +1,185 @@
+# Knight Club microbenchmarks
+#
+# Times the pure-Python hot paths in bench/cases.py and measures the memory
+# each call allocates, then compares both against bench/baseline.json:
+#
+#   python bench/run.py                 # compare; exit status 1 on a regression
+#   python bench/run.py battle loot     # only cases whose name starts with these
+#   python bench/run.py --update        # record the current numbers as the baseline
+#
+# Timings are stored relative to a fixed pure-Python calibration loop run
+# beside each case, so a baseline recorded on one machine is usable on
+# another; a case that looks slower is re-measured before it fails.
+# Allocation is the peak traced memory of one call, which is deterministic
+# for a given input. No database is needed.
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'backend'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('SESSION_SECRET', 'bench')
+
+from cases import CASES, seed  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Allowed slowdown / extra allocation before a case counts as regressed;
+# baseline.json can override them ("thresholds") globally or per case
+DEFAULT_THRESHOLDS = {'time': 0.25, 'alloc': 0.10}
+
+
+def calibrate(repeat=5):
+    """Seconds for a fixed pure-Python workload; the unit timings are stored in."""
+    def workload():
+        total = 0
+        for i in range(20000):
+            total += i * i % 7
+        return total
+    return min(timeit.repeat(workload, number=10, repeat=repeat)) / 10
+
+
+def time_call(fn, repeat=7, min_time=0.2):
+    """Best per-call time over `repeat` runs of enough calls to take min_time each."""
+    seed()
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time / repeat:
+        number *= 2
+    seed()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def alloc_call(fn):
+    """Peak bytes allocated during one call (after a warm-up call)."""
+    seed()
+    fn()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def measure(names, repeat):
+    """Results per case; each case is timed against a calibration taken right beside it."""
+    results = {}
+    for name in names:
+        fn = CASES[name]()
+        seconds = time_call(fn, repeat=repeat)
+        unit = calibrate()
+        results[name] = {
+            'time': round(seconds / unit, 6),
+            'time_us': round(seconds * 1e6, 3),
+            'alloc_bytes': alloc_call(fn),
+        }
+    return results
+
+
+def thresholds_for(baseline, name):
+    configured = baseline.get('thresholds', {})
+    return {**DEFAULT_THRESHOLDS, **configured.get('default', {}), **configured.get(name, {})}
+
+
+def compare(baseline, results):
+    """(rows for printing, list of regression messages)."""
+    rows, regressions = [], []
+    for name, current in results.items():
+        before = baseline.get('cases', {}).get(name)
+        if before is None:
+            rows.append((name, current, None, None, 'new'))
+            continue
+        limits = thresholds_for(baseline, name)
+        time_change = current['time'] / before['time'] - 1 if before['time'] else 0.0
+        alloc_change = (current['alloc_bytes'] / before['alloc_bytes'] - 1
+                        if before['alloc_bytes'] else float(current['alloc_bytes'] > 0))
+        status = 'ok'
+        if time_change > limits['time']:
+            status = 'SLOWER'
+            regressions.append(f'{name}: {time_change:+.0%} time (limit +{limits["time"]:.0%})')
+        if alloc_change > limits['alloc']:
+            status = 'MORE ALLOC' if status == 'ok' else 'SLOWER, MORE ALLOC'
+            regressions.append(f'{name}: {alloc_change:+.0%} allocation (limit +{limits["alloc"]:.0%})')
+        rows.append((name, current, time_change, alloc_change, status))
+    return rows, regressions
+
+
+def print_rows(rows):
+    header = f"{'case':<42} {'µs/call':>10} {'Δtime':>8} {'alloc B':>9} {'Δalloc':>8}  status"
+    print(header)
+    print('-' * len(header))
+    for name, current, time_change, alloc_change, status in rows:
+        dt = f'{time_change:+.0%}' if time_change is not None else ''
+        da = f'{alloc_change:+.0%}' if alloc_change is not None else ''
+        print(f"{name:<42} {current['time_us']:>10} {dt:>8} {current['alloc_bytes']:>9} {da:>8}  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Knight Club microbenchmarks.')
+    parser.add_argument('prefixes', nargs='*', help='only run cases whose name starts with one of these')
+    parser.add_argument('--update', action='store_true', help='write the results to baseline.json')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file (default bench/baseline.json)')
+    parser.add_argument('--repeat', type=int, default=7, help='timing repeats per case (default 7)')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='re-measure cases that look slower this many times (default 2)')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.prefixes or name.startswith(tuple(args.prefixes))]
+    if not names:
+        sys.exit(f'No cases match {" ".join(args.prefixes)}')
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    started = time.perf_counter()
+    results = measure(names, args.repeat)
+    rows, regressions = compare(baseline, results)
+    # A slowdown has to show up again to count: timings on a busy box are noisy
+    for _ in range(args.retries):
+        slow = [row[0] for row in rows if 'SLOWER' in row[4]]
+        if not slow or args.update:
+            break
+        for name, result in measure(slow, args.repeat).items():
+            if result['time'] < results[name]['time']:
+                results[name] = result
+        rows, regressions = compare(baseline, results)
+    print_rows(rows)
+    print(f'\n{len(names)} cases in {time.perf_counter() - started:.1f}s')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cases': results}, f, indent=2)
+
+    if args.update:
+        # Keep configured thresholds and cases that weren't run this time
+        updated = {
+            'thresholds': baseline.get('thresholds', {'default': DEFAULT_THRESHOLDS}),
+            'cases': {**baseline.get('cases', {}), **results},
+        }
+        updated['cases'] = dict(sorted(updated['cases'].items()))
+        with open(args.baseline, 'w') as f:
+            json.dump(updated, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return
+
+    if regressions:
+        print('\nRegressions:')
+        for message in regressions:
+            print(f'  {message}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
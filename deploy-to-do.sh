@@ -16,6 +16,8 @@ echo ""
 # Apply kustomize overlay (in case manifests changed)
 echo "📦 Applying Kubernetes manifests..."
 kubectl apply -k k8s/overlays/dev
+# Retired resources: `kubectl apply` doesn't delete what the manifests no longer list
+kubectl delete cronjob hp-regen -n knight-club --ignore-not-found  # HP regenerates lazily; /api/regen is gone
 echo "✅ Manifests applied"
 echo ""
 
@@ -20,11 +20,19 @@ CREATE TABLE IF NOT EXISTS knights (
   exp INT UNSIGNED NOT NULL DEFAULT 0,
   current_hp INT UNSIGNED NOT NULL DEFAULT 100,
   max_hp INT UNSIGNED NOT NULL DEFAULT 100,
+  -- when current_hp was last written; regen (1 HP / 15 min) is computed from it on read
+  hp_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   is_alive BOOLEAN NOT NULL DEFAULT TRUE,
+  -- summed stats of equipped items, maintained by equip/unequip
+  attack_bonus INT NOT NULL DEFAULT 0,
+  defense_bonus INT NOT NULL DEFAULT 0,
+  agility_bonus INT NOT NULL DEFAULT 0,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP NULL DEFAULT NULL ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (id),
   KEY idx_knights_user_id (user_id),
+  -- serves the leaderboard (WHERE is_alive ORDER BY level DESC, exp DESC) without a sort
+  KEY idx_knights_leaderboard (is_alive, level DESC, exp DESC, user_id, name, class),
   UNIQUE KEY uq_knights_user_name (user_id, name),
   CONSTRAINT fk_knights_user
     FOREIGN KEY (user_id) REFERENCES users(id)
@@ -39,10 +47,34 @@ CREATE TABLE IF NOT EXISTS inventory (
   item_id INT UNSIGNED NOT NULL,
   quantity INT UNSIGNED NOT NULL DEFAULT 1,
   is_equipped BOOLEAN NOT NULL DEFAULT FALSE,
+  -- item_id for stackable items (never equipped), NULL otherwise; one stack per knight and item
+  stack_item_id INT UNSIGNED NULL,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (id),
   KEY idx_inventory_knight_id (knight_id),
+  UNIQUE KEY uq_inventory_stack (knight_id, stack_item_id),
   CONSTRAINT fk_inventory_knight
     FOREIGN KEY (knight_id) REFERENCES knights(id)
     ON DELETE CASCADE
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- battle history (append-only, one row per battle)
+CREATE TABLE IF NOT EXISTS battles (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  knight_id BIGINT UNSIGNED NOT NULL,
+  monster_name VARCHAR(64) NOT NULL,
+  difficulty ENUM('easy','medium','hard') NOT NULL,
+  outcome ENUM('victory','defeat','draw') NOT NULL,
+  hp_before INT UNSIGNED NOT NULL,
+  hp_after INT UNSIGNED NOT NULL,
+  exp_gained INT UNSIGNED NOT NULL DEFAULT 0,
+  gold_gained INT UNSIGNED NOT NULL DEFAULT 0,
+  -- packed battle inputs (battle.pack_battle); the log is rebuilt by replaying them
+  replay VARBINARY(64) NOT NULL,
+  created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  KEY idx_battles_knight_created (knight_id, created_at, id),
+  CONSTRAINT fk_battles_knight
+    FOREIGN KEY (knight_id) REFERENCES knights(id)
+    ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,22 @@
+-- Battle history table
+USE knightclub;
+
+CREATE TABLE IF NOT EXISTS battles (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  knight_id BIGINT UNSIGNED NOT NULL,
+  monster_name VARCHAR(64) NOT NULL,
+  difficulty ENUM('easy','medium','hard') NOT NULL,
+  outcome ENUM('victory','defeat','draw') NOT NULL,
+  hp_before INT UNSIGNED NOT NULL,
+  hp_after INT UNSIGNED NOT NULL,
+  exp_gained INT UNSIGNED NOT NULL DEFAULT 0,
+  gold_gained INT UNSIGNED NOT NULL DEFAULT 0,
+  -- packed battle inputs (battle.pack_battle); the log is rebuilt by replaying them
+  replay VARBINARY(64) NOT NULL,
+  created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (id),
+  KEY idx_battles_knight_created (knight_id, created_at, id),
+  CONSTRAINT fk_battles_knight
+    FOREIGN KEY (knight_id) REFERENCES knights(id)
+    ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
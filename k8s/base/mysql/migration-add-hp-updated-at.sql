@@ -0,0 +1,6 @@
+-- Lazy HP regeneration: replaces the hp-regen CronJob and /api/regen
+-- Regen (1 HP per 15 minutes) is now computed from hp_updated_at when a knight is read.
+USE knightclub;
+
+ALTER TABLE knights
+  ADD COLUMN hp_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP AFTER max_hp;  -- existing knights regen from now
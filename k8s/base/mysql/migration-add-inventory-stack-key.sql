@@ -0,0 +1,11 @@
+-- Unique stack key for stackable inventory items
+-- After applying, merge existing stacks (stackable ids come from the item catalog) with:
+--   python inventory.py --fix
+USE knightclub;
+
+ALTER TABLE inventory
+  ADD COLUMN stack_item_id INT UNSIGNED NULL AFTER is_equipped;
+
+-- Every row starts unkeyed (NULL), so the key can be added before the merge
+ALTER TABLE inventory
+  ADD UNIQUE KEY uq_inventory_stack (knight_id, stack_item_id);
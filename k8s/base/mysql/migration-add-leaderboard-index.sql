@@ -0,0 +1,7 @@
+-- Covering index for the leaderboard query:
+--   WHERE is_alive = TRUE ORDER BY level DESC, exp DESC LIMIT 10
+-- Rows come off the index already in order, so no filesort over all living knights.
+USE knightclub;
+
+ALTER TABLE knights
+  ADD KEY idx_knights_leaderboard (is_alive, level DESC, exp DESC, user_id, name, class);
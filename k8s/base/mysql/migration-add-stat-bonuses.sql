@@ -0,0 +1,9 @@
+-- Store equipment stat bonuses on the knight row
+-- After applying, backfill from the inventory with:
+--   python stat_bonuses.py --fix
+USE knightclub;
+
+ALTER TABLE knights
+  ADD COLUMN attack_bonus INT NOT NULL DEFAULT 0 AFTER is_alive,
+  ADD COLUMN defense_bonus INT NOT NULL DEFAULT 0 AFTER attack_bonus,
+  ADD COLUMN agility_bonus INT NOT NULL DEFAULT 0 AFTER defense_bonus;
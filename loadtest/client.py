@@ -0,0 +1,143 @@
+# HTTP client and latency recorder for Knight Club load tests
+import http.client
+import json
+import math
+import threading
+import time
+
+
+class Recorder:
+    """
+    Latency and error samples per endpoint label, shared by every virtual user.
+    Samples taken before start_measuring() (the warm-up) are dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # label -> [latencies in seconds]
+        self._errors = {}  # label -> error count
+        self._statuses = {}  # label -> {status: count}
+        self._started = None
+        self._stopped = None
+
+    def start_measuring(self):
+        with self._lock:
+            self._samples.clear()
+            self._errors.clear()
+            self._statuses.clear()
+            self._started = time.perf_counter()
+            self._stopped = None
+
+    def stop_measuring(self):
+        with self._lock:
+            self._stopped = time.perf_counter()
+
+    def record(self, label, duration, status, ok):
+        with self._lock:
+            if self._started is None or self._stopped is not None:
+                return
+            self._samples.setdefault(label, []).append(duration)
+            statuses = self._statuses.setdefault(label, {})
+            statuses[status] = statuses.get(status, 0) + 1
+            if not ok:
+                self._errors[label] = self._errors.get(label, 0) + 1
+
+    def report(self):
+        """Per-endpoint throughput, latency percentiles (ms) and error rate."""
+        with self._lock:
+            elapsed = (self._stopped or time.perf_counter()) - (self._started or time.perf_counter())
+            endpoints = {}
+            total = errors = 0
+            for label in sorted(self._samples):
+                samples = sorted(self._samples[label])
+                failed = self._errors.get(label, 0)
+                total += len(samples)
+                errors += failed
+                endpoints[label] = {
+                    'requests': len(samples),
+                    'rps': round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+                    'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                    'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                    'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                    'max_ms': round(samples[-1] * 1000, 2),
+                    'error_rate': round(failed / len(samples), 4),
+                    'statuses': {str(k): v for k, v in sorted(self._statuses[label].items(), key=str)},
+                }
+            return {
+                'duration_s': round(elapsed, 2),
+                'requests': total,
+                'rps': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+                'error_rate': round(errors / total, 4) if total else 0.0,
+                'endpoints': endpoints,
+            }
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+class ApiError(Exception):
+    """A request failed (transport error or an unexpected status); already recorded."""
+
+    def __init__(self, label, status, body):
+        super().__init__(f'{label} -> {status}: {body}')
+        self.status = status
+        self.body = body
+
+
+class Client:
+    """
+    One virtual user's connection to the backend. Each call is timed and
+    recorded under `label` (the route template, e.g. 'GET /api/knights/{id}'),
+    so per-knight URLs aggregate into one endpoint.
+    """
+
+    def __init__(self, host, port, recorder, timeout=30.0):
+        self.recorder = recorder
+        self.token = None
+        self._conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def close(self):
+        self._conn.close()
+
+    def request(self, label, method, path, body=None, expect=(200,)):
+        """Send a request; returns the decoded JSON body, raising ApiError if the status isn't expected."""
+        headers = {'Accept': 'application/json'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+
+        started = time.perf_counter()
+        try:
+            self._conn.request(method, path, body=payload, headers=headers)
+            response = self._conn.getresponse()
+            raw = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            self._conn.close()
+            self.recorder.record(label, time.perf_counter() - started, 'transport', False)
+            raise ApiError(label, None, str(e))
+        duration = time.perf_counter() - started
+
+        ok = status in expect
+        self.recorder.record(label, duration, status, ok)
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = raw.decode('utf-8', 'replace')
+        if not ok:
+            raise ApiError(label, status, data)
+        return data
+
+    def get(self, label, path, **kwargs):
+        return self.request(label, 'GET', path, **kwargs)
+
+    def post(self, label, path, body, **kwargs):
+        return self.request(label, 'POST', path, body=body, **kwargs)
@@ -0,0 +1,248 @@
+# Knight Club load-test harness
+#
+# Starts a local database stand-in and the backend (backend/app.py), creates
+# and seeds a set of players, then runs a weighted mix of scenarios at the
+# requested concurrency and reports throughput, p50/p95/p99 latency and error
+# rate per endpoint. Everything runs on this machine; nothing is downloaded.
+#
+#   python loadtest/run.py --users 20 --duration 60
+#   python loadtest/run.py --mix battle=1 --users 50 --json after.json --compare before.json
+#
+# Run it from each branch with the same flags and --seed to compare them.
+import argparse
+import collections
+import json
+import os
+import random
+import secrets
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import mysql.connector
+
+from client import Client, Recorder, ApiError
+from scenarios import Player, SCENARIOS, SEED_EQUIPMENT, SEED_GOLD, parse_mix, register, run_virtual_user
+from standin import StandInError, free_port, stand_in
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the Knight Club backend against a local database.')
+    parser.add_argument('--db', choices=('mysqld', 'docker', 'external'), default='mysqld',
+                        help='database stand-in (default: a temporary local mysqld)')
+    parser.add_argument('--apply-schema', action='store_true',
+                        help='with --db external, load initdb.sql first')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users (default 10)')
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds (default 30)')
+    parser.add_argument('--warmup', type=float, default=5.0, help='unmeasured seconds before that (default 5)')
+    parser.add_argument('--mix', default='',
+                        help=f'scenario weights, e.g. battle=10,dashboard=5 (scenarios: {", ".join(SCENARIOS)})')
+    parser.add_argument('--seed', type=int, default=1, help='RNG seed for scenario choices (default 1)')
+    parser.add_argument('--url', help='test an already-running backend instead of starting one')
+    parser.add_argument('--app-cmd', default=f'{sys.executable} app.py',
+                        help='command that starts the backend, run in backend/ (default: python app.py)')
+    parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra backend environment, e.g. DB_POOL_SIZE=20 (repeatable)')
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='print deltas against an earlier --json report')
+    return parser.parse_args(argv)
+
+
+def wait_for_backend(base_url, proc=None, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f'Backend exited with status {proc.returncode}')
+        try:
+            with urllib.request.urlopen(f'{base_url}/healthz', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f'Backend did not become healthy within {timeout}s')
+
+
+def start_backend(args, db, port, log_path):
+    """Run the backend against the stand-in; its output goes to log_path."""
+    env = dict(os.environ,
+               PORT=str(port),
+               DB_HOST=db['host'], DB_PORT=str(db['port']), DB_NAME=db['database'],
+               DB_USER=db['user'], DB_PASSWORD=db['password'],
+               SESSION_SECRET=secrets.token_hex(32),
+               LOG_LEVEL='WARNING')
+    for item in args.app_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    log = open(log_path, 'w')
+    return subprocess.Popen(shlex.split(args.app_cmd), cwd=BACKEND_DIR, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+def seed_players(db, players):
+    """Give every player gold for the shop and unequipped gear for equip churn."""
+    conn = mysql.connector.connect(**db)
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE users SET gold = %s WHERE id = %s",
+                       [(SEED_GOLD, p.user_id) for p in players])
+    cursor.executemany("INSERT INTO inventory (knight_id, item_id) VALUES (%s, %s)",
+                       [(p.knight_id, item_id) for p in players for item_id in SEED_EQUIPMENT])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def run(args, base_url, db):
+    host, port = base_url.split('//', 1)[1].rsplit(':', 1)
+    port = int(port)
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    seeds = random.Random(args.seed)
+    players = [Player(Client(host, port, recorder), random.Random(seeds.getrandbits(64)))
+               for _ in range(args.users)]
+
+    print(f'Creating {len(players)} players...', file=sys.stderr)
+    setup_errors = []
+
+    def setup(player):
+        try:
+            register(player)
+        except ApiError as e:
+            setup_errors.append(str(e))
+
+    threads = [threading.Thread(target=setup, args=(p,)) for p in players]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if setup_errors:
+        raise RuntimeError(f'Player setup failed: {setup_errors[0]}')
+    if db is not None:
+        seed_players(db, players)
+
+    errors = collections.deque(maxlen=20)
+    stop_at = time.monotonic() + args.warmup + args.duration
+    print(f'Running {args.users} users for {args.warmup:g}s warm-up + {args.duration:g}s '
+          f'(mix: {", ".join(f"{k}={v}" for k, v in mix.items())})...', file=sys.stderr)
+    threads = [threading.Thread(target=run_virtual_user, args=(p, mix, stop_at, errors), daemon=True)
+               for p in players]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    recorder.start_measuring()
+    time.sleep(args.duration)
+    recorder.stop_measuring()
+    for t in threads:
+        t.join(timeout=35)
+    for p in players:
+        p.client.close()
+
+    report = recorder.report()
+    report['config'] = {'users': args.users, 'duration': args.duration, 'warmup': args.warmup,
+                        'mix': mix, 'seed': args.seed, 'db': args.db, 'app_env': args.app_env}
+    report['pool'] = fetch_json(f'{base_url}/api/pool/stats')
+    report['recent_errors'] = list(errors)
+    return report
+
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get('endpoints', {})
+    print(f"\n{report['requests']} requests in {report['duration_s']}s: "
+          f"{report['rps']} req/s, error rate {report['error_rate']:.2%}")
+    header = f"{'endpoint':<40} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    if baseline:
+        header += f" {'Δreq/s':>8} {'Δp95':>8}"
+    print(header)
+    print('-' * len(header))
+    for label, stats in report['endpoints'].items():
+        line = (f"{label:<40} {stats['requests']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} "
+                f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['error_rate']:>7.2%}")
+        if baseline:
+            before = base.get(label)
+            line += (f" {_delta(stats['rps'], before and before['rps']):>8}"
+                     f" {_delta(stats['p95_ms'], before and before['p95_ms']):>8}")
+        print(line)
+    if report.get('pool'):
+        pool = report['pool']
+        print(f"\nDB pool: size {pool['size']}, peak in use {pool['peak_in_use']}, "
+              f"waits {pool['waits']}, timeouts {pool['timeouts']}")
+    if report.get('recent_errors'):
+        print('\nRecent errors:')
+        for error in report['recent_errors'][-5:]:
+            print(f'  {error[:160]}')
+
+
+def _delta(after, before):
+    """Relative change as '+12%', or '' with nothing to compare against."""
+    if not before:
+        return ''
+    return f'{(after - before) / before:+.0%}'
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    workdir = tempfile.mkdtemp(prefix='knightclub-loadtest-')
+    db = standin = backend = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            # Seeding needs the database; without it, shop and equip see empty pockets
+            if args.db == 'external':
+                standin = stand_in('external')
+                db = standin.start()
+        else:
+            standin = stand_in(args.db, apply_schema=args.apply_schema)
+            print(f'Starting database stand-in ({args.db})...', file=sys.stderr)
+            db = standin.start()
+            port = free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            log_path = os.path.join(workdir, 'backend.log')
+            print(f'Starting backend on {base_url} (log: {log_path})...', file=sys.stderr)
+            backend = start_backend(args, db, port, log_path)
+        wait_for_backend(base_url, backend)
+
+        report = run(args, base_url, db)
+    except (StandInError, RuntimeError) as e:
+        sys.exit(f'Load test failed: {e}')
+    finally:
+        if backend is not None:
+            backend.terminate()
+            try:
+                backend.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                backend.kill()
+        if standin is not None:
+            standin.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+# Load-test scenarios for Knight Club
+#
+# A virtual user is one player: signup, login and a knight, then a loop of
+# scenarios picked by weight. Scenarios call the API the way the web UI does
+# (session token in the Authorization header, battles queued then polled).
+import time
+import uuid
+
+from client import ApiError
+
+POTION_ITEM_ID = 501
+# Wooden sword/shield/helm/chest/pants, granted at seeding so equip churn has work
+SEED_EQUIPMENT = (201, 202, 203, 204, 205)
+SEED_GOLD = 1_000_000
+BATTLE_POLL_INTERVAL = 0.05
+BATTLE_TIMEOUT = 30.0
+
+
+class Player:
+    """One virtual user: an account, its current knight and a seeded RNG."""
+
+    def __init__(self, client, rng):
+        self.client = client
+        self.rng = rng
+        self.username = f'lt-{uuid.uuid4().hex[:12]}'
+        self.password = 'loadtest-password'
+        self.user_id = None
+        self.knight_id = None
+        self.knights_created = 0
+
+    def new_knight(self):
+        self.knights_created += 1
+        data = self.client.post('POST /api/knights', '/api/knights', {
+            'user_id': self.user_id,
+            'name': f'Sir {self.username}-{self.knights_created}',
+            'class': self.rng.choice(('knight', 'paladin', 'lancer', 'templar')),
+        }, expect=(201,))
+        self.knight_id = data['knight_id']
+        self.client.token = data['token']
+
+
+def register(player):
+    """Create the player's account, log in and create a first knight."""
+    client = player.client
+    credentials = {'username': player.username, 'password': player.password}
+    client.post('POST /api/signup', '/api/signup', credentials, expect=(201,))
+    login(player)
+    player.new_knight()
+
+
+def login(player):
+    data = player.client.post('POST /api/login', '/api/login',
+                              {'username': player.username, 'password': player.password})
+    player.user_id = data['user_id']
+    player.client.token = data['token']
+
+
+def signup_login(player):
+    """A new visitor signs up, logs in and creates a knight (bcrypt-bound); the player's own session is kept."""
+    token = player.client.token
+    visitor = Player(player.client, player.rng)
+    try:
+        register(visitor)
+    finally:
+        player.client.token = token
+
+
+def battle_loop(player):
+    """Preview, queue an easy battle and poll it to completion; heal or replace the knight as needed."""
+    client = player.client
+    preview = client.post('POST /api/battle/preview', '/api/battle/preview', {'difficulty': 'easy'})
+
+    started = time.perf_counter()
+    queued = client.post('POST /api/battle', '/api/battle', {
+        'knight_id': player.knight_id,
+        'user_id': player.user_id,
+        'difficulty': 'easy',
+        'monster_index': preview['monster_index'],
+        'log_detail': 'events',
+    }, expect=(202,))
+
+    deadline = started + BATTLE_TIMEOUT
+    while True:
+        job = client.get('GET /api/battle/{id}', f'/api/battle/{queued["battle_id"]}')
+        if job['status'] in ('done', 'failed'):
+            break
+        if time.perf_counter() > deadline:
+            client.recorder.record('battle (queued to done)', time.perf_counter() - started, 'timeout', False)
+            return
+        time.sleep(BATTLE_POLL_INTERVAL)
+    ok = job['status'] == 'done'
+    client.recorder.record('battle (queued to done)', time.perf_counter() - started,
+                           job.get('status_code', 200), ok)
+    if not ok:
+        if job.get('status_code') == 400:
+            # Out of HP: drink a potion and carry on next time
+            drink_potion(player)
+        return
+
+    result = job['result']
+    if result.get('token'):
+        client.token = result['token']
+    if not result['knight_alive']:
+        player.new_knight()
+    elif result['knight_hp'] < result['knight_max_hp'] // 3:
+        drink_potion(player)
+
+
+def drink_potion(player):
+    """Buy a potion if the knight has none, then use it."""
+    client = player.client
+    inventory = client.get('GET /api/inventory', f'/api/inventory?knight_id={player.knight_id}')
+    potion = next((item for item in inventory['items'] if item['item_id'] == POTION_ITEM_ID), None)
+    if potion is None:
+        buy_potion(player)
+        inventory = client.get('GET /api/inventory', f'/api/inventory?knight_id={player.knight_id}')
+        potion = next((item for item in inventory['items'] if item['item_id'] == POTION_ITEM_ID), None)
+        if potion is None:
+            return
+    client.post('POST /api/knights/{id}/use-potion', f'/api/knights/{player.knight_id}/use-potion', {
+        'user_id': player.user_id,
+        'inventory_id': potion['id'],
+    }, expect=(200, 400))  # 400: already at full HP after regeneration
+
+
+def buy_potion(player):
+    player.client.post('POST /api/shop/buy', '/api/shop/buy', {
+        'user_id': player.user_id,
+        'knight_id': player.knight_id,
+        'item_id': POTION_ITEM_ID,
+        'quantity': player.rng.randint(1, 3),
+    })
+
+
+def equip_churn(player):
+    """Equip a random unequipped piece of gear, then take it off again."""
+    client = player.client
+    data = client.get('GET /api/knights/{id}', f'/api/knights/{player.knight_id}')
+    gear = [item for item in data['knight']['inventory']
+            if not item['is_equipped'] and item.get('slot')]
+    if not gear:
+        return
+    item = player.rng.choice(gear)
+    path = f'/api/knights/{player.knight_id}'
+    body = {'user_id': player.user_id, 'inventory_id': item['inventory_id']}
+    client.post('POST /api/knights/{id}/equip', f'{path}/equip', body)
+    client.post('POST /api/knights/{id}/unequip', f'{path}/unequip', body)
+
+
+def shop_buy(player):
+    """Browse the shop, buy potions and look at the inventory."""
+    player.client.get('GET /api/shop/items', '/api/shop/items')
+    buy_potion(player)
+    player.client.get('GET /api/inventory', f'/api/inventory?knight_id={player.knight_id}')
+
+
+def dashboard(player):
+    """What the dashboard and knight pages poll: knights, leaderboard, detail, history."""
+    client = player.client
+    client.get('GET /api/knights', f'/api/knights?user_id={player.user_id}')
+    client.get('GET /api/leaderboard', '/api/leaderboard')
+    client.get('GET /api/knights/{id}', f'/api/knights/{player.knight_id}')
+    client.get('GET /api/knights/{id}/battles', f'/api/knights/{player.knight_id}/battles?limit=10')
+
+
+# name -> (scenario, default weight in the mix)
+SCENARIOS = {
+    'signup': (signup_login, 1),
+    'battle': (battle_loop, 10),
+    'equip': (equip_churn, 4),
+    'shop': (shop_buy, 2),
+    'dashboard': (dashboard, 6),
+}
+
+
+def parse_mix(text):
+    """'battle=10,dashboard=5' -> {'battle': 10, 'dashboard': 5}; empty for the default mix."""
+    if not text:
+        return {name: weight for name, (_, weight) in SCENARIOS.items()}
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r} (choose from {", ".join(SCENARIOS)})')
+        mix[name] = int(weight) if weight else 1
+    return mix
+
+
+def run_virtual_user(player, mix, stop_at, errors):
+    """Run weighted scenarios until stop_at; failures go to `errors` (a bounded deque) and the loop carries on."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < stop_at:
+        name = player.rng.choices(names, weights)[0]
+        try:
+            SCENARIOS[name][0](player)
+        except ApiError as e:
+            errors.append(f'{name}: {e}')
+            if e.status == 401:
+                # Session expired or rejected: log in again
+                try:
+                    login(player)
+                except ApiError:
+                    time.sleep(0.5)
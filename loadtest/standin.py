@@ -0,0 +1,226 @@
+# Local database stand-ins for Knight Club load tests
+#
+# Each stand-in starts a throwaway MySQL on 127.0.0.1 with the production
+# schema (k8s/base/mysql/initdb.sql) and an `app` user, so the backend runs
+# against it exactly as it does in the cluster. Nothing is fetched from the
+# network:
+#
+#   mysqld  - a MySQL 8.0 mysqld from PATH (or MYSQLD) in a temp datadir
+#   docker  - the mysql:8.0 image, which must already be pulled
+#   external - an already-running server from DB_* variables (schema applied
+#              with --apply-schema, otherwise assumed present)
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import mysql.connector
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(ROOT, 'k8s', 'base', 'mysql', 'initdb.sql')
+
+DB_NAME = 'knightclub'
+DB_USER = 'app'
+DB_PASSWORD = 'loadtest'
+
+
+class StandInError(Exception):
+    """Raised when a database stand-in could not be started."""
+
+
+def free_port():
+    """An unused TCP port on 127.0.0.1."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def apply_schema(**connect_kwargs):
+    """Run initdb.sql (creates the knightclub database and its tables)."""
+    with open(SCHEMA_PATH) as f:
+        schema = f.read()
+    conn = mysql.connector.connect(**connect_kwargs)
+    try:
+        cursor = conn.cursor()
+        for _ in cursor.execute(schema, multi=True):
+            pass
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def wait_for_server(timeout, **connect_kwargs):
+    """Block until the server accepts a connection, or raise StandInError."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            mysql.connector.connect(**connect_kwargs).close()
+            return
+        except mysql.connector.Error as e:
+            if time.monotonic() > deadline:
+                raise StandInError(f'Database did not come up within {timeout}s: {e}')
+            time.sleep(0.5)
+
+
+class LocalMySQL:
+    """A mysqld process on a temp datadir, removed on stop()."""
+
+    def __init__(self, binary=None, port=None, startup_timeout=60.0):
+        self.binary = binary or os.getenv('MYSQLD') or shutil.which('mysqld')
+        if not self.binary:
+            raise StandInError('No mysqld on PATH (set MYSQLD or use --db docker)')
+        # Inventory grants use MySQL 8.0.19+ upsert syntax (INSERT ... AS new)
+        if self._is_mariadb():
+            raise StandInError(f'{self.binary} is MariaDB, which the backend does not support; '
+                               'use a MySQL 8.0 mysqld or --db docker')
+        self.port = port or free_port()
+        self.startup_timeout = startup_timeout
+        self._dir = None
+        self._proc = None
+
+    def _is_mariadb(self):
+        out = subprocess.run([self.binary, '--version'], capture_output=True, text=True).stdout
+        return 'mariadb' in out.lower()
+
+    def _initialize(self, datadir):
+        cmd = [self.binary, '--no-defaults', '--initialize-insecure', f'--datadir={datadir}']
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise StandInError(f'Initializing the datadir failed:\n{result.stderr}')
+
+    def start(self):
+        """Initialize a datadir, start the server and load the schema; returns DB_* settings."""
+        self._dir = tempfile.mkdtemp(prefix='knightclub-loadtest-db-')
+        datadir = os.path.join(self._dir, 'data')
+        socket_path = os.path.join(self._dir, 'mysql.sock')
+        self._initialize(datadir)
+
+        self._proc = subprocess.Popen([
+            self.binary, '--no-defaults',
+            f'--datadir={datadir}',
+            f'--socket={socket_path}',
+            f'--port={self.port}',
+            '--bind-address=127.0.0.1',
+            f'--pid-file={os.path.join(self._dir, "mysqld.pid")}',
+            '--skip-log-bin',
+            '--max-connections=500',
+        ], stdout=subprocess.DEVNULL, stderr=open(os.path.join(self._dir, 'mysqld.err'), 'w'))
+
+        # root has no password and is only reachable over the socket
+        root = {'unix_socket': socket_path, 'user': 'root'}
+        wait_for_server(self.startup_timeout, **root)
+        apply_schema(**root)
+        conn = mysql.connector.connect(**root)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE USER IF NOT EXISTS '{DB_USER}'@'%' IDENTIFIED BY '{DB_PASSWORD}'")
+        cursor.execute(f"GRANT ALL PRIVILEGES ON {DB_NAME}.* TO '{DB_USER}'@'%'")
+        cursor.close()
+        conn.close()
+        return self.settings()
+
+    def settings(self):
+        return {'host': '127.0.0.1', 'port': self.port, 'database': DB_NAME,
+                'user': DB_USER, 'password': DB_PASSWORD}
+
+    def stop(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+
+class DockerMySQL:
+    """The production mysql:8.0 image, loading initdb.sql like the StatefulSet does."""
+
+    def __init__(self, image='mysql:8.0', port=None, startup_timeout=120.0):
+        if not shutil.which('docker'):
+            raise StandInError('docker not found on PATH')
+        self.image = image
+        self.port = port or free_port()
+        self.startup_timeout = startup_timeout
+        self._container = None
+
+    def start(self):
+        result = subprocess.run([
+            'docker', 'run', '-d', '--rm', '--pull=never',
+            '-p', f'127.0.0.1:{self.port}:3306',
+            '-e', 'MYSQL_ROOT_PASSWORD=loadtest-root',
+            '-e', f'MYSQL_DATABASE={DB_NAME}',
+            '-e', f'MYSQL_USER={DB_USER}',
+            '-e', f'MYSQL_PASSWORD={DB_PASSWORD}',
+            '-v', f'{SCHEMA_PATH}:/docker-entrypoint-initdb.d/initdb.sql:ro',
+            self.image,
+        ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise StandInError(f'docker run failed (is {self.image} pulled?):\n{result.stderr}')
+        self._container = result.stdout.strip()
+        # The entrypoint restarts the server after running initdb.sql, so wait
+        # for a table from the schema rather than the first accepted connection
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                conn = mysql.connector.connect(**self.settings())
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM battles LIMIT 1')
+                cursor.fetchall()
+                conn.close()
+                return self.settings()
+            except mysql.connector.Error as e:
+                if time.monotonic() > deadline:
+                    raise StandInError(f'Database did not come up within {self.startup_timeout}s: {e}')
+                time.sleep(1)
+
+    def settings(self):
+        return {'host': '127.0.0.1', 'port': self.port, 'database': DB_NAME,
+                'user': DB_USER, 'password': DB_PASSWORD}
+
+    def stop(self):
+        if self._container:
+            subprocess.run(['docker', 'stop', self._container], capture_output=True)
+            self._container = None
+
+
+class ExternalMySQL:
+    """A server someone else runs, described by the same DB_* variables as the backend."""
+
+    def __init__(self, apply=False):
+        self.apply = apply
+
+    def start(self):
+        settings = self.settings()
+        wait_for_server(10, **settings)
+        if self.apply:
+            apply_schema(**settings)
+        return settings
+
+    def settings(self):
+        return {
+            'host': os.getenv('DB_HOST', '127.0.0.1'),
+            'port': int(os.getenv('DB_PORT', '3306')),
+            'database': os.getenv('DB_NAME', DB_NAME),
+            'user': os.getenv('DB_USER', DB_USER),
+            'password': os.getenv('DB_PASSWORD', DB_PASSWORD),
+        }
+
+    def stop(self):
+        pass
+
+
+def stand_in(kind, apply_schema=False):
+    """Build the stand-in for --db (mysqld, docker or external)."""
+    if kind == 'mysqld':
+        return LocalMySQL()
+    if kind == 'docker':
+        return DockerMySQL()
+    if kind == 'external':
+        return ExternalMySQL(apply=apply_schema)
+    raise ValueError(f'Unknown database stand-in: {kind}')
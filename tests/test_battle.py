@@ -0,0 +1,125 @@
+# Battle resolution: the closed-form simulate_battle() must agree with the
+# turn-by-turn loop it replaced, and simulate_battles() with simulate_battle().
+import random
+
+from battle import MAX_TURNS, RESULT_NAMES, Combatant, knight_arrays, simulate_battle, simulate_battles
+from monsters import Monster
+
+
+def turn_loop_battle(knight_data, monster):
+    """The original turn-by-turn simulation, kept as the reference."""
+    level_bonus = knight_data.get('level', 1) - 1
+    knight = Combatant(knight_data['name'], knight_data['current_hp'], knight_data['max_hp'],
+                       10 + level_bonus + knight_data.get('attack_bonus', 0),
+                       10 + level_bonus + knight_data.get('defense_bonus', 0),
+                       10 + level_bonus + knight_data.get('agility_bonus', 0))
+    foe = Combatant(monster.name, monster.hp, monster.max_hp, monster.attack, monster.defense, monster.agility)
+
+    log = [f"⚔️ {knight.name} encounters a {foe.name}!",
+           f"Knight HP: {knight.hp}/{knight.max_hp} | Monster HP: {foe.hp}/{foe.max_hp}", ""]
+    first, second = (knight, foe) if knight.agility >= foe.agility else (foe, knight)
+    log += [f"🏃 {first.name} moves first! (Agility: {first.agility})", ""]
+
+    turn = 1
+    while knight.is_alive and foe.is_alive:
+        log.append(f"--- Turn {turn} ---")
+        damage = first.calculate_damage(second)
+        second.take_damage(damage)
+        log.append(f"💥 {first.name} attacks {second.name} for {damage} damage!")
+        log.append(f"   {second.name} HP: {second.hp}/{second.max_hp}")
+        if not second.is_alive:
+            break
+        damage = second.calculate_damage(first)
+        first.take_damage(damage)
+        log.append(f"💥 {second.name} attacks {first.name} for {damage} damage!")
+        log.append(f"   {first.name} HP: {first.hp}/{first.max_hp}")
+        log.append("")
+        turn += 1
+        if turn > MAX_TURNS:
+            log.append("⏱️ Battle timeout - Draw!")
+            break
+
+    log.append("=" * 40)
+    if knight.is_alive:
+        log += [f"🎉 Victory! {knight.name} defeated the {foe.name}!",
+                f"💚 {knight.name} HP remaining: {knight.hp}/{knight.max_hp}",
+                f"⭐ Experience gained: {monster.xp_reward} XP"]
+        result = 'victory'
+    elif foe.is_alive:
+        log += [f"💀 Defeat! {knight.name} was slain by the {foe.name}!",
+                f"⚰️  {knight.name} has died permanently..."]
+        result = 'defeat'
+    else:
+        log += ["🤝 Draw! Both combatants fell!", f"⚰️  {knight.name} has died permanently..."]
+        result = 'draw'
+
+    return {
+        'result': result,
+        'knight_hp': knight.hp if result == 'victory' else 0,
+        'knight_alive': result == 'victory',
+        'log': log,
+        'xp_gained': monster.xp_reward if result == 'victory' else 0,
+    }
+
+
+def random_knight(rng):
+    max_hp = rng.randint(20, 400)
+    return {
+        'name': 'Sir Test', 'level': rng.randint(1, 30),
+        'current_hp': rng.randint(1, max_hp), 'max_hp': max_hp,
+        'attack_bonus': rng.randint(0, 40), 'defense_bonus': rng.randint(0, 40), 'agility_bonus': rng.randint(0, 20),
+    }
+
+
+def random_monster(rng):
+    return Monster(name='Test Beast', hp=rng.randint(1, 600), attack=rng.randint(1, 80),
+                   defense=rng.randint(0, 60), agility=rng.randint(1, 50),
+                   xp_reward=rng.randint(0, 200), gold_drop=(0, 10), loot_table=[])
+
+
+def random_pairs(seed, count):
+    rng = random.Random(seed)
+    return [(random_knight(rng), random_monster(rng)) for _ in range(count)]
+
+
+# Long stalemates (1 damage a hit, lots of HP) end on MAX_TURNS
+STALEMATE = ({'name': 'Sir Test', 'level': 1, 'current_hp': 500, 'max_hp': 500,
+              'attack_bonus': 0, 'defense_bonus': 60, 'agility_bonus': 0},
+             Monster('Test Beast', 900, 5, 30, 10, 50, (0, 10), []))
+
+
+def test_closed_form_matches_turn_loop():
+    results = set()
+    for knight, monster in random_pairs(2, 2000) + [STALEMATE]:
+        expected = turn_loop_battle(knight, monster)
+        actual = simulate_battle(knight, monster, log_detail='full')
+        for key in ('result', 'knight_hp', 'knight_alive', 'xp_gained', 'log'):
+            assert actual[key] == expected[key], (key, knight, vars(monster))
+        results.add(actual['result'])
+    assert results == {'victory', 'defeat'}
+
+
+def test_stalemate_reaches_turn_limit():
+    knight, monster = STALEMATE
+    outcome = simulate_battle(knight, monster, log_detail='none')
+    assert outcome['turns'] == MAX_TURNS
+    assert outcome['result'] == 'victory'
+
+
+def test_batch_simulator_matches_simulate_battle():
+    rng = random.Random(3)
+    knights = [random_knight(rng) for _ in range(60)] + [STALEMATE[0]]
+    monsters = [random_monster(rng) for _ in range(50)] + [STALEMATE[1]]
+
+    batch = simulate_battles(knight_arrays(knights), monsters)
+    for i, knight in enumerate(knights):
+        for j, monster in enumerate(monsters):
+            expected = simulate_battle(knight, monster, log_detail='none')
+            actual = {
+                'result': RESULT_NAMES[batch['result'][i, j]],
+                'knight_hp': int(batch['knight_hp'][i, j]),
+                'knight_alive': bool(batch['knight_alive'][i, j]),
+                'turns': int(batch['turns'][i, j]),
+                'xp_gained': int(batch['xp_gained'][i, j]),
+            }
+            assert actual == {key: expected[key] for key in actual}, (knight, vars(monster))
@@ -0,0 +1,88 @@
+# A winning battle run through the battle worker entry point, against a fake
+# connection, so the loot and battle metrics it updates are exercised.
+import re
+
+import pytest
+
+import app
+
+
+KNIGHT = {
+    'id': 7, 'user_id': 3, 'name': 'Tester', 'class': 'warrior', 'level': 90, 'exp': 8900,
+    'current_hp': 5000, 'max_hp': 5000, 'is_alive': True, 'hp_elapsed': 0,
+    'attack_bonus': 500, 'defense_bonus': 500, 'agility_bonus': 0,
+}
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+        self.row = None
+
+    def execute(self, statement, params=()):
+        self.statements.append(statement)
+        self.row = dict(KNIGHT) if 'FROM knights' in statement else None
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row] if self.row else []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.committed = False
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.statements)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def metric_value(text, name, labels=''):
+    series = name + ('{' + labels + '}' if labels else '')
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(app.db_pool, 'get_connection', lambda *args, **kwargs: conn)
+    monkeypatch.setattr(app, 'generate_loot', lambda monster: {'gold': 11, 'items': [101, 101]})
+    return conn
+
+
+def test_victory_updates_loot_metrics(connection):
+    client = app.app.test_client()
+    tier = app.CATALOG.get(101).tier
+    before = client.get('/metrics').get_data(as_text=True)
+
+    result, status = app.battle_job({'knight_id': KNIGHT['id'], 'user_id': KNIGHT['user_id'],
+                                     'difficulty': 'easy', 'monster_index': 0, 'log_detail': 'none'})
+
+    assert status == 200, result
+    assert result['result'] == 'victory'
+    assert [item['id'] for item in result['loot']['items']] == [101, 101]
+    assert connection.committed
+    # The knight row is locked until commit, as the grind endpoint locks it
+    assert any('FOR UPDATE' in statement for statement in connection.statements if 'FROM knights k' in statement)
+
+    after = client.get('/metrics').get_data(as_text=True)
+    items_label = f'tier="{tier}"'
+    assert metric_value(after, 'knightclub_loot_items_total', items_label) == \
+        metric_value(before, 'knightclub_loot_items_total', items_label) + 2
+    assert metric_value(after, 'knightclub_loot_gold_total') == \
+        metric_value(before, 'knightclub_loot_gold_total') + 11
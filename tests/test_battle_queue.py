@@ -0,0 +1,29 @@
+# Battle jobs: workers run from startup, and a persisted job carries the
+# verified session claims but never the bearer token itself.
+import sqlite3
+
+import app
+from battle_queue import SQLiteBattleQueue
+from sessions import issue_token
+
+
+def test_workers_start_with_the_app():
+    assert app.battle_workers._threads
+
+
+def test_queued_job_stores_claims_not_token(monkeypatch, tmp_path):
+    path = str(tmp_path / 'battles.sqlite3')
+    monkeypatch.setattr(app, 'battle_jobs', SQLiteBattleQueue(path))
+    token = issue_token(3, [4])
+
+    response = app.app.test_client().post('/api/battle', headers={'Authorization': f'Bearer {token}'}, json={
+        'knight_id': 4, 'user_id': 3, 'difficulty': 'easy',
+        'session': {'uid': 3, 'knights': [99], 'exp': 2**40},
+    })
+    assert response.status_code == 202
+
+    (payload,) = sqlite3.connect(path).execute('SELECT payload FROM battle_jobs').fetchone()
+    assert token not in payload
+    job_id, claimed = app.battle_jobs.claim(timeout=0)
+    assert claimed['session']['uid'] == 3
+    assert claimed['session']['knights'] == [4]
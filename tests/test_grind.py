@@ -0,0 +1,150 @@
+# Grinding: every battle of a series uses the knight as the previous battle
+# left it (HP, XP and level-ups), and a grind and a queued battle on the same
+# knight serialize on the knight row instead of overwriting each other.
+import threading
+import time
+
+import app
+from battle import pack_battle, simulate_battle
+from grind import STOP_COMPLETED, STOP_DIED, STOP_HP_FLOOR, fight_series
+from monsters import Monster
+
+STRONG_KNIGHT = {
+    'id': 7, 'user_id': 3, 'name': 'Sir Test', 'class': 'knight', 'level': 1, 'exp': 90,
+    'current_hp': 900, 'max_hp': 900, 'is_alive': True,
+    'attack_bonus': 60, 'defense_bonus': 5, 'agility_bonus': 0,
+}
+
+
+def test_series_carries_hp_xp_and_level_between_battles():
+    series = fight_series(STRONG_KNIGHT, 'easy', 30)
+    assert series.stopped == STOP_COMPLETED
+    assert len(series.battles) == 30
+
+    knight = dict(STRONG_KNIGHT)
+    for battle in series.battles:
+        # Each battle is fought (and recorded) with the state the last one left
+        assert battle.hp_before == knight['current_hp']
+        assert battle.replay == pack_battle(knight, battle.monster)
+        outcome = simulate_battle(knight, battle.monster, log_detail='none')
+        assert (battle.result, battle.hp_after, battle.xp_gained) == \
+            (outcome['result'], outcome['knight_hp'], outcome['xp_gained'])
+        knight['current_hp'] = outcome['knight_hp']
+        knight['exp'] += outcome['xp_gained']
+        knight['level'] = knight['exp'] // 100 + 1
+
+    assert (series.hp, series.exp, series.level) == (knight['current_hp'], knight['exp'], knight['level'])
+    assert series.level > STRONG_KNIGHT['level']
+    assert series.xp_gained == knight['exp'] - STRONG_KNIGHT['exp']
+
+
+def test_series_stops_at_hp_floor_and_on_death(monkeypatch):
+    # Moves first and hits twice for 15 before falling to the knight's second blow
+    sparring = Monster('Sparring Partner', 100, 30, 0, 99, 10, (0, 1), [])
+    monkeypatch.setattr('grind.get_monster', lambda difficulty: sparring)
+    series = fight_series(dict(STRONG_KNIGHT, current_hp=100, exp=0), 'easy', 50, hp_floor=45)
+    assert series.stopped == STOP_HP_FLOOR
+    assert [battle.hp_after for battle in series.battles] == [70, 40]
+
+    brute = Monster('Brute', 500, 400, 50, 99, 10, (0, 1), [])
+    monkeypatch.setattr('grind.get_monster', lambda difficulty: brute)
+    series = fight_series(STRONG_KNIGHT, 'easy', 10)
+    assert series.stopped == STOP_DIED
+    assert len(series.battles) == 1
+    assert not series.alive and series.hp == 0 and series.exp == STRONG_KNIGHT['exp']
+
+
+class RowLockingDB:
+    """One knight row behind a lock taken by SELECT ... FOR UPDATE and held until commit."""
+
+    def __init__(self, knight):
+        self.knight = dict(knight)
+        self.row_lock = threading.Lock()
+        self.locked = threading.Event()
+        self.slow_first_write = True
+
+    def connect(self, *args, **kwargs):
+        return RowLockingConnection(self)
+
+
+class RowLockingConnection:
+    def __init__(self, db):
+        self.db = db
+        self.holds_lock = False
+
+    def cursor(self, dictionary=False):
+        return RowLockingCursor(self)
+
+    def _release(self):
+        if self.holds_lock:
+            self.holds_lock = False
+            self.db.row_lock.release()
+
+    def commit(self):
+        self._release()
+
+    def rollback(self):
+        self._release()
+
+    def close(self):
+        self._release()
+
+
+class RowLockingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.db = conn.db
+        self.row = None
+        self.lastrowid = None
+
+    def execute(self, statement, params=()):
+        self.row = None
+        if 'FROM knights k WHERE k.id' in statement:
+            if 'FOR UPDATE' in statement and not self.conn.holds_lock:
+                assert self.db.row_lock.acquire(timeout=5)
+                self.conn.holds_lock = True
+                self.db.locked.set()
+            self.row = dict(self.db.knight, hp_elapsed=0)
+        elif 'SELECT user_id FROM knights' in statement:
+            self.row = {'user_id': self.db.knight['user_id']}
+        elif statement.startswith('UPDATE knights SET current_hp'):
+            if self.db.slow_first_write:
+                # Leave a window in which an unlocked reader would see the old row
+                self.db.slow_first_write = False
+                time.sleep(0.3)
+            if len(params) == 6:
+                hp, _, alive, exp, level, _ = params
+                self.db.knight.update(current_hp=hp, is_alive=alive, exp=exp, level=level)
+            else:
+                hp, _, alive, _ = params
+                self.db.knight.update(current_hp=hp, is_alive=alive)
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return [self.row] if self.row else []
+
+    def close(self):
+        pass
+
+
+def test_grind_and_battle_on_one_knight_do_not_lose_updates(monkeypatch):
+    db = RowLockingDB(STRONG_KNIGHT)
+    monkeypatch.setattr(app.db_pool, 'get_connection', db.connect)
+    request = {'knight_id': STRONG_KNIGHT['id'], 'user_id': STRONG_KNIGHT['user_id'], 'difficulty': 'easy'}
+
+    grind = {}
+    def run_grind():
+        response = app.app.test_client().post('/api/battle/grind', json=dict(request, count=5))
+        grind.update(response.get_json(), status=response.status_code)
+
+    thread = threading.Thread(target=run_grind)
+    thread.start()
+    assert db.locked.wait(5)
+    battle, status = app.battle_job(dict(request, log_detail='none'))
+    thread.join(5)
+
+    assert grind['status'] == 200 and status == 200, (grind, battle)
+    assert db.knight['exp'] == STRONG_KNIGHT['exp'] + grind['xp_gained'] + battle['xp_gained']
+    assert db.knight['level'] == db.knight['exp'] // 100 + 1
@@ -0,0 +1,75 @@
+# Battle history pagination: cursors survive the round trip, and following
+# next_cursor visits every battle once, newest first, even when battles share
+# a created_at timestamp.
+from datetime import datetime, timedelta
+
+import pytest
+
+from battle import pack_battle
+from history import decode_cursor, encode_cursor, list_battles
+from monsters import Monster
+
+MONSTER = Monster('Test Beast', 30, 12, 5, 8, 20, (0, 10), [])
+KNIGHT = {'level': 3, 'current_hp': 80, 'max_hp': 100}
+
+
+def test_cursor_round_trip():
+    for created_at in (datetime(2026, 3, 1, 12, 30, 5), datetime(2026, 3, 1, 12, 30, 5, 250)):
+        row = {'created_at': created_at, 'id': 12345}
+        assert decode_cursor(encode_cursor(row)) == (created_at, 12345)
+
+
+@pytest.mark.parametrize('value', ['', 'garbage', '2026-03-01T12:30:05_x', 'nope_12'])
+def test_malformed_cursor_is_rejected(value):
+    with pytest.raises(ValueError):
+        decode_cursor(value)
+
+
+class KeysetCursor:
+    """Answers list_battles()' query from in-memory rows with the same keyset semantics."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def execute(self, query, params):
+        knight_id, *rest = params
+        rows = [row for row in self.rows if row['knight_id'] == knight_id]
+        if len(rest) == 4:
+            created_at, _, battle_id, limit = rest
+            rows = [row for row in rows
+                    if row['created_at'] < created_at or (row['created_at'] == created_at and row['id'] < battle_id)]
+        else:
+            (limit,) = rest
+        rows.sort(key=lambda row: (row['created_at'], row['id']), reverse=True)
+        self.result = [dict(row) for row in rows[:limit]]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_pages_cover_every_battle_once():
+    start = datetime(2026, 3, 1, 12, 0, 0)
+    replay = pack_battle(KNIGHT, MONSTER)
+    rows = [
+        {'id': battle_id, 'knight_id': 1 if battle_id % 5 else 2, 'monster_name': MONSTER.name,
+         'difficulty': 'easy', 'outcome': 'victory', 'hp_before': 80, 'hp_after': 70,
+         'exp_gained': 20, 'gold_gained': 3, 'replay': replay,
+         # Runs of battles share a timestamp, so ties are broken by id
+         'created_at': start + timedelta(seconds=battle_id // 4)}
+        for battle_id in range(1, 48)
+    ]
+    cursor = KeysetCursor(rows)
+
+    seen, after = [], None
+    while True:
+        page, next_cursor = list_battles(cursor, 1, 'Sir Test', limit=5, after=after)
+        assert len(page) <= 5
+        seen.extend(row['id'] for row in page)
+        if next_cursor is None:
+            break
+        after = decode_cursor(next_cursor)
+
+    expected = sorted((row for row in rows if row['knight_id'] == 1),
+                      key=lambda row: (row['created_at'], row['id']), reverse=True)
+    assert seen == [row['id'] for row in expected]
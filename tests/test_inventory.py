@@ -0,0 +1,71 @@
+# Set-based inventory writes: the statements grant_items() and sell_items()
+# send, and who gets the gold for a sale.
+from items import CATALOG
+from inventory import grant_items, merge_stacks, sell_items
+
+
+class ScriptedCursor:
+    """Records statements and answers SELECTs from `answers`, in order."""
+
+    def __init__(self, answers=()):
+        self.answers = list(answers)
+        self.executed = []
+        self.result = None
+
+    def execute(self, statement, params=()):
+        self.executed.append((' '.join(statement.split()), list(params)))
+        self.result = self.answers.pop(0) if statement.lstrip().startswith('SELECT') else None
+
+    def executemany(self, statement, rows):
+        self.executed.append((' '.join(statement.split()), list(rows)))
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+
+def test_sale_credits_the_knights_owner():
+    cursor = ScriptedCursor([{'user_id': 3}, [{'item_id': 201, 'count': 2}, {'item_id': 202, 'count': 1}]])
+    assert sell_items(cursor, 7, [201, 202]) == (3, 30)
+
+    lock_owner, lock_rows, delete, credit = cursor.executed
+    assert lock_owner == ('SELECT user_id FROM knights WHERE id = %s FOR UPDATE', [7])
+    assert lock_rows[0].endswith('FOR UPDATE')
+    assert delete[0].startswith('DELETE FROM inventory')
+    assert credit == ('UPDATE users SET gold = gold + %s WHERE id = %s', [30, 3])
+
+
+def test_sale_of_missing_knight_or_nothing_writes_nothing():
+    cursor = ScriptedCursor([None])
+    assert sell_items(cursor, 7, [201]) == (0, 0)
+    assert len(cursor.executed) == 1
+
+    cursor = ScriptedCursor([{'user_id': 3}, []])
+    assert sell_items(cursor, 7, [201]) == (0, 0)
+    assert not any(statement.startswith(('DELETE', 'UPDATE')) for statement, _ in cursor.executed)
+
+    assert sell_items(ScriptedCursor(), 7, [201], inventory_ids=[]) == (0, 0)
+
+
+def test_grant_upserts_stacks_with_row_alias():
+    cursor = ScriptedCursor()
+    assert grant_items(cursor, 7, [(101, 2), (201, 2), (101, 1), (99999, 4)]) == 5
+
+    (stacks, stack_params), (units, unit_params) = cursor.executed
+    assert stacks.endswith('AS new ON DUPLICATE KEY UPDATE quantity = quantity + new.quantity')
+    assert 'VALUES(' not in stacks
+    assert stack_params == [7, 101, 3, 101]
+    assert unit_params == [7, 201, 7, 201]
+
+
+def test_merge_stacks_uses_catalog_ids_and_keys_the_oldest_row():
+    cursor = ScriptedCursor([[{'knight_id': 7, 'item_id': 101, 'keep_id': 40, 'total': 9}]])
+    assert merge_stacks(cursor) == [(7, 101, 40, 9)]
+
+    (select, select_params), (delete, delete_rows), (update, update_rows) = cursor.executed
+    assert select_params == CATALOG.stackable_ids()
+    assert select_params and all(CATALOG.get(item_id).stackable for item_id in select_params)
+    assert delete.startswith('DELETE FROM inventory') and delete_rows == [(7, 101, 40)]
+    assert update_rows == [(9, 40)]
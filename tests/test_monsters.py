@@ -0,0 +1,55 @@
+# Monster data validation: a bad data file must be rejected before the
+# registry swaps it in, so battles keep running on the previous roster.
+import copy
+import json
+import os
+
+import pytest
+
+from monsters import DEFAULT_MONSTERS_PATH, MonsterRegistry, parse_roster
+
+
+@pytest.fixture
+def data():
+    with open(DEFAULT_MONSTERS_PATH) as f:
+        return json.load(f)
+
+
+def first_monster(data):
+    return data['tiers']['easy'][0]
+
+
+def test_bundled_data_is_valid(data):
+    roster = parse_roster(data)
+    assert roster.tier('easy')
+
+
+@pytest.mark.parametrize('field, value', [
+    ('hp', 0),
+    ('attack', -1),
+    ('defense', -1),
+    ('gold_drop', [10, 5]),
+    ('gold_drop', [-1, 5]),
+    ('loot_table', [[99999, 0.5]]),
+    ('loot_table', [[101, 1.5]]),
+    ('loot_table', [[101, -0.1]]),
+])
+def test_invalid_monster_is_rejected(data, field, value):
+    first_monster(data)[field] = value
+    with pytest.raises(ValueError):
+        parse_roster(data)
+
+
+def test_registry_keeps_roster_when_reload_is_invalid(data, tmp_path):
+    path = tmp_path / 'monsters.json'
+    path.write_text(json.dumps(data))
+    registry = MonsterRegistry(path=str(path), interval=0)
+    roster = registry.roster
+
+    broken = copy.deepcopy(data)
+    first_monster(broken)['gold_drop'] = [10, 5]
+    path.write_text(json.dumps(broken))
+    os.utime(path, ns=(roster.version + 10**9, roster.version + 10**9))
+
+    assert registry.reload() is False
+    assert registry.roster is roster
@@ -0,0 +1,86 @@
+# Password pool: a slow hash is reported as "busy" (never an unhandled
+# timeout), its slot is held until bcrypt really finishes, and a busy pool
+# only skips the optional rehash on login.
+import threading
+import time
+
+import bcrypt
+import pytest
+
+import app
+import passwords
+from passwords import PasswordQueueFullError
+
+
+def test_timeout_is_reported_as_busy_and_keeps_the_slot(monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_TIMEOUT', 0.01)
+    release = threading.Event()
+    free_before = passwords._slots._value
+
+    with pytest.raises(PasswordQueueFullError):
+        passwords._run(release.wait)
+    assert passwords._slots._value == free_before - 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while passwords._slots._value != free_before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert passwords._slots._value == free_before
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    def execute(self, statement, params=()):
+        self.statements.append(statement)
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, row):
+        self.cursors = []
+        self.row = row
+
+    def cursor(self, dictionary=False):
+        cursor = FakeCursor(self.row)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def busy(*args, **kwargs):
+    raise PasswordQueueFullError('Password hashing timed out')
+
+
+def test_signup_when_busy_is_503(monkeypatch):
+    monkeypatch.setattr(app, 'hash_password', busy)
+    response = app.app.test_client().post('/api/signup', json={'username': 'u', 'password': 'p'})
+    assert response.status_code == 503
+
+
+def test_login_succeeds_when_rehash_is_busy(monkeypatch):
+    # A hash at a different work factor than BCRYPT_ROUNDS needs a rehash
+    old_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(rounds=4))
+    conn = FakeConnection((5, old_hash))
+    monkeypatch.setattr(app.db_pool, 'get_connection', lambda *args, **kwargs: conn)
+    monkeypatch.setattr(app, 'hash_password', busy)
+
+    response = app.app.test_client().post('/api/login', json={'username': 'u', 'password': 'secret'})
+    assert response.status_code == 200
+    assert response.get_json()['user_id'] == 5
+    assert not any('UPDATE users' in s for cursor in conn.cursors for s in cursor.statements)
@@ -0,0 +1,46 @@
+# Lazy HP regeneration: regen_hp() must heal like the old every-15-minutes
+# job, and writing HP back with its carry must not lose or gain progress.
+import random
+
+from regen import REGEN_INTERVAL, regen_hp
+
+
+def periodic_job(current_hp, max_hp, elapsed, is_alive=True):
+    """HP after the old job added 1 HP to living, hurt knights every REGEN_INTERVAL."""
+    hp = current_hp
+    for _ in range(max(0, elapsed) // REGEN_INTERVAL):
+        if is_alive and hp < max_hp:
+            hp += 1
+    return hp
+
+
+def test_matches_periodic_job():
+    rng = random.Random(11)
+    for _ in range(2000):
+        max_hp = rng.randint(1, 120)
+        current_hp = rng.randint(0, max_hp)
+        elapsed = rng.randint(-REGEN_INTERVAL, 200 * REGEN_INTERVAL)
+        is_alive = rng.random() < 0.9
+        hp, _ = regen_hp(current_hp, max_hp, elapsed, is_alive)
+        assert hp == periodic_job(current_hp, max_hp, elapsed, is_alive), (current_hp, max_hp, elapsed, is_alive)
+
+
+def test_carry_preserves_progress_across_writes():
+    rng = random.Random(12)
+    for _ in range(2000):
+        max_hp = rng.randint(2, 120)
+        current_hp = rng.randint(1, max_hp - 1)
+        first = rng.randint(0, 50 * REGEN_INTERVAL)
+        later = rng.randint(0, 50 * REGEN_INTERVAL)
+
+        # Written back at `first` with its carry, then read `later` seconds on
+        hp, carry = regen_hp(current_hp, max_hp, first)
+        assert 0 <= carry < REGEN_INTERVAL
+        assert regen_hp(hp, max_hp, carry + later) == regen_hp(current_hp, max_hp, first + later)
+
+
+def test_no_carry_at_full_hp_or_when_dead():
+    assert regen_hp(10, 10, REGEN_INTERVAL + 5) == (10, 0)
+    assert regen_hp(9, 10, 3 * REGEN_INTERVAL + 5) == (10, 0)
+    assert regen_hp(0, 10, 5 * REGEN_INTERVAL, is_alive=False) == (0, 0)
+    assert regen_hp(4, 10, None) == (4, 0)
@@ -0,0 +1,93 @@
+# Session tokens: signing, verification and expiry, and POST /api/knights,
+# which hands out a refreshed token and so must only act for the token's user.
+import time
+
+import pytest
+
+import app
+import sessions
+from sessions import InvalidTokenError, issue_token, read_token, refresh_token
+
+
+def test_token_round_trip():
+    session = read_token(issue_token(3, [9, 4, 4]))
+    assert session.user_id == 3
+    assert session.knight_ids == frozenset({4, 9})
+    assert session.expires_at > time.time()
+
+
+def test_tampered_token_is_rejected():
+    payload, signature = issue_token(3, [4]).split('.')
+    forged = issue_token(5, [4]).split('.')[0]
+    with pytest.raises(InvalidTokenError):
+        read_token(f'{forged}.{signature}')
+    with pytest.raises(InvalidTokenError):
+        read_token(payload)
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    token = issue_token(3, [4], ttl=60)
+    monkeypatch.setattr(sessions.time, 'time', lambda: time.time_ns() / 1e9 + 61)
+    with pytest.raises(InvalidTokenError, match='expired'):
+        read_token(token)
+
+
+def test_refresh_token_updates_claims():
+    session = read_token(refresh_token(read_token(issue_token(3, [4, 5])), added=[6], removed=[4]))
+    assert session.user_id == 3
+    assert session.knight_ids == frozenset({5, 6})
+
+
+class FakeCursor:
+    lastrowid = 42
+
+    def execute(self, statement, params=()):
+        pass
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, dictionary=False):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app.db_pool, 'get_connection', lambda *args, **kwargs: FakeConnection())
+    return app.app.test_client()
+
+
+NEW_KNIGHT = {'user_id': 3, 'name': 'Sir Test', 'class': 'knight'}
+
+
+def test_create_knight_requires_session(client):
+    response = client.post('/api/knights', json=NEW_KNIGHT)
+    assert response.status_code == 401
+    assert 'token' not in response.get_json()
+
+
+def test_create_knight_for_another_user_is_refused(client):
+    headers = {'Authorization': f'Bearer {issue_token(7, [8])}'}
+    response = client.post('/api/knights', json=NEW_KNIGHT, headers=headers)
+    assert response.status_code == 403
+    assert 'token' not in response.get_json()
+
+
+def test_create_knight_refreshes_the_callers_token(client):
+    headers = {'Authorization': f'Bearer {issue_token(3, [4])}'}
+    response = client.post('/api/knights', json=NEW_KNIGHT, headers=headers)
+    assert response.status_code == 201
+    session = read_token(response.get_json()['token'])
+    assert session.user_id == 3
+    assert session.knight_ids == frozenset({4, 42})